@@ -4,15 +4,17 @@ from flask import Flask
 from flask_marshmallow import Marshmallow
 from flask_migrate import Migrate
 from flask_restful import Api
-from flask_sqlalchemy import SQLAlchemy
 
 from app.config import Config
+from app.database import SQLAlchemy
+from app.log import init_logging
 
 # create and config app
 app = Flask("app")
 app.config.from_object(Config)
 
 logging.config.dictConfig(app.config.get('LOGGING_CONFIG'))
+init_logging(app)
 
 # set up plugins
 db = SQLAlchemy(app)
@@ -20,16 +22,23 @@ migrate = Migrate(app, db)
 api = Api(app)
 ma = Marshmallow(app)
 
-from .models import Appointment, Patient, Provider, Webhook  # noqa
-from . import routes  # noqa
+from .models import (  # noqa
+    Appointment, AppointmentChange, IdempotencyKey, Patient, Provider, ProviderSchedule,
+    ScheduleException, Webhook, WebhookDelivery, appointment_archive)
+from . import routes, commands  # noqa
 
 # set up flask konch (beefed up flask shell)
 app.config.update({
     'KONCH_CONTEXT': {
         'db': db,
         'Appointment': Appointment,
+        'AppointmentChange': AppointmentChange,
+        'IdempotencyKey': IdempotencyKey,
         'Patient': Patient,
         'Provider': Provider,
+        'ProviderSchedule': ProviderSchedule,
+        'ScheduleException': ScheduleException,
         'Webhook': Webhook,
+        'WebhookDelivery': WebhookDelivery,
     }
 })
@@ -0,0 +1,66 @@
+"""
+Provider Availability
+
+Find free slots in a provider's calendar. Booked appointments for the window
+are loaded with a single range query (backed by the (provider_id, start, end)
+index) into a BookedIntervals index; gaps are then found by bisecting into it.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from app import db, Appointment
+
+
+class BookedIntervals(object):
+    """
+    Sorted [start, end) intervals of a provider's booked appointments
+
+    Appointments for a provider never overlap (the exclusion constraint makes
+    sure of it), so sorting by start also sorts the end times and we can
+    bisect on either
+    """
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def free_slots(self, window_start, window_end, duration):
+        """
+        Return (start, end) gaps inside the window that are at least duration
+        (a timedelta) long
+        """
+        slots = []
+        free_from = window_start
+
+        # first booked appointment that ends after the window starts
+        i = bisect_right(self.ends, window_start)
+        while i < len(self.starts) and self.starts[i] < window_end:
+            if self.starts[i] - free_from >= duration:
+                slots.append((free_from, self.starts[i]))
+            free_from = max(free_from, self.ends[i])
+            i += 1
+
+        if window_end - free_from >= duration:
+            slots.append((free_from, window_end))
+        return slots
+
+
+def load_booked_intervals(provider_ids, window_start, window_end):
+    """
+    Build a BookedIntervals index per provider from one range query
+    """
+    intervals = defaultdict(list)
+    rows = (
+        db.session.query(Appointment.provider_id, Appointment.start, Appointment.end)
+                  .filter(Appointment.provider_id.in_(provider_ids))
+                  .filter(Appointment.start < window_end)
+                  .filter(Appointment.end > window_start))
+    for provider_id, start, end in rows:
+        intervals[provider_id].append((start, end))
+
+    return {provider_id: BookedIntervals(intervals[provider_id])
+            for provider_id in provider_ids}
@@ -0,0 +1,269 @@
+"""
+Item Response Cache
+
+Read-through cache of the JSON bodies of single-item GETs, keyed by resource
+and id and stored with an ETag, so polling clients are answered without
+touching the database and a matching If-None-Match gets a 304.
+
+Entries are invalidated as soon as a transaction that changed the item, or
+one of its appointments, commits. The default backend is an in-process LRU
+bounded by ITEM_CACHE_MAX_SIZE entries and ITEM_CACHE_TTL_IN_SECONDS; set
+ITEM_CACHE_BACKEND to redis (requires the redis package) to share entries
+between processes.
+
+With ITEM_CACHE_LISTEN (the default, unless DATABASE_PGBOUNCER is set) the
+writing transaction queues a Postgres NOTIFY of the items it changed, and
+every process LISTENs for the ones made by the others, so gunicorn workers
+don't serve bodies or 304s for items another worker changed. A listener that
+loses its connection empties the local cache. LISTEN needs a session
+connection, which PgBouncer in transaction pooling mode does not give.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from app import app, Appointment, Patient, Provider
+from app.signals import before_commit, listen, on_commit
+
+logger = logging.getLogger(__name__)
+
+
+##########
+# Backends
+##########
+
+class LocalCache(object):
+    """
+    Thread-safe in-process LRU cache with a time to live
+    """
+    shared = False
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(object):
+    """
+    Cache of bytes shared between processes through Redis
+    """
+    shared = True
+
+    def __init__(self, url, ttl, prefix='item:'):
+        import redis
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.StrictRedis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self.prefix + '*'))
+
+
+############
+# Item Cache
+############
+
+def etag_for(body):
+    """
+    Strong (unquoted) ETag for a response body
+    """
+    return hashlib.sha1(body).hexdigest()
+
+
+NOTIFY_CHANNEL = 'item_cache'
+MAX_NOTIFY_PAYLOAD = 7000  # Postgres allows payloads up to 8000 bytes
+
+
+class ItemCache(object):
+    def __init__(self, backend, listen=False):
+        self.backend = backend
+        self.listen = listen
+        self._listener_pid = None
+
+        # bumped on every invalidation, so a body read from the database
+        # before a concurrent write commits is not cached after it
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(model, item_id):
+        return f'{model.__tablename__}:{item_id}'
+
+    def get(self, model, item_id):
+        """
+        Return the cached (etag, body) of the item, or None
+        """
+        value = self.backend.get(self.key(model, item_id))
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        etag, body = value.split(b' ', 1)
+        return etag.decode(), body
+
+    def read_through(self, model, item_id, load):
+        """
+        Return (etag, body) of the item, calling load() for the body and
+        caching it when it is not cached
+        """
+        if self.listen and self._listener_pid != os.getpid():
+            self._start_listener()
+
+        cached = self.get(model, item_id)
+        if cached is not None:
+            return cached
+
+        generation = self._generation
+        body = load()
+        etag = etag_for(body)
+        if generation == self._generation:
+            self.backend.set(self.key(model, item_id), etag.encode() + b' ' + body)
+        return etag, body
+
+    def invalidate(self, changes):
+        """
+        Drop entries for a list of (model, primary key) changes
+        """
+        self._generation += 1
+        self.backend.delete([self.key(model, item_id) for model, item_id in changes])
+        self.invalidations += len(changes)
+
+    def notify(self, session, changes):
+        """
+        Tell the other processes to drop entries for changes, once the
+        session's transaction commits
+        """
+        keys = [self.key(model, item_id) for model, item_id in changes]
+        payloads, payload = [], str(os.getpid())
+        for key in keys:
+            if len(payload) + len(key) + 1 > MAX_NOTIFY_PAYLOAD:
+                payloads.append(payload)
+                payload = str(os.getpid())
+            payload += ' ' + key
+        payloads.append(payload)
+
+        for payload in payloads:
+            session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                            {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+    def received(self, payload):
+        """
+        Drop the entries in a notification from another process
+        """
+        pid, *keys = payload.split(' ')
+        if int(pid) == os.getpid():
+            return
+
+        self._generation += 1
+        if not self.backend.shared:
+            self.backend.delete(keys)
+        self.invalidations += len(keys)
+
+    def clear(self):
+        self._generation += 1
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self.backend),
+        }
+
+    def _start_listener(self):
+        """
+        Listen for invalidations made by other processes (once per process,
+        as gunicorn forks workers after the app is imported)
+        """
+        self._listener_pid = os.getpid()
+        listen(app.config.get('SQLALCHEMY_DATABASE_URI'), NOTIFY_CHANNEL,
+               received=self.received,
+               connected=self._reconnected)
+
+    def _reconnected(self):
+        # we may have missed invalidations while (re)connecting
+        if not self.backend.shared:
+            self.clear()
+
+
+def _create_backend():
+    ttl = app.config.get('ITEM_CACHE_TTL_IN_SECONDS')
+    if app.config.get('ITEM_CACHE_BACKEND') == 'redis':
+        try:
+            return RedisCache(app.config.get('ITEM_CACHE_URL'), ttl)
+        except ImportError:
+            logger.warning('ITEM_CACHE_BACKEND redis requires redis, using local cache')
+    return LocalCache(app.config.get('ITEM_CACHE_MAX_SIZE'), ttl)
+
+
+item_cache = ItemCache(_create_backend(), listen=app.config.get('ITEM_CACHE_LISTEN'))
+
+
+@before_commit(Appointment, Patient, Provider)
+def _notify_items_changed(session, changes):
+    if item_cache.listen:
+        item_cache.notify(session, changes)
+
+
+@on_commit(Appointment, Patient, Provider)
+def _items_changed(changes):
+    item_cache.invalidate(changes)
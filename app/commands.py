@@ -0,0 +1,29 @@
+"""
+Flask CLI Commands
+"""
+
+import click
+
+from app import app
+from app.dispatcher import Dispatcher
+from app.partitions import maintain_partitions
+
+
+@app.cli.command('dispatch_webhooks')
+def dispatch_webhooks():
+    """
+    Deliver queued webhook notifications until interrupted
+    """
+    Dispatcher().run()
+
+
+@app.cli.command('maintain_partitions')
+def maintain_appointment_partitions():
+    """
+    Create upcoming appointment archive partitions, archive appointments that
+    have left the hot window and detach partitions past retention
+    """
+    result = maintain_partitions()
+    click.echo(f"Created partitions: {', '.join(result['created']) or 'none'}")
+    click.echo(f"Archived appointments: {result['archived']}")
+    click.echo(f"Detached partitions: {', '.join(result['detached']) or 'none'}")
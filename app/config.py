@@ -1,11 +1,42 @@
 import os
 
 
+def _env_bool(name, default):
+    """
+    Flag from the environment: 1, true, yes or on (any case) are true
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return default if value is None else int(value)
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return default if value is None else float(value)
+
+
 class Config(object):
     IN_PRODUCTION = os.getenv('PRODUCTION_VAR234', False)
 
     BOOKING_DELAY_IN_HOURS = os.getenv('BOOKING_DELAY', 24)
     MAX_APPT_LENGTH_IN_MINUTES = os.getenv('MAX_APPOINTMENT_LENGTH', 240)
+    MAX_BULK_APPOINTMENTS = _env_int('MAX_BULK_APPOINTMENTS', 5000)
+    MAX_AVAILABILITY_WINDOW_IN_DAYS = _env_int('MAX_AVAILABILITY_WINDOW', 366)
+
+    # Appointment archive partitions, see app.partitions
+    APPOINTMENT_HOT_MONTHS = _env_int('APPOINTMENT_HOT_MONTHS', 3)
+    APPOINTMENT_PARTITIONS_AHEAD = _env_int('APPOINTMENT_PARTITIONS_AHEAD', 3)
+    APPOINTMENT_ARCHIVE_RETENTION_MONTHS = _env_int('APPOINTMENT_ARCHIVE_RETENTION', 84)
+
+    DEFAULT_PAGE_SIZE = _env_int('DEFAULT_PAGE_SIZE', 100)
+    MAX_PAGE_SIZE = _env_int('MAX_PAGE_SIZE', 1000)
+    EXPORT_CHUNK_SIZE = _env_int('EXPORT_CHUNK_SIZE', 1000)
 
     BASE_URL = ''
 
@@ -15,8 +46,73 @@ class Config(object):
         'DATABASE_URL', 'postgresql://sivpack:sivpack_dev@db:5432/sivdev')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Database connections (per process), see app.database
+    DATABASE_POOL_SIZE = _env_int('DATABASE_POOL_SIZE', 5)
+    DATABASE_MAX_OVERFLOW = _env_int('DATABASE_MAX_OVERFLOW', 10)
+    DATABASE_POOL_TIMEOUT_IN_SECONDS = _env_int('DATABASE_POOL_TIMEOUT', 30)
+    DATABASE_POOL_RECYCLE_IN_SECONDS = _env_int('DATABASE_POOL_RECYCLE', 1800)
+    DATABASE_POOL_PRE_PING = _env_bool('DATABASE_POOL_PRE_PING', False)
+    DATABASE_PGBOUNCER = _env_bool('DATABASE_PGBOUNCER', False)  # transaction pooling
+    DATABASE_STATEMENT_TIMEOUT_IN_MS = _env_int('DATABASE_STATEMENT_TIMEOUT', 30000)
+    EXPORT_STATEMENT_TIMEOUT_IN_MS = _env_int('EXPORT_STATEMENT_TIMEOUT', 0)  # no limit
+
+    # Read replicas for GET requests (comma separated URLs), see app.database
+    DATABASE_REPLICA_URLS = [
+        url for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+    SQLALCHEMY_BINDS = {f'replica_{i}': url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+    DATABASE_REPLICA_STICKY_IN_SECONDS = _env_int('DATABASE_REPLICA_STICKY', 5)
+
+    # Request metrics and profiling, see app.metrics
+    SERVER_TIMING_HEADER = _env_bool('SERVER_TIMING_HEADER', not IN_PRODUCTION)
+    PROFILER_ENABLED = _env_bool('PROFILER_ENABLED', False)
+    PROFILER_INTERVAL_IN_MS = _env_float('PROFILER_INTERVAL', 5)
+    PROFILER_SLOWEST_REQUESTS = _env_int('PROFILER_SLOWEST_REQUESTS', 10)
+
     KONCH_SHELL = 'ipy'
 
+    # Single item GET response cache
+    ITEM_CACHE_BACKEND = os.getenv('ITEM_CACHE_BACKEND', 'local')  # local or redis
+    ITEM_CACHE_URL = os.getenv('ITEM_CACHE_URL', 'redis://redis:6379/0')
+    ITEM_CACHE_MAX_SIZE = _env_int('ITEM_CACHE_MAX_SIZE', 10000)  # entries per process
+    ITEM_CACHE_TTL_IN_SECONDS = _env_int('ITEM_CACHE_TTL', 300)
+    # invalidations from other processes, LISTEN does not work through PgBouncer
+    ITEM_CACHE_LISTEN = _env_bool('ITEM_CACHE_LISTEN', not DATABASE_PGBOUNCER)
+
+    # Idempotency-Key responses, see app.idempotency
+    IDEMPOTENCY_KEY_TTL_IN_SECONDS = _env_int('IDEMPOTENCY_KEY_TTL', 86400)
+    IDEMPOTENCY_CACHE_MAX_SIZE = _env_int('IDEMPOTENCY_CACHE_MAX_SIZE', 10000)  # per process
+    IDEMPOTENCY_SWEEP_INTERVAL_IN_SECONDS = _env_int('IDEMPOTENCY_SWEEP_INTERVAL', 3600)
+
+    # Provider office hours cache
+    SCHEDULE_CACHE_TTL_IN_SECONDS = _env_int('SCHEDULE_CACHE_TTL', 300)
+    # providers without a weekly schedule can be booked at any time
+    OPEN_WITHOUT_OFFICE_HOURS = _env_bool('OPEN_WITHOUT_OFFICE_HOURS', True)
+
+    # Webhook subscriber registry
+    WEBHOOK_REGISTRY_TTL_IN_SECONDS = _env_int('WEBHOOK_REGISTRY_TTL', 300)
+    WEBHOOK_REGISTRY_LISTEN = _env_bool('WEBHOOK_REGISTRY_LISTEN', False)
+
+    # Webhook dispatcher
+    WEBHOOK_DISPATCHER_WORKERS = _env_int('WEBHOOK_DISPATCHER_WORKERS', 8)
+    WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT = _env_int('WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT', 2)
+    WEBHOOK_POLL_INTERVAL_IN_SECONDS = _env_float('WEBHOOK_POLL_INTERVAL', 1)
+    WEBHOOK_LEASE_IN_SECONDS = _env_int('WEBHOOK_LEASE', 300)
+    WEBHOOK_MAX_ATTEMPTS = _env_int('WEBHOOK_MAX_ATTEMPTS', 8)
+    WEBHOOK_RETRY_BACKOFF_IN_SECONDS = _env_int('WEBHOOK_RETRY_BACKOFF', 5)
+    WEBHOOK_MAX_RETRY_BACKOFF_IN_SECONDS = _env_int('WEBHOOK_MAX_RETRY_BACKOFF', 3600)
+
+    # Webhook HTTP client
+    WEBHOOK_POOL_CONNECTIONS = _env_int('WEBHOOK_POOL_CONNECTIONS', 100)  # hosts
+    WEBHOOK_POOL_MAXSIZE_PER_HOST = _env_int('WEBHOOK_POOL_MAXSIZE_PER_HOST', 10)
+    WEBHOOK_CONNECT_TIMEOUT_IN_SECONDS = _env_float('WEBHOOK_CONNECT_TIMEOUT', 3.05)
+    WEBHOOK_READ_TIMEOUT_IN_SECONDS = _env_float('WEBHOOK_READ_TIMEOUT', 10)
+    WEBHOOK_HTTP2 = _env_bool('WEBHOOK_HTTP2', False)
+
+    # Logging, see app.log
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO' if IN_PRODUCTION else 'DEBUG')
+    STRUCTURED_LOGGING = _env_bool('STRUCTURED_LOGGING', False)  # JSON, off the request thread
+    ACCESS_LOG = _env_bool('ACCESS_LOG', False)
+
     LOGGING_CONFIG = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -33,7 +129,8 @@ class Config(object):
         },
         'loggers': {
             'app': {
-                'level': 'INFO' if IN_PRODUCTION else 'DEBUG',
+                'handlers': ['local'],
+                'level': LOG_LEVEL,
             }
         },
     }
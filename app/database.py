@@ -0,0 +1,248 @@
+"""
+Database Engine Configuration
+
+Flask-SQLAlchemy with the engine options we need from Config: connection
+pool sizing, pre-ping and recycle, a default statement_timeout, and a
+PgBouncer (transaction pooling) mode. Pool checkouts are timed so /stats can
+show how long requests wait for a connection.
+
+Read replicas are SQLALCHEMY_BINDS named replica_*, one per URL in
+DATABASE_REPLICA_URLS. Each GET (or HEAD) request picks one of them, and the
+session sends its reads there; everything else uses the primary:
+
+* requests with any other method, and anything outside a request
+* writes and flushes, and every statement after them in the same request
+* requests from a client that made a successful write in the last
+  DATABASE_REPLICA_STICKY_IN_SECONDS, told apart by a cookie, so clients
+  read their own writes while the replicas catch up
+* blocks wrapped in `with db.using_primary()`, e.g. reads that fill caches
+  other requests are served from
+
+A replica can be any database with the same schema, e.g. another database
+on the development server, so routing can be tried locally.
+
+Behind PgBouncer in transaction pooling mode a server connection is only
+ours for the length of a transaction, so:
+
+* connections are not pooled in the app (NullPool), PgBouncer pools them
+* nothing is set at the session level: statement_timeout is applied with
+  SET LOCAL at the start of every transaction instead of as a connection
+  option, which PgBouncer would reject
+* psycopg2 never uses server-side prepared statements, so there is nothing
+  else to turn off; LISTEN (WEBHOOK_REGISTRY_LISTEN) needs a direct or
+  session pooled connection
+"""
+
+from contextlib import contextmanager
+import random
+import threading
+import time
+
+from flask import g, has_request_context, request
+import flask_sqlalchemy
+from sqlalchemy import event, exc, orm, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+REPLICA_BIND_PREFIX = 'replica'
+STICKY_COOKIE = 'primary_until'
+
+
+class PoolWaitStats(object):
+    """
+    How long connection checkouts waited for the pool, including the time to
+    open new connections
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self.timeouts += timed_out
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'mean_wait_ms': 1000 * self.total_wait / self.checkouts if self.checkouts else 0,
+                'max_wait_ms': 1000 * self.max_wait,
+            }
+
+
+pool_wait = PoolWaitStats()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits in pool_wait
+    """
+    def _do_get(self):
+        begin = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_wait.record(time.perf_counter() - begin, timed_out=True)
+            raise
+        pool_wait.record(time.perf_counter() - begin)
+        return connection
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """
+    Session that reads from the request's replica, when it has one
+    """
+    def get_bind(self, mapper=None, clause=None):
+        replica = _request_replica()
+        if replica is not None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                # read your own writes for the rest of the request
+                g.database_replica = None
+            else:
+                return flask_sqlalchemy.get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+def _request_replica():
+    """
+    Bind key of the replica the current request reads from, or None
+    """
+    if not has_request_context():
+        return None
+    return g.get('database_replica')
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    def init_app(self, app):
+        super().init_app(app)
+        app.before_request(self._route_request)
+        app.after_request(self._stick_to_primary)
+
+        # in PgBouncer mode, apply the default statement_timeout to every
+        # transaction the session starts
+        statement_timeout = app.config.get('DATABASE_STATEMENT_TIMEOUT_IN_MS')
+        if app.config.get('DATABASE_PGBOUNCER') and statement_timeout:
+            @event.listens_for(Session, 'after_begin')
+            def _set_transaction_statement_timeout(session, transaction, connection):
+                set_statement_timeout(connection, statement_timeout)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        result = super().apply_driver_hacks(app, info, options)
+        if not info.drivername.startswith('postgresql'):
+            return result
+
+        statement_timeout = app.config.get('DATABASE_STATEMENT_TIMEOUT_IN_MS')
+        if app.config.get('DATABASE_PGBOUNCER'):
+            for pool_option in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+                options.pop(pool_option, None)
+            options['poolclass'] = NullPool
+        else:
+            options.update({
+                'poolclass': TimedQueuePool,
+                'pool_size': app.config.get('DATABASE_POOL_SIZE'),
+                'max_overflow': app.config.get('DATABASE_MAX_OVERFLOW'),
+                'pool_timeout': app.config.get('DATABASE_POOL_TIMEOUT_IN_SECONDS'),
+                'pool_recycle': app.config.get('DATABASE_POOL_RECYCLE_IN_SECONDS'),
+                'pool_pre_ping': app.config.get('DATABASE_POOL_PRE_PING'),
+            })
+            if statement_timeout:
+                connect_args = options.setdefault('connect_args', {})
+                connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+        return result
+
+    @staticmethod
+    def replica_binds(app):
+        return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                      if key.startswith(REPLICA_BIND_PREFIX))
+
+    def _route_request(self):
+        """
+        Pick the replica this request reads from, None for the primary
+        """
+        app = self.get_app()
+        replicas = self.replica_binds(app)
+        g.database_replica = None
+        if not replicas or request.method not in READ_METHODS:
+            return
+
+        try:
+            primary_until = float(request.cookies.get(STICKY_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        if primary_until > time.time():
+            return
+
+        g.database_replica = random.choice(replicas)
+
+    def _stick_to_primary(self, response):
+        """
+        Send the client's reads to the primary for a while after it writes
+        """
+        app = self.get_app()
+        sticky_seconds = app.config.get('DATABASE_REPLICA_STICKY_IN_SECONDS')
+        if (self.replica_binds(app) and sticky_seconds and
+                request.method not in READ_METHODS and response.status_code < 400):
+            response.set_cookie(STICKY_COOKIE, str(time.time() + sticky_seconds),
+                                max_age=sticky_seconds, httponly=True)
+        return response
+
+    @contextmanager
+    def using_primary(self):
+        """
+        Read from the primary inside the block, even in a replica request
+        """
+        replica = _request_replica()
+        if replica is None:
+            yield
+            return
+
+        g.database_replica = None
+        try:
+            yield
+        finally:
+            g.database_replica = replica
+
+    def get_read_engine(self):
+        """
+        Engine the current request reads from, for Core connections
+        """
+        replica = _request_replica()
+        if replica is None:
+            return self.engine
+        return self.get_engine(bind=replica)
+
+    def pool_stats(self):
+        """
+        Pool usage of this process's engine
+        """
+        pool = self.engine.pool
+        if not isinstance(pool, QueuePool):
+            return {'pool': type(pool).__name__}
+
+        return {
+            'pool': type(pool).__name__,
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            **pool_wait.stats(),
+        }
+
+
+def set_statement_timeout(connection, milliseconds):
+    """
+    Override statement_timeout until the end of the connection's current
+    transaction, e.g. for a long running export; 0 turns it off
+    """
+    connection.execute(text(f'SET LOCAL statement_timeout = {int(milliseconds)}'))
@@ -0,0 +1,183 @@
+"""
+Webhook Dispatcher
+
+Delivers notifications queued in the webhook_delivery outbox. Runs as its own
+process (`flask dispatch_webhooks`) so subscriber latency never shows up in
+API requests.
+
+Deliveries are claimed in batches with a lease (FOR UPDATE SKIP LOCKED), so
+several dispatchers can run side by side and a crashed dispatcher's claims are
+retried once the lease runs out. Failed deliveries are retried with
+exponential backoff until WEBHOOK_MAX_ATTEMPTS, then moved to the dead state.
+"""
+
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import time
+
+from sqlalchemy import and_
+
+from app import app, db, http_client, Webhook, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+
+def deliver(endpoint_url, payload):
+    """
+    Send notification to subscriber over the shared connection pool, raising
+    DeliveryError if it was not accepted
+    """
+    return http_client.post(endpoint_url, data=json.loads(payload))
+
+
+class Dispatcher(object):
+    def __init__(self, max_workers=None, max_concurrency_per_endpoint=None):
+        self.max_workers = max_workers or app.config.get('WEBHOOK_DISPATCHER_WORKERS')
+        self.max_concurrency_per_endpoint = (
+            max_concurrency_per_endpoint or
+            app.config.get('WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT'))
+        self.lease = timedelta(seconds=app.config.get('WEBHOOK_LEASE_IN_SECONDS'))
+        self.max_attempts = app.config.get('WEBHOOK_MAX_ATTEMPTS')
+        self.backoff = app.config.get('WEBHOOK_RETRY_BACKOFF_IN_SECONDS')
+        self.max_backoff = app.config.get('WEBHOOK_MAX_RETRY_BACKOFF_IN_SECONDS')
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.in_flight = {}  # future -> claimed delivery
+        self.in_flight_per_endpoint = Counter()
+        self.waiting = deque()  # claimed deliveries for busy endpoints
+
+    def claim(self, limit):
+        """
+        Lease up to limit deliveries that are due
+
+        Leased deliveries stay pending, but are not due again until the lease
+        runs out. Deliveries to deactivated webhooks wait until the webhook is
+        active again
+        """
+        now = datetime.utcnow()
+        due_deliveries = (
+            db.session.query(WebhookDelivery.id)
+                      .join(Webhook, Webhook.id == WebhookDelivery.webhook_id)
+                      .filter(Webhook.active.is_(True))
+                      .filter(WebhookDelivery.status == WebhookDelivery.PENDING)
+                      .filter(WebhookDelivery.next_attempt_at <= now)
+                      .order_by(WebhookDelivery.next_attempt_at)
+                      .limit(limit)
+                      .with_for_update(skip_locked=True, of=WebhookDelivery))
+
+        delivery_table = WebhookDelivery.__table__
+        claim_deliveries = (
+            delivery_table.update()
+                          .where(and_(delivery_table.c.id.in_(due_deliveries.subquery()),
+                                      delivery_table.c.webhook_id == Webhook.id))
+                          .values(next_attempt_at=now + self.lease,
+                                  attempts=delivery_table.c.attempts + 1)
+                          .returning(delivery_table.c.id,
+                                     delivery_table.c.webhook_id,
+                                     delivery_table.c.payload,
+                                     delivery_table.c.attempts,
+                                     Webhook.endpoint_url))
+        claimed = db.session.execute(claim_deliveries).fetchall()
+        db.session.commit()
+        return claimed
+
+    def submit_ready(self):
+        """
+        Hand waiting deliveries to the worker pool, respecting the
+        per-endpoint concurrency limit
+        """
+        still_waiting = deque()
+        while self.waiting and len(self.in_flight) < self.max_workers:
+            delivery = self.waiting.popleft()
+            endpoint = delivery.endpoint_url
+            if self.in_flight_per_endpoint[endpoint] >= self.max_concurrency_per_endpoint:
+                still_waiting.append(delivery)
+                continue
+
+            future = self.executor.submit(deliver, endpoint, delivery.payload)
+            self.in_flight[future] = delivery
+            self.in_flight_per_endpoint[endpoint] += 1
+        self.waiting.extendleft(reversed(still_waiting))
+
+    def collect_finished(self):
+        """
+        Record the outcome of finished deliveries
+        """
+        finished = [future for future in self.in_flight if future.done()]
+        for future in finished:
+            delivery = self.in_flight.pop(future)
+            self.in_flight_per_endpoint[delivery.endpoint_url] -= 1
+
+            try:
+                status_code = future.result()
+            except http_client.DeliveryError as e:
+                logger.warning('delivery %s to %s failed: %s',
+                               delivery.id, delivery.webhook_id, e)
+                values = self.retry(delivery, str(e))
+            except Exception as e:
+                # a bug in delivery must not take the dispatcher down
+                logger.exception('delivery %s to %s failed', delivery.id, delivery.webhook_id)
+                values = self.retry(delivery, repr(e))
+            else:
+                logger.info('%s for %s', status_code, delivery.webhook_id)
+                values = {'status': WebhookDelivery.DELIVERED, 'last_error': None}
+
+            values['updated'] = datetime.utcnow()
+            db.session.execute(
+                WebhookDelivery.__table__.update()
+                                         .where(WebhookDelivery.__table__.c.id == delivery.id)
+                                         .values(**values))
+        if finished:
+            db.session.commit()
+        return len(finished)
+
+    def retry(self, delivery, error):
+        """
+        Values that schedule the next attempt of a failed delivery with
+        exponential backoff, or move it to the dead state after max_attempts
+        """
+        values = {'last_error': error[:280]}
+        if delivery.attempts >= self.max_attempts:
+            values['status'] = WebhookDelivery.DEAD
+        else:
+            backoff = min(self.backoff * 2 ** (delivery.attempts - 1), self.max_backoff)
+            values['next_attempt_at'] = datetime.utcnow() + timedelta(seconds=backoff)
+        return values
+
+    def run_once(self):
+        """
+        Single pass of the dispatch loop; returns how much work was done
+        """
+        work_done = self.collect_finished()
+
+        capacity = self.max_workers - len(self.in_flight) - len(self.waiting)
+        if capacity > 0:
+            claimed = self.claim(capacity)
+            self.waiting.extend(claimed)
+            work_done += len(claimed)
+
+        self.submit_ready()
+        return work_done
+
+    def drain(self):
+        """
+        Dispatch until there is nothing left to deliver or in flight
+        """
+        while self.run_once() or self.in_flight or self.waiting:
+            time.sleep(0.01)
+
+    def run(self):
+        poll_interval = app.config.get('WEBHOOK_POLL_INTERVAL_IN_SECONDS')
+        logger.info('dispatching webhooks with %s workers', self.max_workers)
+        try:
+            while True:
+                if not self.run_once() and not self.in_flight:
+                    time.sleep(poll_interval)
+                else:
+                    time.sleep(0.01)
+        finally:
+            self.executor.shutdown(wait=True)
+            self.collect_finished()
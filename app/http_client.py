@@ -0,0 +1,103 @@
+"""
+Shared HTTP Client for Webhook Delivery
+
+One connection-pooled, keep-alive client per process, so deliveries to the
+same subscriber reuse TCP (and TLS) connections instead of opening a new one
+per notification. Uses requests by default; when WEBHOOK_HTTP2 is set and
+httpx (with the http2 extra) is installed, requests to the same host are
+multiplexed over HTTP/2.
+"""
+
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class DeliveryError(Exception):
+    """
+    Notification could not be delivered (connection failed, timed out, or the
+    subscriber did not answer with a 2xx)
+    """
+
+
+def _create_requests_session():
+    adapter = HTTPAdapter(
+        pool_connections=app.config.get('WEBHOOK_POOL_CONNECTIONS'),
+        pool_maxsize=app.config.get('WEBHOOK_POOL_MAXSIZE_PER_HOST'))
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _create_httpx_client():
+    import httpx
+
+    pool_maxsize = app.config.get('WEBHOOK_POOL_MAXSIZE_PER_HOST')
+    limits = httpx.Limits(
+        max_connections=pool_maxsize * app.config.get('WEBHOOK_POOL_CONNECTIONS'),
+        max_keepalive_connections=pool_maxsize)
+    return httpx.Client(http2=True, limits=limits)
+
+
+def get_client():
+    """
+    Return this process's HTTP client, creating it on first use
+
+    The client is recreated after a fork so processes never share sockets
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = None
+            if app.config.get('WEBHOOK_HTTP2'):
+                try:
+                    _client = _create_httpx_client()
+                except ImportError:
+                    logger.warning('WEBHOOK_HTTP2 requires httpx[http2], using HTTP/1.1')
+            if _client is None:
+                _client = _create_requests_session()
+            _client_pid = pid
+    return _client
+
+
+def post(url, data):
+    """
+    POST form data to url using the shared client; returns the status code
+    """
+    client = get_client()
+    timeout = (app.config.get('WEBHOOK_CONNECT_TIMEOUT_IN_SECONDS'),
+               app.config.get('WEBHOOK_READ_TIMEOUT_IN_SECONDS'))
+
+    if isinstance(client, requests.Session):
+        try:
+            r = client.post(url, data=data, timeout=timeout)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            raise DeliveryError(str(e)) from e
+        return r.status_code
+
+    import httpx
+    try:
+        r = client.post(url, data=data,
+                        timeout=httpx.Timeout(timeout[1], connect=timeout[0]))
+        r.raise_for_status()
+    except httpx.HTTPError as e:
+        raise DeliveryError(str(e)) from e
+    return r.status_code
@@ -0,0 +1,230 @@
+"""
+Idempotency Keys
+
+Clients that retry writes send the same Idempotency-Key header with every
+attempt. The first request with a key claims it in the idempotency_key table
+and runs; its response is stored and replayed, with an Idempotent-Replayed
+header, to every retry, which never reaches validation or the database
+beyond one lookup. Completed responses are also kept in an in-process LRU,
+so retries that land on the same worker skip the lookup too.
+
+A retry that arrives while the first request is still running gets a 409,
+and a key sent with a different request (method, path or body) a 422.
+Server errors are not stored, so those requests can be retried.
+
+Keys expire after IDEMPOTENCY_KEY_TTL_IN_SECONDS; each process deletes
+expired keys every IDEMPOTENCY_SWEEP_INTERVAL_IN_SECONDS from a background
+thread.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from flask import abort, request, Response
+from sqlalchemy.dialects.postgresql import insert
+from werkzeug.exceptions import HTTPException
+
+from app import app, db, IdempotencyKey
+from app.cache import LocalCache
+from app.utils import create_response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+KEY_TOO_LONG_ERROR = f'{IDEMPOTENCY_KEY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+KEY_IN_PROGRESS_ERROR = f'A request with this {IDEMPOTENCY_KEY_HEADER} is in progress'
+KEY_REUSED_ERROR = f'{IDEMPOTENCY_KEY_HEADER} was already used for a different request'
+
+StoredResponse = namedtuple('StoredResponse', 'request_hash status_code location body')
+
+
+class IdempotencyStore(object):
+    def __init__(self, ttl, max_cached, sweep_interval):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._responses = LocalCache(max_cached, ttl)  # key -> completed StoredResponse
+        self._sweeper_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.swept = 0
+
+    def claim(self, key, request_hash):
+        """
+        Claim key for a request; returns None when it was claimed, or the
+        StoredResponse of the request that claimed it first (status_code is
+        None while that one is running)
+        """
+        if self._sweeper_pid != os.getpid():
+            self._start_sweeper()
+
+        stored = self._responses.get(key)
+        if stored is not None:
+            self.hits += 1
+            return stored
+        self.misses += 1
+
+        table = IdempotencyKey.__table__
+        while True:
+            claimed = db.session.execute(
+                insert(table).values(key=key, request_hash=request_hash,
+                                     created=datetime.utcnow())
+                             .on_conflict_do_nothing()
+                             .returning(table.c.key)).first()
+            db.session.commit()
+            if claimed is not None:
+                return None
+
+            row = db.session.execute(
+                table.select().where(table.c.key == key)).first()
+            if row is None:
+                continue  # swept in the meantime, claim it again
+            if row.created < datetime.utcnow() - timedelta(seconds=self.ttl):
+                # expired, but not swept yet
+                db.session.execute(table.delete().where(table.c.key == key)
+                                                 .where(table.c.created == row.created))
+                db.session.commit()
+                continue
+
+            stored = StoredResponse(row.request_hash, row.status_code, row.location, row.body)
+            if stored.status_code is not None:
+                self._responses.set(key, stored)
+            return stored
+
+    def complete(self, key, request_hash, response):
+        """
+        Store the response to the request that claimed key
+        """
+        stored = StoredResponse(request_hash, response.status_code,
+                                response.headers.get('Location'), response.get_data())
+        table = IdempotencyKey.__table__
+        db.session.rollback()
+        db.session.execute(table.update().where(table.c.key == key).values(
+            status_code=stored.status_code, location=stored.location, body=stored.body))
+        db.session.commit()
+        self._responses.set(key, stored)
+
+    def release(self, key):
+        """
+        Give up the claim on key, so the request can be retried
+        """
+        table = IdempotencyKey.__table__
+        db.session.rollback()
+        db.session.execute(table.delete().where(table.c.key == key)
+                                         .where(table.c.status_code == None))  # noqa
+        db.session.commit()
+
+    def sweep(self, now=None):
+        """
+        Delete expired keys; returns how many were deleted
+        """
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=self.ttl)
+        table = IdempotencyKey.__table__
+        result = db.session.execute(table.delete().where(table.c.created < cutoff))
+        db.session.commit()
+        self.swept += result.rowcount
+        return result.rowcount
+
+    def clear(self):
+        self._responses.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'swept': self.swept,
+            'size': len(self._responses),
+        }
+
+    def _start_sweeper(self):
+        """
+        Sweep expired keys in the background (once per process, as gunicorn
+        forks workers after the app is imported)
+        """
+        self._sweeper_pid = os.getpid()
+        sweeper = threading.Thread(target=self._sweep_periodically, daemon=True)
+        sweeper.start()
+
+    def _sweep_periodically(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            with app.app_context():
+                try:
+                    swept = self.sweep()
+                    logger.debug('swept %s idempotency keys', swept)
+                except Exception:
+                    logger.exception('idempotency key sweep failed')
+                finally:
+                    db.session.remove()
+
+
+idempotency_store = IdempotencyStore(
+    ttl=app.config.get('IDEMPOTENCY_KEY_TTL_IN_SECONDS'),
+    max_cached=app.config.get('IDEMPOTENCY_CACHE_MAX_SIZE'),
+    sweep_interval=app.config.get('IDEMPOTENCY_SWEEP_INTERVAL_IN_SECONDS'))
+
+
+def _replay(stored):
+    headers = {REPLAYED_HEADER: 'true'}
+    if stored.location is not None:
+        headers['Location'] = stored.location
+    return Response(response=stored.body, status=stored.status_code, headers=headers,
+                    content_type='application/json')
+
+
+def idempotent(view):
+    """
+    Replay the stored response to requests with an Idempotency-Key that was
+    already used, instead of calling the view
+
+    Goes above use_args, so retries are not even parsed again
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            abort(create_response(status_code=400, error=KEY_TOO_LONG_ERROR))
+
+        fingerprint = hashlib.sha1()
+        fingerprint.update(f'{request.method} {request.path}\n'.encode())
+        fingerprint.update(request.get_data())
+        request_hash = fingerprint.hexdigest()
+
+        stored = idempotency_store.claim(key, request_hash)
+        if stored is not None:
+            if stored.request_hash != request_hash:
+                abort(create_response(status_code=422, error=KEY_REUSED_ERROR))
+            if stored.status_code is None:
+                abort(create_response(status_code=409, error=KEY_IN_PROGRESS_ERROR))
+            return _replay(stored)
+
+        try:
+            response = view(*args, **kwargs)
+        except HTTPException as e:
+            # errors raised with abort(create_response(...)) are results too
+            if e.response is not None and e.response.status_code < 500:
+                idempotency_store.complete(key, request_hash, e.response)
+            else:
+                idempotency_store.release(key)
+            raise
+        except Exception:
+            idempotency_store.release(key)
+            raise
+
+        if isinstance(response, Response) and response.status_code < 500:
+            idempotency_store.complete(key, request_hash, response)
+        else:
+            idempotency_store.release(key)
+        return response
+    return wrapper
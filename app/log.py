@@ -0,0 +1,135 @@
+"""
+Structured Logging
+
+With STRUCTURED_LOGGING set, the handlers in LOGGING_CONFIG write one JSON
+object per record, with the request ID, method and path of the request that
+logged it and any `extra` fields, e.g.
+
+    logger.info('delivered %s', delivery_id, extra={'status': 200})
+
+Records are not formatted or written by the thread that logs them: the
+logger's handlers are moved behind a QueueHandler, and a QueueListener
+thread formats and writes them. The logging thread only interpolates the
+message, so its arguments can't change after the call.
+
+Every request gets an ID, from its X-Request-ID header when there is one,
+which is sent back in the response's X-Request-ID header, and with
+ACCESS_LOG one app.access record with its status and timings.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+# attributes of every LogRecord, anything else was passed in extra
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Add the request ID, method and path of the current request to records
+    """
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for a listener in the same process: records are queued as
+    they are, not formatted and made picklable first
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def queue_handlers(logger, handlers):
+    """
+    Move handlers behind a queue; returns the started QueueListener
+    """
+    log_queue = queue.Queue()
+    queue_handler = LocalQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def configure_structured_logging(logger_name):
+    """
+    Log JSON from a background thread through the logger's handlers
+    """
+    logger = logging.getLogger(logger_name)
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        handler.setFormatter(JsonFormatter())
+    listener = queue_handlers(logger, handlers)
+    # write out what is queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
+##########
+# Requests
+##########
+
+access_logger = logging.getLogger('app.access')
+
+
+def init_logging(app):
+    if app.config.get('STRUCTURED_LOGGING'):
+        configure_structured_logging('app')
+
+    @app.before_request
+    def _set_request_id():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_logged_at = time.perf_counter()
+
+    @app.after_request
+    def _log_request(response):
+        if 'request_id' not in g:
+            return response
+
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        if app.config.get('ACCESS_LOG') and access_logger.isEnabledFor(logging.INFO):
+            access_logger.info('%s %s %s', request.method, request.path, response.status_code,
+                               extra={
+                                   'status': response.status_code,
+                                   'duration_ms': round(
+                                       (time.perf_counter() - g.request_logged_at) * 1000, 3),
+                                   'sql_queries': g.get('sql_queries'),
+                                   'sql_ms': round(g.get('sql_seconds', 0) * 1000, 3),
+                               })
+        return response
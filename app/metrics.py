@@ -0,0 +1,189 @@
+"""
+Request Metrics
+
+Per request, times the request, the SQL statements it sends and the spans of
+work wrapped in `with span('name')`. The totals go to latency histograms per
+route and method that /metrics serves in the Prometheus text format, and,
+with SERVER_TIMING_HEADER, to a Server-Timing response header that browser
+dev tools show next to the request.
+
+Metrics are kept per process, so with several gunicorn workers each one
+reports its own. Streamed responses (the export) are timed until the
+response starts, not until the last row is sent.
+
+Setting PROFILER_ENABLED also samples the stacks of requests (see
+app.profiler); /debug/profile serves those of the slowest ones.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+from app.profiler import SamplingProfiler
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+############
+# Histograms
+############
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram(object):
+    """
+    Thread-safe Prometheus histogram
+    """
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _labels(self.label_names, label_values, le=bound)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {counts[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time to handle requests',
+    ('route', 'method', 'status'))
+request_queries = Histogram(
+    'http_request_sql_queries', 'SQL statements sent per request',
+    ('route', 'method'), QUERY_COUNT_BUCKETS)
+request_sql_duration = Histogram(
+    'http_request_sql_duration_seconds', 'Time spent in SQL statements per request',
+    ('route', 'method'))
+span_duration = Histogram(
+    'app_span_duration_seconds', 'Time spent in spans of request handling', ('span',))
+
+histograms = [request_duration, request_queries, request_sql_duration, span_duration]
+
+
+def render_metrics():
+    """
+    All metrics in the Prometheus text exposition format
+    """
+    return '\n'.join(line for histogram in histograms for line in histogram.render()) + '\n'
+
+
+#######
+# Spans
+#######
+
+@contextmanager
+def span(name):
+    """
+    Time the block as a span of the current request
+    """
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - begin
+        span_duration.observe(seconds, name)
+        if has_request_context() and 'spans' in g:
+            g.spans.append((name, seconds))
+
+
+#####
+# SQL
+#####
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_seconds += seconds
+
+
+##########
+# Requests
+##########
+
+profiler = None
+if app.config.get('PROFILER_ENABLED'):
+    profiler = SamplingProfiler(
+        interval=app.config.get('PROFILER_INTERVAL_IN_MS') / 1000,
+        slowest=app.config.get('PROFILER_SLOWEST_REQUESTS'))
+    profiler.start()
+
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+    g.spans = []
+    if profiler is not None:
+        profiler.begin_request()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+
+    seconds = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_duration.observe(seconds, route, request.method, str(response.status_code))
+    request_queries.observe(g.sql_queries, route, request.method)
+    request_sql_duration.observe(g.sql_seconds, route, request.method)
+
+    if profiler is not None:
+        profiler.end_request(f'{request.method} {request.full_path.rstrip("?")}', seconds)
+
+    if app.config.get('SERVER_TIMING_HEADER'):
+        timings = [f'app;dur={seconds * 1000:.1f}',
+                   f'sql;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_queries} queries"']
+        timings.extend(f'{name};dur={span_seconds * 1000:.1f}'
+                       for name, span_seconds in g.spans)
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
@@ -43,16 +43,89 @@ class Appointment(TimestampMixin, db.Model):
     department = db.Column(db.String(50), nullable=False)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     provider_id = db.Column(db.Integer, db.ForeignKey('provider.id'), nullable=False)
+    # bumped on every ORM update; an UPDATE that finds a different version
+    # raises StaleDataError instead of overwriting a concurrent write
+    version = db.Column(db.Integer, nullable=False, server_default='1')
 
     # Relationships
     patient = db.relationship('Patient', back_populates='appointments')
     provider = db.relationship('Provider', back_populates='appointments')
 
+    # Indexes
+    # Overlapping appointments for a provider are rejected by the
+    # appointment_provider_id_period_excl exclusion constraint, which is
+    # managed in migrations as it is built on a tsrange(start, end) expression
+    __table_args__ = (
+        # conflict detection looks up a provider's appointments by time range
+        db.Index('ix_appointment_provider_id_start_end', 'provider_id', 'start', 'end'),
+        # keyset pagination of GET /v1/appointments
+        db.Index('ix_appointment_start_id', 'start', 'id'),
+        # GET /v1/appointments filtered by patient or department
+        db.Index('ix_appointment_patient_id_start_id', 'patient_id', 'start', 'id'),
+        db.Index('ix_appointment_department_start_id', 'department', 'start', 'id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
     def __repr__(self):
         return (f'<Appointment {self.patient} with ',
                 f'{self.provider} @ {self.start}>')
 
 
+# Appointments that started before the hot window (APPOINTMENT_HOT_MONTHS)
+# are moved here by `flask maintain_partitions`. The table is range
+# partitioned by month on start, with partitions and their indexes managed by
+# app.partitions; Postgres 10 partitioned tables cannot have primary keys,
+# foreign keys or exclusion constraints, which is why live appointments stay
+# in the appointment table
+appointment_archive = db.Table(
+    'appointment_archive',
+    db.Column('created', db.DateTime, nullable=False),
+    db.Column('updated', db.DateTime),
+    db.Column('id', db.Integer, nullable=False),
+    db.Column('start', db.DateTime, nullable=False),
+    db.Column('end', db.DateTime, nullable=False),
+    db.Column('department', db.String(50), nullable=False),
+    db.Column('patient_id', db.Integer, nullable=False),
+    db.Column('provider_id', db.Integer, nullable=False),
+)
+
+
+class ProviderSchedule(TimestampMixin, db.Model):
+    """
+    Recurring weekly office hours for a provider (UTC)
+
+    Providers without any schedule are treated as always open
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(
+        db.Integer, db.ForeignKey('provider.id', ondelete='CASCADE'), nullable=False, index=True)
+    weekday = db.Column(db.SmallInteger, nullable=False)  # Monday is 0
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+
+    def __repr__(self):
+        return (f'<ProviderSchedule {self.provider_id} on {self.weekday} '
+                f'{self.start_time}-{self.end_time}>')
+
+
+class ScheduleException(TimestampMixin, db.Model):
+    """
+    One-off change to office hours on a given date: extra hours when is_open,
+    otherwise time off. Exceptions without a provider are clinic-wide
+    (holidays) and exceptions without times cover the whole day
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(
+        db.Integer, db.ForeignKey('provider.id', ondelete='CASCADE'), index=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    start_time = db.Column(db.Time)
+    end_time = db.Column(db.Time)
+    is_open = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        return f'<ScheduleException {self.provider_id} on {self.date}>'
+
+
 class Webhook(TimestampMixin, db.Model):
     """
     Include this model here because this is a prototype
@@ -61,3 +134,80 @@ class Webhook(TimestampMixin, db.Model):
     name = db.Column(db.String(50), nullable=False)
     endpoint_url = db.Column(db.String(280), nullable=False)
     active = db.Column(db.Boolean, nullable=False)
+
+
+class WebhookDelivery(TimestampMixin, db.Model):
+    """
+    Outbox of webhook notifications
+
+    Rows are written in the same transaction as the change they describe and
+    delivered by the webhook dispatcher process (see app.dispatcher)
+    """
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    DEAD = 'dead'
+
+    id = db.Column(db.Integer, primary_key=True)
+    webhook_id = db.Column(
+        db.Integer, db.ForeignKey('webhook.id', ondelete='CASCADE'), nullable=False)
+    notification_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String(280))
+
+    # Relationships
+    webhook = db.relationship('Webhook')
+
+    # Indexes
+    __table_args__ = (
+        # dispatcher polls for pending deliveries that are due
+        db.Index('ix_webhook_delivery_pending_next_attempt_at', 'next_attempt_at',
+                 postgresql_where=db.text("status = 'pending'")),
+    )
+
+    def __repr__(self):
+        return f'<WebhookDelivery {self.notification_type} to {self.webhook_id} ({self.status})>'
+
+
+class AppointmentChange(db.Model):
+    """
+    Change feed of the appointment table, read by GET
+    /v1/appointments/changes; a deleted change is the tombstone of a deleted
+    appointment
+
+    Rows are written by statement-level triggers on appointment, managed in
+    migrations, so Core and bulk writes are recorded too. txid is the writing
+    transaction, which orders changes by when they can become visible
+    """
+    id = db.Column(db.BigInteger, primary_key=True)
+    txid = db.Column(db.BigInteger, nullable=False, server_default=db.text('txid_current()'))
+    appointment_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, server_default=db.false())
+
+    __table_args__ = (
+        # the feed reads changes after a (txid, id) token
+        db.Index('ix_appointment_change_txid_id', 'txid', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<AppointmentChange {self.appointment_id} in {self.txid}>'
+
+
+class IdempotencyKey(db.Model):
+    """
+    Responses to requests sent with an Idempotency-Key header, replayed when
+    the request is retried (see app.idempotency)
+
+    status_code is null while the first request with the key is running
+    """
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(40), nullable=False)
+    status_code = db.Column(db.SmallInteger)
+    location = db.Column(db.String(280))
+    body = db.Column(db.LargeBinary)
+    created = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} ({self.status_code})>'
@@ -0,0 +1,224 @@
+"""
+Appointment Archive Partitions
+
+Live appointments stay in the appointment table, which keeps the primary key,
+foreign keys and the overlap exclusion constraint. Appointments that started
+before the hot window (the last APPOINTMENT_HOT_MONTHS months plus the
+current one) are moved into appointment_archive, which is range partitioned
+by month on start. Queries on recent windows only read the hot table; older
+windows also read the archive, where Postgres skips partitions outside the
+window.
+
+`flask maintain_partitions` runs the housekeeping, e.g. nightly from cron:
+creating archive partitions ahead of time, moving appointments out of the
+hot table, and detaching partitions older than
+APPOINTMENT_ARCHIVE_RETENTION_MONTHS. Detached partitions are left as
+standalone tables to be dumped to cold storage and dropped.
+"""
+
+from datetime import datetime
+import itertools
+import logging
+
+from sqlalchemy import select, text, union_all
+
+from app import app, db, Appointment, Patient, Provider, appointment_archive
+from app.signals import record_changes
+
+logger = logging.getLogger(__name__)
+
+HOT_MONTHS = app.config.get('APPOINTMENT_HOT_MONTHS')
+PARTITIONS_AHEAD = app.config.get('APPOINTMENT_PARTITIONS_AHEAD')
+RETENTION_MONTHS = app.config.get('APPOINTMENT_ARCHIVE_RETENTION_MONTHS')
+
+ARCHIVE_COLUMNS = [column.name for column in appointment_archive.c]
+
+
+###############
+# Month Helpers
+###############
+
+def month_start(value):
+    """
+    Midnight on the first of the month value falls in
+    """
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """
+    First of the month, months after (or before) the given first of the month
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def months_between(first_month, last_month):
+    """
+    First of each month from first_month to last_month, inclusive
+    """
+    month = first_month
+    while month <= last_month:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month):
+    return f'appointment_archive_y{month.year:04}m{month.month:02}'
+
+
+def hot_cutoff(now=None):
+    """
+    Appointments that start before the cutoff belong in the archive
+    """
+    return add_months(month_start(now or datetime.utcnow()), -HOT_MONTHS)
+
+
+##############
+# Maintenance
+##############
+
+def archive_partitions():
+    """
+    Months of the partitions attached to appointment_archive
+    """
+    rows = db.session.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+        'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+        "WHERE parent.relname = 'appointment_archive'"))
+    return sorted(datetime.strptime(name, 'appointment_archive_y%Ym%m')
+                  for name, in rows)
+
+
+def monthly_tables():
+    """
+    Months that have an archive table, attached as a partition or detached
+    """
+    rows = db.session.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' "
+        "AND relname ~ '^appointment_archive_y[0-9]{4}m[0-9]{2}$'"))
+    return sorted(datetime.strptime(name, 'appointment_archive_y%Ym%m')
+                  for name, in rows)
+
+
+def create_partitions(first_month, last_month):
+    """
+    Create missing monthly partitions, and their indexes, from first_month to
+    last_month; returns the months created
+
+    Months whose partition was detached (see detach_partitions) still have
+    their table and are not created again
+    """
+    existing = set(monthly_tables())
+    created = []
+    for month in months_between(first_month, last_month):
+        if month in existing:
+            continue
+
+        name = partition_name(month)
+        db.session.execute(
+            f'CREATE TABLE {name} PARTITION OF appointment_archive '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        # Postgres 10 does not create indexes on partitions for us
+        db.session.execute(f'CREATE INDEX {name}_start_id ON {name} (start, id)')
+        db.session.execute(f'CREATE INDEX {name}_provider_id_start ON {name} (provider_id, start)')
+        db.session.execute(f'CREATE INDEX {name}_patient_id_start ON {name} (patient_id, start)')
+        db.session.execute(f'CREATE INDEX {name}_department_start ON {name} (department, start)')
+        db.session.execute(f'CREATE UNIQUE INDEX {name}_id ON {name} (id)')
+        created.append(month)
+
+    db.session.commit()
+    return created
+
+
+def archive_appointments(cutoff):
+    """
+    Move appointments that start before cutoff into the archive, one month
+    per transaction; returns the number of appointments moved
+    """
+    first_start = db.session.query(db.func.min(Appointment.start)).scalar()
+    if first_start is None or first_start >= cutoff:
+        return 0
+
+    create_partitions(month_start(first_start), add_months(cutoff, -1))
+    attached = set(archive_partitions())
+
+    columns = ', '.join(f'"{name}"' for name in ARCHIVE_COLUMNS)
+    moved = 0
+    for month in months_between(month_start(first_start), add_months(cutoff, -1)):
+        if month not in attached:
+            logger.warning('Not archiving appointments from %s, its partition was detached',
+                           f'{month:%Y-%m}')
+            continue
+
+        # archived appointments are still appointments, keep them out of the
+        # change feed (see the appointment_change triggers)
+        db.session.execute("SET LOCAL app.archiving = 'on'")
+        archived = db.session.execute(
+            text(f'WITH moved AS ('
+                 f'    DELETE FROM appointment WHERE start >= :month_start AND start < :month_end '
+                 f'    RETURNING {columns}'
+                 f') INSERT INTO appointment_archive ({columns}) SELECT {columns} FROM moved '
+                 f'RETURNING id, patient_id, provider_id'),
+            {'month_start': month, 'month_end': add_months(month, 1)}).fetchall()
+        # moved with SQL, so tell the caches, as for deleted appointments
+        record_changes(db.session, itertools.chain.from_iterable(
+            ((Appointment, row.id), (Patient, row.patient_id), (Provider, row.provider_id))
+            for row in archived))
+        db.session.commit()
+        moved += len(archived)
+        if archived:
+            logger.info('Archived %s appointments from %s', len(archived), f'{month:%Y-%m}')
+    return moved
+
+
+def detach_partitions(before):
+    """
+    Detach archive partitions for months before the given month, leaving them
+    as standalone tables; returns the names of the detached tables
+    """
+    detached = []
+    for month in archive_partitions():
+        if month >= before:
+            continue
+        name = partition_name(month)
+        db.session.execute(f'ALTER TABLE appointment_archive DETACH PARTITION {name}')
+        detached.append(name)
+    db.session.commit()
+    return detached
+
+
+def maintain_partitions(now=None):
+    """
+    Create upcoming partitions, archive appointments that have left the hot
+    window and detach partitions past retention
+    """
+    cutoff = hot_cutoff(now)
+    created = create_partitions(cutoff, add_months(cutoff, PARTITIONS_AHEAD))
+    moved = archive_appointments(cutoff)
+    detached = detach_partitions(add_months(cutoff, -RETENTION_MONTHS))
+    return {
+        'created': [partition_name(month) for month in created],
+        'archived': moved,
+        'detached': detached,
+    }
+
+
+#########
+# Queries
+#########
+
+def appointments_table(window_start=None):
+    """
+    Selectable of the appointments that may start at or after window_start
+    (a naive UTC datetime, None for all of them) with the appointment
+    columns: the hot table, or the hot table and archive combined
+    """
+    appointment_table = Appointment.__table__
+    if window_start is not None and window_start >= hot_cutoff():
+        return appointment_table
+
+    hot = select([appointment_table.c[name] for name in ARCHIVE_COLUMNS])
+    archived = select([appointment_archive.c[name] for name in ARCHIVE_COLUMNS])
+    return union_all(hot, archived).alias('appointment')
@@ -0,0 +1,92 @@
+"""
+Sampling Request Profiler
+
+A background thread looks at the stack of every thread that is handling a
+request every PROFILER_INTERVAL_IN_MS, and counts the stacks it sees per
+request. The samples of the PROFILER_SLOWEST_REQUESTS slowest requests are
+kept, and dumped as folded stacks, one `frame;frame;... count` line per
+stack, which flamegraph.pl and speedscope read. The root frame of each stack
+names its request, so one flame graph shows all of them side by side.
+
+Sampling only sees real threads, so it does not profile gevent workers.
+"""
+
+from collections import Counter
+import heapq
+import itertools
+import sys
+import threading
+import time
+
+
+def fold(frame):
+    """
+    Folded stack of frame, outermost call first
+    """
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f'{module}:{frame.f_code.co_name}'.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler(object):
+    def __init__(self, interval, slowest):
+        self.interval = interval  # in seconds
+        self.slowest = slowest
+        self._active = {}  # thread ident -> Counter of folded stacks
+        self._slowest = []  # heap of (seconds, sequence, label, Counter)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, samples in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[fold(frame)] += 1
+
+    def begin_request(self):
+        self._active[threading.get_ident()] = Counter()
+
+    def end_request(self, label, seconds):
+        """
+        Stop sampling this thread's request, keeping its samples if it is one
+        of the slowest
+        """
+        samples = self._active.pop(threading.get_ident(), None)
+        if not samples:
+            return
+
+        entry = (seconds, next(self._sequence), label.replace(';', ':'), samples)
+        with self._lock:
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def folded(self):
+        """
+        Folded stacks of the slowest requests, slowest first
+        """
+        with self._lock:
+            slowest = sorted(self._slowest, reverse=True)
+
+        lines = []
+        for seconds, _, label, samples in slowest:
+            root = f'{label} {seconds * 1000:.0f}ms'
+            lines.extend(f'{root};{stack} {count}' for stack, count in samples.items())
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def clear(self):
+        with self._lock:
+            self._slowest = []
@@ -0,0 +1,100 @@
+"""
+Webhook Subscriber Registry
+
+In-process cache of active webhook subscribers, so appointment writes do not
+query the webhook table on every request. Entries expire after
+WEBHOOK_REGISTRY_TTL_IN_SECONDS and are invalidated as soon as a transaction
+that changed a Webhook commits.
+
+Other processes (gunicorn workers, the dispatcher) hear about changes over
+Postgres LISTEN / NOTIFY when WEBHOOK_REGISTRY_LISTEN is set; the TTL bounds
+how stale they can get otherwise.
+"""
+
+import os
+import time
+
+from sqlalchemy import text
+
+from app import app, db, Webhook
+from app.signals import before_commit, listen, on_commit
+
+NOTIFY_CHANNEL = 'webhook_subscribers'
+
+
+class WebhookRegistry(object):
+    def __init__(self, ttl, listen=False):
+        self.ttl = ttl
+        self.listen = listen
+        self._webhook_ids = None
+        self._expires_at = 0
+        self._generation = 0
+        self._listener_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def active_webhook_ids(self):
+        """
+        Return ids of active webhooks, loading them if the cache is stale
+        """
+        if self.listen and self._listener_pid != os.getpid():
+            self._start_listener()
+
+        if self._webhook_ids is not None and time.monotonic() < self._expires_at:
+            self.hits += 1
+            return self._webhook_ids
+
+        self.misses += 1
+        # an invalidation that arrives while we query (e.g. from the listener
+        # thread) must not be overwritten by what we read before it
+        generation = self._generation
+        webhook_ids = tuple(
+            webhook.id for webhook in
+            db.session.query(Webhook.id).filter(Webhook.active.is_(True)))
+        if generation == self._generation:
+            self._webhook_ids = webhook_ids
+            self._expires_at = time.monotonic() + self.ttl
+        return webhook_ids
+
+    def invalidate(self):
+        self._generation += 1
+        self._webhook_ids = None
+        self.invalidations += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self._webhook_ids) if self._webhook_ids is not None else 0,
+        }
+
+    def _start_listener(self):
+        """
+        Listen for changes made by other processes (once per process, as
+        gunicorn forks workers after the app is imported)
+        """
+        self._listener_pid = os.getpid()
+        # we may have missed changes while (re)connecting
+        listen(app.config.get('SQLALCHEMY_DATABASE_URI'), NOTIFY_CHANNEL,
+               received=lambda payload: self.invalidate(),
+               connected=self.invalidate,
+               timeout=self.ttl)
+
+
+webhook_registry = WebhookRegistry(
+    ttl=app.config.get('WEBHOOK_REGISTRY_TTL_IN_SECONDS'),
+    listen=app.config.get('WEBHOOK_REGISTRY_LISTEN'))
+
+
+@before_commit(Webhook)
+def _notify_webhooks_changed(session, changes):
+    # tell the other processes, once this transaction commits
+    session.execute(text(f'NOTIFY {NOTIFY_CHANNEL}'))
+
+
+@on_commit(Webhook)
+def _webhooks_changed(changes):
+    webhook_registry.invalidate()
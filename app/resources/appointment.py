@@ -1,18 +1,36 @@
-from datetime import datetime, timedelta
+from bisect import bisect_right
+from collections import defaultdict
+from contextlib import contextmanager
+import csv
+from datetime import datetime, timedelta, timezone
+import io
+import itertools
 import json
-from typing import List
 
-from flask import abort
+from flask import abort, Response, stream_with_context
 from flask_restful import Resource
-from sqlalchemy import and_
-from webargs import fields
+from psycopg2.errorcodes import EXCLUSION_VIOLATION
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from webargs import fields, validate
 from webargs.flaskparser import use_args
 from werkzeug.exceptions import NotFound
 
-from app import app, db, Appointment, Patient, Provider
-from app.schemas import AppointmentSchema
+from app import (
+    app, db, Appointment, AppointmentChange, Patient, Provider, appointment_archive)
+from app.cache import etag_for
+from app.database import set_statement_timeout
+from app.idempotency import idempotent
+from app.metrics import span
+from app.partitions import appointments_table
+from app.schedules import office_hours
+from app.serializers import appointment_serializer
+from app.signals import record_changes
 from app.utils import (
-    appointment_notification_webhook, create_response, getitem_or_404)
+    PAGINATION_ARGS, PRECONDITION_FAILED_ERROR, appointment_notification_webhook,
+    cached_item_response, check_if_match, create_response, encode_cursor, getitem_or_404,
+    getitems_or_404, paginate, pagination_headers)
 
 ###############
 # Configuration
@@ -21,36 +39,98 @@ from app.utils import (
 BASE_URL = app.config.get('BASE_URL')
 BOOKING_DELAY_IN_HOURS = app.config.get('BOOKING_DELAY_IN_HOURS')
 MAX_APPT_LENGTH_IN_MINUTES = app.config.get('MAX_APPT_LENGTH_IN_MINUTES')
+MAX_BULK_APPOINTMENTS = app.config.get('MAX_BULK_APPOINTMENTS')
+EXPORT_CHUNK_SIZE = app.config.get('EXPORT_CHUNK_SIZE')
+EXPORT_STATEMENT_TIMEOUT_IN_MS = app.config.get('EXPORT_STATEMENT_TIMEOUT_IN_MS')
+EXPORT_CSV_FIELDS = [
+    'id', 'start', 'end', 'department', 'patient', 'provider', 'created', 'updated']
+
+# Error messages
+BOOKING_WINDOW_ERROR = 'Appointment begin before booking window starts'
+MAX_LENGTH_ERROR = 'Appointment length exceeds maximum allowed'
+OVERLAP_ERROR = 'New appointment overlaps with already booked appointment.'
+OFFICE_CLOSED_ERROR = 'Office closed'
+ARCHIVED_ERROR = 'Archived appointments cannot be changed'
 
 # Configure reading from requests
 APPOINTMENT_SCHEMA_POST = {
     'start': fields.DateTime(required=True),
-    'duration': fields.Int(required=True),  # in minutes
+    'duration': fields.Int(required=True, validate=validate.Range(min=1)),  # in minutes
     'patient_id': fields.Int(required=True),
     'provider_id': fields.Int(required=True),
     'department': fields.Str(required=True),
 }
 
-APPOINTMENT_SCHEMA_GET = {
+APPOINTMENT_FILTER_ARGS = {
     'dt_gte': fields.DateTime(location='query'),
     'dt_lte': fields.DateTime(location='query'),
+    'provider_id': fields.List(fields.Int(), location='query'),
+    'patient_id': fields.List(fields.Int(), location='query'),
+    'department': fields.List(fields.Str(), location='query'),
+}
+
+APPOINTMENT_SCHEMA_GET = {
+    **PAGINATION_ARGS,
+    **APPOINTMENT_FILTER_ARGS,
+    'fields': fields.DelimitedList(fields.Str(), location='query',
+                                   validate=validate.ContainsOnly(appointment_serializer.names)),
+}
+
+APPOINTMENT_SCHEMA_EXPORT = {
+    **APPOINTMENT_FILTER_ARGS,
+    'format': fields.Str(location='query', missing='ndjson',
+                         validate=validate.OneOf(['ndjson', 'csv'])),
+}
+
+APPOINTMENT_SCHEMA_CHANGES = {
+    'limit': PAGINATION_ARGS['limit'],
+    'since': fields.Str(location='query'),
 }
 
 APPOINTMENT_SCHEMA_PATCH = {
     'start': fields.DateTime(required=True),
-    'duration': fields.Int(),  # in minutes
+    'duration': fields.Int(validate=validate.Range(min=1)),  # in minutes
     'department': fields.Str()
 }
 
-# Configure serializing models to JSON for response
-appointments_list_schema = AppointmentSchema(many=True)
-appointment_schema = AppointmentSchema()
+APPOINTMENT_SCHEMA_BULK_POST = {
+    'appointments': fields.List(
+        fields.Nested(APPOINTMENT_SCHEMA_POST),
+        required=True,
+        validate=lambda items: 0 < len(items) <= MAX_BULK_APPOINTMENTS,
+    ),
+}
 
 
 ################
 # Helper Methods
 ################
 
+def _appointment_row_or_404(appointment_id, columns):
+    """
+    Row of the appointment with the given attribute names, read from the
+    archive if it was moved there (see app.partitions), or abort with a 404
+    """
+    for table in (Appointment.__table__, appointment_archive):
+        row = (db.session.query(*[table.c[name] for name in columns])
+                         .filter(table.c.id == appointment_id)
+                         .first())
+        if row is not None:
+            return row
+    return abort(create_response(status_code=404))
+
+def _changeable_appointment_or_404(appointment_id):
+    """
+    Appointment to change or delete; archived appointments are read-only, so
+    abort with a 409 for them
+    """
+    appointment = db.session.query(Appointment).get(appointment_id)
+    if appointment is None:
+        archived = exists().where(appointment_archive.c.id == appointment_id)
+        if db.session.query(archived).scalar():
+            abort(create_response(status_code=409, error=ARCHIVED_ERROR))
+    return getitem_or_404(Appointment, appointment_id)
+
 def _appointment_starts_before_booking_delay(appt_start, booking_start):
     """
     Some clinics might have rules regarding how far in advance appointments
@@ -59,8 +139,7 @@ def _appointment_starts_before_booking_delay(appt_start, booking_start):
     If appointment is made before allowable time, inform of error
     """
     if not appt_start >= booking_start:
-        error_text = 'Appointment begin before booking window starts'
-        response = create_response(status_code=400, error=error_text)
+        response = create_response(status_code=400, error=BOOKING_WINDOW_ERROR)
         abort(response)
 
 def _appointment_longer_than_max_length(duration):
@@ -68,51 +147,244 @@ def _appointment_longer_than_max_length(duration):
     If appointment duration longer than allowed, return a 400
     """
     if duration > MAX_APPT_LENGTH_IN_MINUTES:
-        error_text = 'Appointment length exceeds maximum allowed'
-        response = create_response(status_code=400, error=error_text)
+        response = create_response(status_code=400, error=MAX_LENGTH_ERROR)
+        abort(response)
+
+def _appointment_outside_office_hours(provider_id, appt_start, appt_end):
+    """
+    If the provider is not working for all of the appointment, return a 409
+    """
+    if not office_hours.is_open(provider_id, appt_start, appt_end):
+        response = create_response(status_code=409, error=OFFICE_CLOSED_ERROR)
         abort(response)
 
-def _start_time_overlaps(provider_id_field, provider_id, start_time, allowed_overlap:List=[]):
+def _matching_appointments(args):
+    """
+    Appointments to read (the hot table, or hot and archived appointments)
+    and filters for the ones that overlap the dt_gte / dt_lte window and
+    belong to any of the given providers, patients and departments
+
+    Appointments are never longer than the maximum length, so ones ending
+    after dt_gte start after dt_gte minus that. Bounding start on both sides
+    makes the window a range scan of the (start, id) indexes and keeps
+    windows in recent months off the archive. Provider, patient and
+    department each have an index leading with them and then start
     """
-    Given start time, find what appointments start time overlaps with
+    # stored times are naive UTC
+    window = {key: value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+              for key, value in args.items() if key in ('dt_gte', 'dt_lte')}
+
+    earliest_start = None
+    if 'dt_gte' in window:
+        earliest_start = window['dt_gte'] - timedelta(minutes=MAX_APPT_LENGTH_IN_MINUTES)
+    appointments = appointments_table(earliest_start)
+
+    filters = []
+    if 'dt_lte' in window:
+        filters.append(appointments.c.start <= window['dt_lte'])
+    if 'dt_gte' in window:
+        filters.append(appointments.c.start >= earliest_start)
+        filters.append(appointments.c.end >= window['dt_gte'])
+    for name in ('provider_id', 'patient_id', 'department'):
+        if args.get(name):
+            filters.append(appointments.c[name].in_(args[name]))
+    return appointments, filters
+
+def _stream_appointment_rows(appointments, filters):
+    """
+    Yield chunks of appointment rows through a server-side cursor
 
-    If there is an overlap that is not allowed, let the user know about the
-    conflict, else continue
+    Rows are read with Core on a dedicated connection, bypassing the ORM and
+    its identity map, so memory use stays flat however many rows there are
     """
-    appointments_start_time_interrupts = (
-        Appointment.query
-                   .filter(provider_id_field == provider_id)
-                   .filter(and_(start_time >= Appointment.start,
-                                start_time < Appointment.end))
-                   .all())
-
-    for appointment in appointments_start_time_interrupts:
-        if appointment.id not in allowed_overlap:
-            response = create_response(
-                status_code=409,
-                error='New appointment starts before already booked appointment ends.')
-            abort(response)
-
-def _end_time_overlaps(provider_id_field, provider_id, end_time, allowed_overlap:List=[]):
+    select_appointments = (
+        appointments.select()
+                    .where(and_(*filters))
+                    .order_by(appointments.c.id))
+
+    with db.get_read_engine().connect() as connection, connection.begin():
+        # exports can take much longer than the usual statement timeout
+        set_statement_timeout(connection, EXPORT_STATEMENT_TIMEOUT_IN_MS)
+        result = (connection.execution_options(stream_results=True)
+                            .execute(select_appointments))
+        while True:
+            rows = result.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            yield rows
+
+def _ndjson_lines(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(appointment_serializer.dump(row)) + '\n' for row in rows)
+
+def _csv_lines(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS)
+    writer.writeheader()
+    for rows in chunks:
+        writer.writerows(appointment_serializer.dump_many(rows))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+@contextmanager
+def _overlap_conflicts_as_409():
     """
-    Given start time, find what appointments start time overlaps with
+    Let the database check for double booking while writing the appointment
+
+    Overlapping appointments for a provider are rejected by the
+    appointment_provider_id_period_excl exclusion constraint. This closes the
+    race between concurrent requests without locking and turns the conflict
+    check into part of the INSERT / UPDATE.
 
-    If there is an overlap that is not allowed, let the user know about the
-    conflict, else continue
+    If the constraint is violated, let the user know about the conflict
     """
-    appointments_end_time_interrupts = (
-        Appointment.query
-                .filter(provider_id_field == provider_id)
-                .filter(and_(end_time > Appointment.start,
-                             end_time <= Appointment.end))
-                .all())
+    try:
+        yield
+    except IntegrityError as e:
+        db.session.rollback()
+        if getattr(e.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+            raise
+
+        response = create_response(status_code=409, error=OVERLAP_ERROR)
+        abort(response)
 
-    for appointment in appointments_end_time_interrupts:
-        if appointment.id not in allowed_overlap:
-            response = create_response(
-                status_code=409,
-                error='New appointment ends after already booked appointment starts.')
-            abort(response)
+@contextmanager
+def _stale_writes_as_412():
+    """
+    Reject writes based on an appointment that was changed since it was read
+
+    The UPDATE / DELETE only matches the appointment's row while it still has
+    the version that was read (Appointment.version is the mapper's
+    version_id_col), so concurrent writers don't lock the row and the one
+    that loses the race updates nothing and gets a StaleDataError.
+
+    Let the user know to read the appointment again
+    """
+    try:
+        yield
+    except StaleDataError:
+        db.session.rollback()
+        response = create_response(status_code=412, error=PRECONDITION_FAILED_ERROR)
+        abort(response)
+
+def _insert_appointments(rows):
+    """
+    Insert appointment rows with a single statement, returning the created
+    appointment for each row, or None for rows that overlap an appointment
+    booked by a concurrent request
+
+    The rows were checked for overlaps already, so a violation of the
+    exclusion constraint only happens when another request booked the same
+    time since. Then each row is inserted in a savepoint of its own, so only
+    the conflicting ones are rejected.
+
+    RETURNING does not promise the order of VALUES; accepted rows of a
+    provider never overlap, so (provider_id, start) identifies each one
+    """
+    now = datetime.utcnow()
+
+    def insert(batch):
+        return (Appointment.__table__.insert()
+                                     .values([{'created': now,
+                                               'start': row['start'],
+                                               'end': row['end'],
+                                               'department': row['department'],
+                                               'patient_id': row['patient_id'],
+                                               'provider_id': row['provider_id']}
+                                              for row in batch])
+                                     .returning(*Appointment.__table__.c))
+
+    def is_overlap(error):
+        return getattr(error.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
+    try:
+        with db.session.begin_nested():
+            created = db.session.execute(insert(rows)).fetchall()
+    except IntegrityError as e:
+        if not is_overlap(e):
+            raise
+        created = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    created.extend(db.session.execute(insert([row])).fetchall())
+            except IntegrityError as e:
+                if not is_overlap(e):
+                    raise
+
+    by_slot = {(appointment.provider_id, appointment.start): appointment
+               for appointment in created}
+    return [by_slot.get((row['provider_id'], row['start'])) for row in rows]
+
+def _appointment_changes(since, limit):
+    """
+    Return a page of changes after the since token, with the appointments
+    they changed as they are now (hot or archived), and the token for the
+    next page (None on the last page)
+
+    Changes are ordered by (txid, id) and only read from transactions older
+    than every running one (below the snapshot's xmin): those have all
+    committed or rolled back, so a transaction that commits later can't add
+    changes before a token that was already handed out. Each poll is a range
+    scan of the (txid, id) index after the token, so it costs as much as the
+    changes since then however many appointments there are
+    """
+    changes = AppointmentChange.__table__
+    oldest_running = select([func.txid_snapshot_xmin(func.txid_current_snapshot())]).as_scalar()
+    finished = changes.c.txid < oldest_running
+    page, next_token = paginate(select([changes]).where(finished),
+                                order_by=[changes.c.txid, changes.c.id],
+                                limit=limit,
+                                cursor=since)
+
+    appointment_ids = {change.appointment_id for change in page}
+    current = {}
+    if appointment_ids:
+        appointments = appointments_table()
+        columns = [appointments.c[name] for name in appointment_serializer.attributes]
+        current = {
+            appointment.id: appointment for appointment in db.session.execute(
+                select(columns).where(appointments.c.id.in_(appointment_ids)))}
+    return page, current, next_token
+
+def _find_booked_overlaps(provider_id, candidates):
+    """
+    Given a provider's candidate appointments sorted by start time, return
+    the ones that overlap with each other or with already booked appointments
+
+    Booked appointments are loaded with a single range query spanning the
+    candidates. As booked appointments never overlap, both their start and end
+    times are sorted and we can bisect to find the first one that could
+    conflict with each candidate.
+    """
+    window_start = candidates[0]['start']
+    window_end = max(candidate['end'] for candidate in candidates)
+    booked = (
+        db.session.query(Appointment.start, Appointment.end)
+                  .filter(Appointment.provider_id == provider_id)
+                  .filter(Appointment.start < window_end)
+                  .filter(Appointment.end > window_start)
+                  .order_by(Appointment.start)
+                  .all())
+    booked_starts = [appointment.start for appointment in booked]
+    booked_ends = [appointment.end for appointment in booked]
+
+    overlapping = []
+    accepted_end = None
+    for candidate in candidates:
+        # first booked appointment that ends after the candidate starts
+        i = bisect_right(booked_ends, candidate['start'])
+        overlaps_booked = i < len(booked) and booked_starts[i] < candidate['end']
+        overlaps_batch = accepted_end is not None and accepted_end > candidate['start']
+
+        if overlaps_booked or overlaps_batch:
+            overlapping.append(candidate)
+        else:
+            accepted_end = candidate['end']
+
+    return overlapping
 
 
 ###########
@@ -122,50 +394,51 @@ def _end_time_overlaps(provider_id_field, provider_id, end_time, allowed_overlap
 class AppointmentsResource(Resource):
     @use_args(APPOINTMENT_SCHEMA_GET)
     def get(self, args):
-        # set up query
-        all_appointments = Appointment.query
-
-        # filter by query parameters as required
-        if 'dt_lte' in args:
-            all_appointments = all_appointments.filter(Appointment.start <= args['dt_lte'])
-        if 'dt_gte' in args:
-            all_appointments = all_appointments.filter(Appointment.end >= args['dt_gte'])
-
-        # output query
-        all_appointments = all_appointments.all()
-        result = appointments_list_schema.dump(all_appointments)
-        return result.data, 200
-
+        # set up query, filtering by query parameters as required
+        appointments, filters = _matching_appointments(args)
+
+        # only read the columns of the requested fields, and the ones we page by
+        serializer = appointment_serializer
+        if args.get('fields'):
+            serializer = appointment_serializer.only(args['fields'])
+        columns = dict.fromkeys(serializer.attributes + ('start', 'id'))
+        all_appointments = select([appointments.c[name] for name in columns]).where(and_(*filters))
+
+        # output query one page at a time
+        page, next_cursor = paginate(all_appointments,
+                                     order_by=[appointments.c.start, appointments.c.id],
+                                     limit=args['limit'],
+                                     cursor=args.get('cursor'))
+        return serializer.dump_many(page), 200, pagination_headers(next_cursor)
+
+    @idempotent
     @use_args(APPOINTMENT_SCHEMA_POST)
     def post(self, args):
         ####################
         # Check Restrictions
         ####################
-        patient = getitem_or_404(Patient, Patient.id, args['patient_id'],
-                                 error_text="Patient not found")
-        provider = getitem_or_404(Provider, Provider.id, args['provider_id'],
-                                  error_text="Provider not found")
+        with span('appointment.lookup'):
+            patient, provider = getitems_or_404(
+                [(Patient, args['patient_id'], "Patient not found"),
+                 (Provider, args['provider_id'], "Provider not found")],
+                columns={Patient: ['id'], Provider: ['id']})
+
+        with span('appointment.validate'):
+            # is timeslot in the future (given a delay)
+            appt_start_time = args['start'].replace(tzinfo=None)
+            booking_start = datetime.now() + timedelta(hours=BOOKING_DELAY_IN_HOURS)
+            _appointment_starts_before_booking_delay(appt_start_time, booking_start)
 
-        # is timeslot in the future (given a delay)
-        appt_start_time = args['start'].replace(tzinfo=None)
-        booking_start = datetime.now() + timedelta(hours=BOOKING_DELAY_IN_HOURS)
-        _appointment_starts_before_booking_delay(appt_start_time, booking_start)
+            # is appointment duration longer than allowed
+            duration = args['duration']
+            _appointment_longer_than_max_length(duration)
 
-        # is appointment duration longer than allowed
-        duration = args['duration']
-        _appointment_longer_than_max_length(duration)
+            # double booking is checked by the database when we store the record
+            appt_end_time = appt_start_time + timedelta(minutes=duration)
+            # TODO should check if patient double book? need clarification
 
-        # check if double booked
-        appt_end_time = appt_start_time + timedelta(minutes=duration)
-        # TODO should check if patient double book? need clarification
-        _start_time_overlaps(Appointment.provider_id, provider.id, appt_start_time)
-        _end_time_overlaps(Appointment.provider_id, provider.id, appt_end_time)
-
-        # TODO is it during "Office Hours?" for this doctor (another lookup)
-        is_office_hours = True
-        if not is_office_hours:
-            response = create_response(status_code=409, error='Office closed')
-            return response
+            # is it during "Office Hours?" for this doctor
+            _appointment_outside_office_hours(provider.id, appt_start_time, appt_end_time)
 
         ###################
         # Store in Database
@@ -173,46 +446,63 @@ class AppointmentsResource(Resource):
         appointment = Appointment(start=appt_start_time,
                                   end=appt_end_time,
                                   department=args['department'],
-                                  patient=patient,
-                                  provider=provider)
+                                  patient_id=patient.id,
+                                  provider_id=provider.id)
         db.session.add(appointment)
-        db.session.commit()
+        with span('appointment.insert'), _overlap_conflicts_as_409():
+            db.session.flush()
 
         #########
         # Webhook
         #########
-        result = appointment_schema.dump(appointment)
-        appointment_notification_webhook(notification_type='created', data=result.data)
+        with span('appointment.serialize'):
+            result = appointment_serializer.dump(appointment)
+        with span('appointment.webhooks'):
+            appointment_notification_webhook(notification_type='created', data=result)
+        with span('appointment.commit'):
+            db.session.commit()
 
         ##########
         # Response
         ##########
         HEADERS = {
-            'Location': f'{BASE_URL}/appointments/{appointment.id}',
+            'Location': f'{BASE_URL}/appointments/{result["id"]}',
         }
         return create_response(status_code=201, headers=HEADERS, data={})
 
 
 class AppointmentsItemResource(Resource):
     def get(self, appointment_id):
-        appointment = getitem_or_404(Appointment, Appointment.id, appointment_id)
-        result = appointment_schema.dump(appointment)
-        return create_response(status_code=200, data=result.data)
+        def dump_appointment():
+            appointment = _appointment_row_or_404(appointment_id,
+                                                  appointment_serializer.attributes)
+            return appointment_serializer.dump(appointment)
+
+        return cached_item_response(Appointment, appointment_id, dump_appointment)
 
     def delete(self, appointment_id):
-        appointment = getitem_or_404(Appointment, Appointment.id, appointment_id)
+        appointment = _changeable_appointment_or_404(appointment_id)
+        check_if_match(lambda: appointment_serializer.dump(appointment))
         db.session.delete(appointment)
-        db.session.commit()
+        with _stale_writes_as_412():
+            db.session.commit()
         return create_response(status_code=204, data={})
 
+    @idempotent
     @use_args(APPOINTMENT_SCHEMA_PATCH)
     def patch(self, args, appointment_id):
         """
         Change the appointment start time, duration, and department.
 
         If you want to change provider and patient, delete and create new.
+
+        Send the ETag from GET in If-Match to only change the appointment as
+        it was read; either way, a write racing another one for the same
+        appointment gets a 412 instead of overwriting it.
         """
-        appointment = getitem_or_404(Appointment, Appointment.id, appointment_id)
+        with span('appointment.lookup'):
+            appointment = _changeable_appointment_or_404(appointment_id)
+            check_if_match(lambda: appointment_serializer.dump(appointment))
 
         ##################
         # Handle Arguments
@@ -221,27 +511,22 @@ class AppointmentsItemResource(Resource):
             # TODO what to do if nothing is passed it? clarify requirements
             pass
 
-        if 'duration' in args:
-            duration = args['duration']
-            appt_end_time = appt_start_time + timedelta(minutes=duration)
-        else:
-            appt_end_time = appointment.end
-            duration = (appt_end_time - appointment.start).seconds // 60
-
         if 'start' in args:
             appt_start_time = args['start'].replace(tzinfo=None)
-            appt_end_time = appt_start_time + timedelta(minutes=duration)
         else:
             appt_start_time = appointment.start
 
+        if 'duration' in args:
+            duration = args['duration']
+        else:
+            duration = (appointment.end - appointment.start).seconds // 60
+        appt_end_time = appt_start_time + timedelta(minutes=duration)
+
         if 'department' in args:
             department = args['department']
         else:
             department = appointment.department
 
-        provider = appointment.provider
-        patient = appointment.patient
-
         ####################
         # Check Restrictions
         ####################
@@ -250,15 +535,14 @@ class AppointmentsItemResource(Resource):
             response = create_response(status_code=400, error=error_text)
             return response
 
-        booking_start = datetime.now() + timedelta(hours=BOOKING_DELAY_IN_HOURS)
-        _appointment_starts_before_booking_delay(appt_start_time, booking_start)
+        with span('appointment.validate'):
+            booking_start = datetime.now() + timedelta(hours=BOOKING_DELAY_IN_HOURS)
+            _appointment_starts_before_booking_delay(appt_start_time, booking_start)
 
-        _appointment_longer_than_max_length(duration)
+            _appointment_longer_than_max_length(duration)
 
-        _start_time_overlaps(Appointment.provider_id, provider.id,
-                             appt_start_time, allowed_overlap=[appointment.id])
-        _end_time_overlaps(Appointment.provider_id, provider.id, appt_end_time,
-                           allowed_overlap=[appointment.id])
+            _appointment_outside_office_hours(
+                appointment.provider_id, appt_start_time, appt_end_time)
 
         ###############
         # Update record
@@ -267,15 +551,189 @@ class AppointmentsItemResource(Resource):
         appointment.end = appt_end_time
         appointment.department = department
         db.session.add(appointment)
-        db.session.commit()
+        with span('appointment.update'), _overlap_conflicts_as_409(), _stale_writes_as_412():
+            db.session.flush()
 
         #########
         # Webhook
         #########
-        result = appointment_schema.dump(appointment)
-        appointment_notification_webhook(notification_type='updated', data=result.data)
+        with span('appointment.serialize'):
+            result = appointment_serializer.dump(appointment)
+        with span('appointment.webhooks'):
+            appointment_notification_webhook(notification_type='updated', data=result)
+        with span('appointment.commit'):
+            db.session.commit()
+
+        ##########
+        # Response
+        ##########
+        response = create_response(status_code=200, data=result)
+        response.set_etag(etag_for(response.get_data()))
+        return response
+
+
+class AppointmentsChangesResource(Resource):
+    @use_args(APPOINTMENT_SCHEMA_CHANGES)
+    def get(self, args):
+        """
+        Appointments created, changed or deleted since the since token
+
+        Clients start without a token (from the first change), keep the token
+        of each response and send it back in the next poll; while has_more
+        is true there are more changes to read right away. Every changed
+        appointment is listed once per page, as it is now, and deleted
+        appointments as tombstones ("deleted": true). Appointments moved
+        into the archive are not changes
+        """
+        page, current, next_token = _appointment_changes(args.get('since'), args['limit'])
+
+        # the last change of each appointment in the page, in order
+        last_changes = {}
+        for change in page:
+            last_changes.pop(change.appointment_id, None)
+            last_changes[change.appointment_id] = change
+
+        items = []
+        for appointment_id, change in last_changes.items():
+            if change.deleted:
+                items.append({'id': appointment_id, 'deleted': True, 'appointment': None})
+            elif appointment_id in current:
+                items.append({'id': appointment_id, 'deleted': False,
+                              'appointment': appointment_serializer.dump(current[appointment_id])})
+            # else deleted since, its tombstone comes after this page
+
+        if page:
+            token = encode_cursor([page[-1].txid, page[-1].id])
+        else:
+            token = args.get('since') or encode_cursor([0, 0])
+
+        return create_response(status_code=200,
+                               headers=pagination_headers(next_token, cursor_arg='since'),
+                               data={'changes': items,
+                                     'token': token,
+                                     'has_more': next_token is not None})
+
+
+class AppointmentsExportResource(Resource):
+    @use_args(APPOINTMENT_SCHEMA_EXPORT)
+    def get(self, args):
+        """
+        Stream every appointment in the window as newline-delimited JSON
+        (default) or CSV
+        """
+        chunks = _stream_appointment_rows(*_matching_appointments(args))
+
+        if args['format'] == 'csv':
+            lines, mimetype = _csv_lines(chunks), 'text/csv'
+        else:
+            lines, mimetype = _ndjson_lines(chunks), 'application/x-ndjson'
+
+        return Response(stream_with_context(lines), status=200, mimetype=mimetype)
+
+
+class AppointmentsBulkResource(Resource):
+    @use_args(APPOINTMENT_SCHEMA_BULK_POST)
+    def post(self, args):
+        """
+        Create a batch of appointments in a single transaction.
+
+        The whole batch is validated in memory; each appointment gets its own
+        result so one bad row does not reject the rest of the import. When
+        appointments in the batch overlap, the one that starts first wins.
+        """
+        items = args['appointments']
+        results = [None] * len(items)
+
+        ####################
+        # Check Restrictions
+        ####################
+        patient_ids = {item['patient_id'] for item in items}
+        provider_ids = {item['provider_id'] for item in items}
+        found_patient_ids = {
+            row.id for row in
+            db.session.query(Patient.id).filter(Patient.id.in_(patient_ids))}
+        found_provider_ids = {
+            row.id for row in
+            db.session.query(Provider.id).filter(Provider.id.in_(provider_ids))}
+
+        booking_start = datetime.now() + timedelta(hours=BOOKING_DELAY_IN_HOURS)
+        candidates_by_provider = defaultdict(list)
+
+        # expand office hours for the days each provider is booked on up front
+        # so checking each appointment is only bit operations
+        booked_days = defaultdict(list)
+        for item in items:
+            if item['provider_id'] in found_provider_ids:
+                booked_days[item['provider_id']].append(item['start'].replace(tzinfo=None))
+        for provider_id, starts in booked_days.items():
+            last_day = max(starts) + timedelta(minutes=MAX_APPT_LENGTH_IN_MINUTES)
+            office_hours.day_masks(provider_id, min(starts).date(), last_day.date())
+
+        for index, item in enumerate(items):
+            appt_start_time = item['start'].replace(tzinfo=None)
+            appt_end_time = appt_start_time + timedelta(minutes=item['duration'])
+
+            if item['patient_id'] not in found_patient_ids:
+                results[index] = {'status': 404, 'error': 'Patient not found'}
+            elif item['provider_id'] not in found_provider_ids:
+                results[index] = {'status': 404, 'error': 'Provider not found'}
+            elif not appt_start_time >= booking_start:
+                results[index] = {'status': 400, 'error': BOOKING_WINDOW_ERROR}
+            elif item['duration'] > MAX_APPT_LENGTH_IN_MINUTES:
+                results[index] = {'status': 400, 'error': MAX_LENGTH_ERROR}
+            elif not office_hours.is_open(item['provider_id'], appt_start_time, appt_end_time):
+                results[index] = {'status': 409, 'error': OFFICE_CLOSED_ERROR}
+            else:
+                candidates_by_provider[item['provider_id']].append({
+                    'index': index,
+                    'start': appt_start_time,
+                    'end': appt_end_time,
+                    'department': item['department'],
+                    'patient_id': item['patient_id'],
+                    'provider_id': item['provider_id'],
+                })
+
+        # check if double booked, within the batch or against the database
+        rows = []
+        for provider_id, candidates in candidates_by_provider.items():
+            candidates.sort(key=lambda candidate: (candidate['start'], candidate['index']))
+            overlapping = _find_booked_overlaps(provider_id, candidates)
+            for candidate in overlapping:
+                results[candidate['index']] = {'status': 409, 'error': OVERLAP_ERROR}
+            rows.extend(candidate for candidate in candidates
+                        if results[candidate['index']] is None)
+
+        ###################
+        # Store in Database
+        ###################
+        created_appointments = []
+        if rows:
+            for row, appointment in zip(rows, _insert_appointments(rows)):
+                if appointment is None:
+                    results[row['index']] = {'status': 409, 'error': OVERLAP_ERROR}
+                    continue
+                results[row['index']] = {
+                    'status': 201,
+                    'location': f'{BASE_URL}/appointments/{appointment.id}',
+                }
+                created_appointments.append(appointment)
+
+        if created_appointments:
+            # inserted with Core, so tell the caches the patients and
+            # providers have new appointments
+            record_changes(db.session, itertools.chain(
+                ((Patient, appointment.patient_id) for appointment in created_appointments),
+                ((Provider, appointment.provider_id) for appointment in created_appointments)))
+
+            #########
+            # Webhook
+            #########
+            for data in appointment_serializer.dump_many(created_appointments):
+                appointment_notification_webhook(notification_type='created', data=data)
+            db.session.commit()
 
         ##########
         # Response
         ##########
-        return create_response(status_code=200, data=result.data)
+        all_created = all(result['status'] == 201 for result in results)
+        return create_response(status_code=201 if all_created else 207, data=results)
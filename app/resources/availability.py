@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from flask import abort
+from flask_restful import Resource
+from webargs import fields, validate
+from webargs.flaskparser import use_args
+
+from app import app, db, Provider
+from app.availability import load_booked_intervals
+from app.schedules import office_hours
+from app.serializers import isoformat
+from app.utils import create_response, getitem_or_404
+
+###############
+# Configuration
+###############
+
+BOOKING_DELAY_IN_HOURS = app.config.get('BOOKING_DELAY_IN_HOURS')
+MAX_APPT_LENGTH_IN_MINUTES = app.config.get('MAX_APPT_LENGTH_IN_MINUTES')
+MAX_AVAILABILITY_WINDOW_IN_DAYS = app.config.get('MAX_AVAILABILITY_WINDOW_IN_DAYS')
+
+# Configure reading from requests
+AVAILABILITY_SCHEMA_GET = {
+    'from': fields.DateTime(location='query', required=True),
+    'to': fields.DateTime(location='query', required=True),
+    'duration': fields.Int(location='query', required=True,  # in minutes
+                           validate=validate.Range(min=1, max=MAX_APPT_LENGTH_IN_MINUTES)),
+}
+
+AVAILABILITY_SCHEMA_GET_MANY = {
+    **AVAILABILITY_SCHEMA_GET,
+    'provider_id': fields.List(fields.Int(), location='query', required=True),
+}
+
+
+################
+# Helper Methods
+################
+
+def _bookable_window(args):
+    """
+    Clip the requested window to the booking window, rejecting windows that
+    are backwards or too long to search
+    """
+    window_start = args['from'].replace(tzinfo=None)
+    window_end = args['to'].replace(tzinfo=None)
+
+    if window_end <= window_start:
+        response = create_response(status_code=400, error='Window ends before it starts')
+        abort(response)
+    if window_end - window_start > timedelta(days=MAX_AVAILABILITY_WINDOW_IN_DAYS):
+        response = create_response(status_code=400, error='Window exceeds maximum allowed')
+        abort(response)
+
+    # appointments cannot be booked before the booking delay
+    booking_start = datetime.now() + timedelta(hours=BOOKING_DELAY_IN_HOURS)
+    return max(window_start, booking_start), window_end
+
+
+def _provider_availability(provider_id, booked, window_start, window_end, duration):
+    """
+    Providers limited by office hours get gaps between their booked
+    appointments inside those hours, everyone else any gap in the window
+    """
+    slots = []
+    if window_start < window_end and office_hours.limits(provider_id):
+        booked_intervals = zip(booked.starts, booked.ends)
+        slots = office_hours.free_slots(
+            provider_id, booked_intervals, window_start, window_end, duration)
+    elif window_start < window_end:
+        slots = booked.free_slots(window_start, window_end, duration)
+
+    return {
+        'provider': provider_id,
+        'slots': [{'start': isoformat(start), 'end': isoformat(end)} for start, end in slots],
+    }
+
+
+###########
+# Resources
+###########
+
+class ProviderAvailabilityResource(Resource):
+    @use_args(AVAILABILITY_SCHEMA_GET)
+    def get(self, args, provider_id):
+        """
+        Free slots of at least duration minutes for the provider
+        """
+        getitem_or_404(Provider, provider_id, columns=['id'])
+        window_start, window_end = _bookable_window(args)
+        duration = timedelta(minutes=args['duration'])
+
+        booked = load_booked_intervals([provider_id], window_start, window_end)
+        result = _provider_availability(
+            provider_id, booked[provider_id], window_start, window_end, duration)
+        return create_response(status_code=200, data=result)
+
+
+class AvailabilityResource(Resource):
+    @use_args(AVAILABILITY_SCHEMA_GET_MANY)
+    def get(self, args):
+        """
+        Free slots of at least duration minutes for each of the providers,
+        e.g. everyone working in a department
+        """
+        provider_ids = list(dict.fromkeys(args['provider_id']))
+        found_provider_ids = {
+            row.id for row in
+            db.session.query(Provider.id).filter(Provider.id.in_(provider_ids))}
+        if len(found_provider_ids) != len(provider_ids):
+            response = create_response(status_code=404, error='Provider not found')
+            abort(response)
+
+        window_start, window_end = _bookable_window(args)
+        duration = timedelta(minutes=args['duration'])
+
+        booked = load_booked_intervals(provider_ids, window_start, window_end)
+        result = [
+            _provider_availability(
+                provider_id, booked[provider_id], window_start, window_end, duration)
+            for provider_id in provider_ids]
+        return create_response(status_code=200, data=result)
@@ -3,8 +3,10 @@ from webargs import fields
 from webargs.flaskparser import use_args
 
 from app import app, db, Patient
-from app.schemas import PatientSchema
-from app.utils import create_response, getitem_or_404
+from app.serializers import dump_patients, patient_serializer
+from app.utils import (
+    PAGINATION_ARGS, cached_item_response, create_response, getitem_or_404, paginate,
+    pagination_headers)
 
 ###############
 # Configuration
@@ -13,25 +15,28 @@ from app.utils import create_response, getitem_or_404
 BASE_URL = app.config.get('BASE_URL')
 
 # Configure reading from requests
+PATIENTS_SCHEMA_GET = {
+  **PAGINATION_ARGS,
+}
+
 PATIENTS_SCHEMA_POST = {
   'first_name': fields.Str(required=True),
   'last_name': fields.Str(required=True),
 }
 
-# Configure serializing models to JSON for response
-patient_list_schema = PatientSchema(many=True)
-patient_schema = PatientSchema()
-
 
 ###########
 # Resources
 ###########
 
 class PatientsResource(Resource):
-    def get(self):
-        all_patients = Patient.query.all()
-        result = patient_list_schema.dump(all_patients)
-        return result.data, 200
+    @use_args(PATIENTS_SCHEMA_GET)
+    def get(self, args):
+        patients, next_cursor = paginate(Patient.__table__.select(),
+                                         order_by=[Patient.id],
+                                         limit=args['limit'],
+                                         cursor=args.get('cursor'))
+        return dump_patients(patients), 200, pagination_headers(next_cursor)
 
     @use_args(PATIENTS_SCHEMA_POST)
     def post(self, args):
@@ -49,12 +54,14 @@ class PatientsResource(Resource):
 
 class PatientsItemResource(Resource):
     def get(self, patient_id):
-        patient = getitem_or_404(Patient, Patient.id, patient_id)
-        result = patient_schema.dump(patient)
-        return create_response(status_code=200, data=result.data)
+        def dump_patient():
+            patient = getitem_or_404(Patient, patient_id, columns=patient_serializer.attributes)
+            return dump_patients([patient])[0]
+
+        return cached_item_response(Patient, patient_id, dump_patient)
 
     def delete(self, patient_id):
-        patient = getitem_or_404(Patient, Patient.id, patient_id)
+        patient = getitem_or_404(Patient, patient_id)
         db.session.delete(patient)
         db.session.commit()
         return create_response(status_code=204, data={})
@@ -3,8 +3,10 @@ from webargs import fields
 from webargs.flaskparser import use_args
 
 from app import app, db, Provider
-from app.schemas import ProviderSchema
-from app.utils import create_response, getitem_or_404
+from app.serializers import dump_providers, provider_serializer
+from app.utils import (
+    PAGINATION_ARGS, cached_item_response, create_response, getitem_or_404, paginate,
+    pagination_headers)
 
 ###############
 # Configuration
@@ -13,25 +15,28 @@ from app.utils import create_response, getitem_or_404
 BASE_URL = app.config.get('BASE_URL')
 
 # Configure reading from requests
+PROVIDER_SCHEMA_GET = {
+  **PAGINATION_ARGS,
+}
+
 PROVIDER_SCHEMA_POST = {
   'first_name': fields.Str(required=True),
   'last_name': fields.Str(required=True),
 }
 
-# Configure serializing models to JSON for response
-provider_list_schema = ProviderSchema(many=True)
-provider_schema = ProviderSchema()
-
 
 ###########
 # Resources
 ###########
 
 class ProvidersResource(Resource):
-    def get(self):
-        all_providers = Provider.query.all()
-        result = provider_list_schema.dump(all_providers)
-        return result.data, 200
+    @use_args(PROVIDER_SCHEMA_GET)
+    def get(self, args):
+        providers, next_cursor = paginate(Provider.__table__.select(),
+                                          order_by=[Provider.id],
+                                          limit=args['limit'],
+                                          cursor=args.get('cursor'))
+        return dump_providers(providers), 200, pagination_headers(next_cursor)
 
     @use_args(PROVIDER_SCHEMA_POST)
     def post(self, args):
@@ -49,12 +54,14 @@ class ProvidersResource(Resource):
 
 class ProvidersItemResource(Resource):
     def get(self, provider_id):
-        provider = getitem_or_404(Provider, Provider.id, provider_id)
-        result = provider_schema.dump(provider)
-        return create_response(status_code=200, data=result.data)
+        def dump_provider():
+            provider = getitem_or_404(Provider, provider_id, columns=provider_serializer.attributes)
+            return dump_providers([provider])[0]
+
+        return cached_item_response(Provider, provider_id, dump_provider)
 
     def delete(self, provider_id):
-        provider = getitem_or_404(Provider, Provider.id, provider_id)
+        provider = getitem_or_404(Provider, provider_id)
         db.session.delete(provider)
         db.session.commit()
         return create_response(status_code=204, data={})
@@ -0,0 +1,236 @@
+from flask import abort
+from flask_restful import Resource
+from sqlalchemy import and_
+from webargs import fields, validate
+from webargs.flaskparser import use_args
+
+from app import app, db, Provider, ProviderSchedule, ScheduleException
+from app.serializers import provider_schedule_serializer, schedule_exception_serializer
+from app.utils import (
+    PAGINATION_ARGS, create_response, getitem_or_404, paginate, pagination_headers)
+
+###############
+# Configuration
+###############
+
+BASE_URL = app.config.get('BASE_URL')
+
+# Configure reading from requests
+SCHEDULE_SCHEMA_GET = {
+    **PAGINATION_ARGS,
+}
+
+SCHEDULE_SCHEMA_POST = {
+    'weekday': fields.Int(required=True, validate=validate.Range(min=0, max=6)),  # Monday is 0
+    'start_time': fields.Time(required=True),
+    'end_time': fields.Time(required=True),
+}
+
+SCHEDULE_SCHEMA_PATCH = {
+    'weekday': fields.Int(validate=validate.Range(min=0, max=6)),
+    'start_time': fields.Time(),
+    'end_time': fields.Time(),
+}
+
+SCHEDULE_EXCEPTION_SCHEMA_GET = {
+    **PAGINATION_ARGS,
+    'provider_id': fields.Int(location='query'),
+    'date_gte': fields.Date(location='query'),
+    'date_lte': fields.Date(location='query'),
+}
+
+SCHEDULE_EXCEPTION_SCHEMA_POST = {
+    'provider_id': fields.Int(),  # clinic-wide if missing
+    'date': fields.Date(required=True),
+    'start_time': fields.Time(),  # whole day if times are missing
+    'end_time': fields.Time(),
+    'is_open': fields.Bool(missing=False),
+}
+
+SCHEDULE_EXCEPTION_SCHEMA_PATCH = {
+    'date': fields.Date(),
+    'start_time': fields.Time(allow_none=True),  # null for the whole day
+    'end_time': fields.Time(allow_none=True),
+    'is_open': fields.Bool(),
+}
+
+
+################
+# Helper Methods
+################
+
+def _hours_end_before_they_start(start_time, end_time):
+    """
+    If hours are backwards or empty, return a 400
+    """
+    if start_time is not None and end_time is not None and not start_time < end_time:
+        response = create_response(status_code=400, error='Hours end before they start')
+        abort(response)
+
+
+def _hours_are_partial(start_time, end_time):
+    """
+    If only one of the times is given, return a 400
+    """
+    if (start_time is None) != (end_time is None):
+        response = create_response(status_code=400,
+                                   error='Both start_time and end_time are required')
+        abort(response)
+
+
+###########
+# Resources
+###########
+
+class ProviderSchedulesResource(Resource):
+    @use_args(SCHEDULE_SCHEMA_GET)
+    def get(self, args, provider_id):
+        getitem_or_404(Provider, provider_id, error_text='Provider not found', columns=['id'])
+        schedule_table = ProviderSchedule.__table__
+        schedules, next_cursor = paginate(
+            schedule_table.select().where(schedule_table.c.provider_id == provider_id),
+            order_by=[ProviderSchedule.id],
+            limit=args['limit'],
+            cursor=args.get('cursor'))
+        return (provider_schedule_serializer.dump_many(schedules), 200,
+                pagination_headers(next_cursor))
+
+    @use_args(SCHEDULE_SCHEMA_POST)
+    def post(self, args, provider_id):
+        """
+        Add weekly office hours for the provider, in UTC
+        """
+        getitem_or_404(Provider, provider_id, error_text='Provider not found', columns=['id'])
+        _hours_end_before_they_start(args['start_time'], args['end_time'])
+
+        schedule = ProviderSchedule(provider_id=provider_id,
+                                    weekday=args['weekday'],
+                                    start_time=args['start_time'],
+                                    end_time=args['end_time'])
+        db.session.add(schedule)
+        db.session.commit()
+
+        HEADERS = {
+            'Location': f'{BASE_URL}/providers/{provider_id}/schedules/{schedule.id}',
+        }
+        return create_response(status_code=201, headers=HEADERS, data={})
+
+
+class ProviderSchedulesItemResource(Resource):
+    def _get_schedule(self, provider_id, schedule_id):
+        schedule = getitem_or_404(ProviderSchedule, schedule_id)
+        if schedule.provider_id != provider_id:
+            response = create_response(status_code=404)
+            abort(response)
+        return schedule
+
+    def get(self, provider_id, schedule_id):
+        schedule = self._get_schedule(provider_id, schedule_id)
+        result = provider_schedule_serializer.dump(schedule)
+        return create_response(status_code=200, data=result)
+
+    def delete(self, provider_id, schedule_id):
+        schedule = self._get_schedule(provider_id, schedule_id)
+        db.session.delete(schedule)
+        db.session.commit()
+        return create_response(status_code=204, data={})
+
+    @use_args(SCHEDULE_SCHEMA_PATCH)
+    def patch(self, args, provider_id, schedule_id):
+        """
+        Change the weekday or hours of weekly office hours
+        """
+        schedule = self._get_schedule(provider_id, schedule_id)
+        start_time = args.get('start_time', schedule.start_time)
+        end_time = args.get('end_time', schedule.end_time)
+        _hours_end_before_they_start(start_time, end_time)
+
+        schedule.weekday = args.get('weekday', schedule.weekday)
+        schedule.start_time = start_time
+        schedule.end_time = end_time
+        db.session.commit()
+
+        result = provider_schedule_serializer.dump(schedule)
+        return create_response(status_code=200, data=result)
+
+
+class ScheduleExceptionsResource(Resource):
+    @use_args(SCHEDULE_EXCEPTION_SCHEMA_GET)
+    def get(self, args):
+        exception_table = ScheduleException.__table__
+        filters = []
+        if 'provider_id' in args:
+            filters.append(exception_table.c.provider_id == args['provider_id'])
+        if 'date_gte' in args:
+            filters.append(exception_table.c.date >= args['date_gte'])
+        if 'date_lte' in args:
+            filters.append(exception_table.c.date <= args['date_lte'])
+
+        exceptions, next_cursor = paginate(
+            exception_table.select().where(and_(*filters)),
+            order_by=[ScheduleException.id],
+            limit=args['limit'],
+            cursor=args.get('cursor'))
+        return (schedule_exception_serializer.dump_many(exceptions), 200,
+                pagination_headers(next_cursor))
+
+    @use_args(SCHEDULE_EXCEPTION_SCHEMA_POST)
+    def post(self, args):
+        """
+        Add extra hours (is_open) or time off on a date, for one provider or
+        the whole clinic
+        """
+        provider_id = args.get('provider_id')
+        if provider_id is not None:
+            getitem_or_404(Provider, provider_id, error_text='Provider not found',
+                           columns=['id'])
+        _hours_are_partial(args.get('start_time'), args.get('end_time'))
+        _hours_end_before_they_start(args.get('start_time'), args.get('end_time'))
+
+        exception = ScheduleException(provider_id=provider_id,
+                                      date=args['date'],
+                                      start_time=args.get('start_time'),
+                                      end_time=args.get('end_time'),
+                                      is_open=args['is_open'])
+        db.session.add(exception)
+        db.session.commit()
+
+        HEADERS = {
+            'Location': f'{BASE_URL}/schedule_exceptions/{exception.id}',
+        }
+        return create_response(status_code=201, headers=HEADERS, data={})
+
+
+class ScheduleExceptionsItemResource(Resource):
+    def get(self, exception_id):
+        exception = getitem_or_404(ScheduleException, exception_id)
+        result = schedule_exception_serializer.dump(exception)
+        return create_response(status_code=200, data=result)
+
+    def delete(self, exception_id):
+        exception = getitem_or_404(ScheduleException, exception_id)
+        db.session.delete(exception)
+        db.session.commit()
+        return create_response(status_code=204, data={})
+
+    @use_args(SCHEDULE_EXCEPTION_SCHEMA_PATCH)
+    def patch(self, args, exception_id):
+        """
+        Change the date, hours or kind of an exception
+
+        To move it to another provider, delete and create new.
+        """
+        exception = getitem_or_404(ScheduleException, exception_id)
+        start_time = args.get('start_time', exception.start_time)
+        end_time = args.get('end_time', exception.end_time)
+        _hours_are_partial(start_time, end_time)
+        _hours_end_before_they_start(start_time, end_time)
+
+        exception.date = args.get('date', exception.date)
+        exception.start_time = start_time
+        exception.end_time = end_time
+        exception.is_open = args.get('is_open', exception.is_open)
+        db.session.commit()
+
+        result = schedule_exception_serializer.dump(exception)
+        return create_response(status_code=200, data=result)
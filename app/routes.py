@@ -1,11 +1,22 @@
 import logging
 
-from flask import jsonify, request
+from flask import jsonify, request, Response
 
-from app import app, api
-from app.resources.appointment import AppointmentsResource, AppointmentsItemResource
+from app import app, api, db
+from app.cache import item_cache
+from app.idempotency import idempotency_store
+from app.metrics import profiler, render_metrics
+from app.registry import webhook_registry
+from app.resources.appointment import (
+    AppointmentsResource, AppointmentsBulkResource, AppointmentsChangesResource,
+    AppointmentsExportResource, AppointmentsItemResource)
+from app.resources.availability import AvailabilityResource, ProviderAvailabilityResource
 from app.resources.patient import PatientsResource, PatientsItemResource
 from app.resources.provider import ProvidersResource, ProvidersItemResource
+from app.resources.schedule import (
+    ProviderSchedulesResource, ProviderSchedulesItemResource, ScheduleExceptionsResource,
+    ScheduleExceptionsItemResource)
+from app.schedules import office_hours
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +27,42 @@ def index():
     return jsonify({'index': 'page'})
 
 
+@app.route('/stats')
+def stats():
+    """
+    In-process cache and connection pool statistics for this worker
+    """
+    return jsonify({
+        'db_pool': db.pool_stats(),
+        'item_cache': item_cache.stats(),
+        'idempotency': idempotency_store.stats(),
+        'webhook_registry': webhook_registry.stats(),
+        'office_hours': office_hours.stats(),
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Request metrics of this worker, for Prometheus to scrape
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profile')
+def profile():
+    """
+    Folded stacks of the slowest requests, for flamegraph.pl or speedscope
+    """
+    if profiler is None:
+        return jsonify({'error': 'Profiler is disabled, set PROFILER_ENABLED'}), 404
+    return Response(profiler.folded(), mimetype='text/plain')
+
+
 api.add_resource(AppointmentsResource, f'{API_PREFIX}/appointments')
+api.add_resource(AppointmentsBulkResource, f'{API_PREFIX}/appointments/bulk')
+api.add_resource(AppointmentsExportResource, f'{API_PREFIX}/appointments/export')
+api.add_resource(AppointmentsChangesResource, f'{API_PREFIX}/appointments/changes')
 api.add_resource(AppointmentsItemResource, f'{API_PREFIX}/appointments/<int:appointment_id>')
 
 api.add_resource(PatientsResource, f'{API_PREFIX}/patients')
@@ -25,6 +71,17 @@ api.add_resource(PatientsItemResource, f'{API_PREFIX}/patients/<int:patient_id>'
 api.add_resource(ProvidersResource, f'{API_PREFIX}/providers')
 api.add_resource(ProvidersItemResource, f'{API_PREFIX}/providers/<int:provider_id>')
 
+api.add_resource(AvailabilityResource, f'{API_PREFIX}/availability')
+api.add_resource(ProviderAvailabilityResource,
+                 f'{API_PREFIX}/providers/<int:provider_id>/availability')
+
+api.add_resource(ProviderSchedulesResource, f'{API_PREFIX}/providers/<int:provider_id>/schedules')
+api.add_resource(ProviderSchedulesItemResource,
+                 f'{API_PREFIX}/providers/<int:provider_id>/schedules/<int:schedule_id>')
+api.add_resource(ScheduleExceptionsResource, f'{API_PREFIX}/schedule_exceptions')
+api.add_resource(ScheduleExceptionsItemResource,
+                 f'{API_PREFIX}/schedule_exceptions/<int:exception_id>')
+
 
 ###############################
 # Notification Webhook Endpoint
@@ -38,5 +95,5 @@ def webhook_notification_receiver():
     Only putting it here as this is a prototype and want to show we recieved
     a POST request from a webhook
     """
-    logger.info(request.values)
+    logger.info('received notification %s', request.values)
     return jsonify({'all': 'good'})
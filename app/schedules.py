@@ -0,0 +1,276 @@
+"""
+Provider Office Hours
+
+Weekly schedules and exceptions are expanded into one bitset per provider per
+day, with a bit for every SLOT_IN_MINUTES slot (bit 0 is 00:00-00:05 UTC).
+Checking that a booking is inside office hours, or intersecting office hours
+with booked appointments, is then a handful of integer bit operations instead
+of expanding recurrences on every request.
+
+Expanded days are cached per process and invalidated when a transaction that
+changed a schedule commits; SCHEDULE_CACHE_TTL_IN_SECONDS bounds how long
+other processes can serve stale hours.
+
+Providers without a weekly schedule are open all day while
+OPEN_WITHOUT_OFFICE_HOURS is set (the default, so providers can be booked
+before their hours are entered), and closed when it is not.
+
+Exceptions on a date apply in order: the provider's time off, then extra
+hours, then clinic-wide closures, which win over everything else.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+import time as clock
+
+from sqlalchemy import and_, or_
+
+from app import app, db, ProviderSchedule, ScheduleException
+from app.signals import on_commit
+
+SLOT_IN_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_IN_MINUTES
+SLOT = timedelta(minutes=SLOT_IN_MINUTES)
+ALL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+
+###########
+# Bit Masks
+###########
+
+def slot_floor(offset):
+    """
+    Slot containing the given offset (timedelta) from midnight
+    """
+    return int(offset.total_seconds()) // (SLOT_IN_MINUTES * 60)
+
+
+def slot_ceil(offset):
+    """
+    First slot starting at or after the given offset (timedelta) from midnight
+    """
+    return -(-int(offset.total_seconds()) // (SLOT_IN_MINUTES * 60))
+
+
+def interval_mask(start_slot, end_slot):
+    """
+    Bits for slots [start_slot, end_slot), clipped to the day
+    """
+    start_slot = max(start_slot, 0)
+    end_slot = min(end_slot, SLOTS_PER_DAY)
+    if end_slot <= start_slot:
+        return 0
+    return ((1 << (end_slot - start_slot)) - 1) << start_slot
+
+
+def time_mask(start_time, end_time):
+    """
+    Bits for the [start_time, end_time) part of a day; no times is all day
+    """
+    if start_time is None or end_time is None:
+        return ALL_DAY
+    midnight = datetime.combine(datetime.min, time())
+    return interval_mask(slot_floor(datetime.combine(datetime.min, start_time) - midnight),
+                         slot_ceil(datetime.combine(datetime.min, end_time) - midnight))
+
+
+def runs(mask):
+    """
+    Split mask into (start_slot, end_slot) runs of consecutive set bits
+    """
+    found = []
+    while mask:
+        start_slot = (mask & -mask).bit_length() - 1
+        # adding the lowest bit carries through the run to the slot after it
+        carried = mask + (1 << start_slot)
+        end_slot = (carried & -carried).bit_length() - 1
+        found.append((start_slot, end_slot))
+        mask &= ~((1 << end_slot) - 1)
+    return found
+
+
+def days_between(start, end):
+    """
+    Midnight of every day that [start, end) touches
+    """
+    day = datetime.combine(start.date(), time())
+    while day < end:
+        yield day
+        day += timedelta(days=1)
+
+
+##############
+# Office Hours
+##############
+
+class OfficeHours(object):
+    def __init__(self, ttl, open_without_schedule=False, max_cached_days=100000):
+        self.ttl = ttl
+        self.open_without_schedule = open_without_schedule
+        self.max_cached_days = max_cached_days
+        self._day_masks = {}  # (provider_id, date) -> mask
+        self._weekly_masks = {}  # provider_id -> [mask per weekday] or None
+        self._expires_at = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        self._day_masks.clear()
+        self._weekly_masks.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self._day_masks),
+        }
+
+    def _check_expiry(self):
+        now = clock.monotonic()
+        if now >= self._expires_at:
+            self._day_masks.clear()
+            self._weekly_masks.clear()
+            self._expires_at = now + self.ttl
+
+    def _weekly(self, provider_id):
+        """
+        Weekly office hours for the provider, None if they have no schedule
+        """
+        if provider_id not in self._weekly_masks:
+            with db.using_primary():
+                rows = (
+                    db.session.query(ProviderSchedule.weekday,
+                                     ProviderSchedule.start_time,
+                                     ProviderSchedule.end_time)
+                              .filter(ProviderSchedule.provider_id == provider_id)
+                              .all())
+            weekly = None
+            if rows:
+                weekly = [0] * 7
+                for weekday, start_time, end_time in rows:
+                    weekly[weekday] |= time_mask(start_time, end_time)
+            self._weekly_masks[provider_id] = weekly
+        return self._weekly_masks[provider_id]
+
+    def has_schedule(self, provider_id):
+        self._check_expiry()
+        return self._weekly(provider_id) is not None
+
+    def limits(self, provider_id):
+        """
+        Do office hours limit when the provider can be booked
+        """
+        return not self.open_without_schedule or self.has_schedule(provider_id)
+
+    def day_masks(self, provider_id, first_day, last_day):
+        """
+        Office hours bitsets for each day from first_day to last_day (dates,
+        inclusive), expanding any days that are not cached with one query
+        """
+        self._check_expiry()
+        weekly = self._weekly(provider_id)
+        num_days = (last_day - first_day).days + 1
+        dates = [first_day + timedelta(days=i) for i in range(num_days)]
+
+        if weekly is None:
+            self.hits += num_days
+            mask = ALL_DAY if self.open_without_schedule else 0
+            return {date: mask for date in dates}
+
+        # read cached days once, as other threads may clear the cache
+        masks = {date: self._day_masks.get((provider_id, date)) for date in dates}
+        missing = [date for date in dates if masks[date] is None]
+        self.hits += num_days - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            if len(self._day_masks) + len(missing) > self.max_cached_days:
+                self._day_masks.clear()
+
+            exceptions = defaultdict(list)
+            # closures, then extra hours, then clinic-wide closures, so a
+            # provider's extra hours never re-open a holiday
+            clinic_closure = and_(ScheduleException.provider_id.is_(None),
+                                  ScheduleException.is_open.is_(False))
+            with db.using_primary():
+                rows = (
+                    db.session.query(ScheduleException.date,
+                                     ScheduleException.start_time,
+                                     ScheduleException.end_time,
+                                     ScheduleException.is_open)
+                              .filter(or_(ScheduleException.provider_id == provider_id,
+                                          ScheduleException.provider_id == None))  # noqa
+                              .filter(ScheduleException.date >= missing[0])
+                              .filter(ScheduleException.date <= missing[-1])
+                              .order_by(clinic_closure, ScheduleException.is_open)
+                              .all())
+            for date, start_time, end_time, is_open in rows:
+                exceptions[date].append((time_mask(start_time, end_time), is_open))
+
+            for date in missing:
+                mask = weekly[date.weekday()]
+                for exception_mask, is_open in exceptions[date]:
+                    mask = mask | exception_mask if is_open else mask & ~exception_mask
+                masks[date] = self._day_masks[(provider_id, date)] = mask
+
+        return masks
+
+    def is_open(self, provider_id, start, end):
+        """
+        Is every slot that [start, end) touches inside office hours
+        """
+        days = list(days_between(start, end))
+        if not days:
+            # empty, e.g. [midnight, midnight), it needs no slots
+            return True
+
+        masks = self.day_masks(provider_id, days[0].date(), days[-1].date())
+        for day in days:
+            needed = interval_mask(slot_floor(start - day), slot_ceil(end - day))
+            if needed & ~masks[day.date()]:
+                return False
+        return True
+
+    def free_slots(self, provider_id, booked, window_start, window_end, duration):
+        """
+        (start, end) gaps of at least duration inside office hours and the
+        window that do not touch a booked (start, end) appointment
+        """
+        days = list(days_between(window_start, window_end))
+        if not days:
+            return []
+
+        masks = self.day_masks(provider_id, days[0].date(), days[-1].date())
+        booked_by_day = defaultdict(list)
+        for start, end in booked:
+            for day in days_between(start, end):
+                booked_by_day[day].append((start, end))
+
+        slots = []
+        for day in days:
+            free = masks[day.date()]
+            free &= interval_mask(slot_ceil(window_start - day), slot_floor(window_end - day))
+            for start, end in booked_by_day[day]:
+                free &= ~interval_mask(slot_floor(start - day), slot_ceil(end - day))
+
+            for start_slot, end_slot in runs(free):
+                slot_start, slot_end = day + start_slot * SLOT, day + end_slot * SLOT
+                # join runs that carry on past midnight
+                if slots and slots[-1][1] == slot_start:
+                    slot_start = slots.pop()[0]
+                slots.append((slot_start, slot_end))
+
+        return [(start, end) for start, end in slots if end - start >= duration]
+
+
+office_hours = OfficeHours(ttl=app.config.get('SCHEDULE_CACHE_TTL_IN_SECONDS'),
+                           open_without_schedule=app.config.get('OPEN_WITHOUT_OFFICE_HOURS'))
+
+
+@on_commit(ProviderSchedule, ScheduleException)
+def _schedules_changed(changes):
+    office_hours.invalidate()
@@ -5,6 +5,8 @@ from app.models import Appointment, Patient, Provider
 class AppointmentSchema(ma.ModelSchema):
     class Meta:
         model = Appointment
+        # internal to optimistic locking, clients use the ETag
+        exclude = ('version',)
 
 
 class PatientSchema(ma.ModelSchema):
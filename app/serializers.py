@@ -0,0 +1,137 @@
+"""
+Fast Serializers for Hot Read Endpoints
+
+Drop-in replacements for the ModelSchema dumps in app.schemas. Fields are
+worked out once at import time and rows are converted straight to dicts, with
+no model introspection and no relationship loading per object. Serializers
+read attributes, so they work on Core rows, named tuples and model instances.
+
+Output matches the corresponding schema: naive UTC datetimes get the same
+ISO 8601 +00:00 format, relationships to one row are dumped as the related
+id and relationships to many rows as a list of ids.
+"""
+
+from collections import defaultdict
+from datetime import date, time, timezone
+from operator import attrgetter
+
+from sqlalchemy import select
+
+from app import db
+from app.partitions import appointments_table
+
+
+def isoformat(value):
+    """
+    Format a naive UTC datetime the way marshmallow's DateTime field does
+    """
+    return value.replace(tzinfo=timezone.utc).isoformat()
+
+
+class RowSerializer(object):
+    def __init__(self, fields):
+        """
+        fields: tuple of (output name, attribute, converter or None)
+        """
+        self.fields = tuple(fields)
+        self.names = tuple(name for name, _, _ in fields)
+        self.attributes = tuple(attribute for _, attribute, _ in fields)
+        self._fields = tuple((name, attrgetter(attribute), convert)
+                             for name, attribute, convert in fields)
+
+    def dump(self, row):
+        data = {}
+        for name, get_value, convert in self._fields:
+            value = get_value(row)
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def dump_many(self, rows):
+        dump = self.dump
+        return [dump(row) for row in rows]
+
+    def only(self, names):
+        """
+        Serializer for a subset of the fields, e.g. for sparse fieldsets
+        """
+        return RowSerializer(tuple(field for field in self.fields if field[0] in names))
+
+
+appointment_serializer = RowSerializer((
+    ('created', 'created', isoformat),
+    ('updated', 'updated', isoformat),
+    ('id', 'id', None),
+    ('start', 'start', isoformat),
+    ('end', 'end', isoformat),
+    ('department', 'department', None),
+    ('patient', 'patient_id', None),
+    ('provider', 'provider_id', None),
+))
+
+_person_fields = (
+    ('created', 'created', isoformat),
+    ('updated', 'updated', isoformat),
+    ('id', 'id', None),
+    ('first_name', 'first_name', None),
+    ('last_name', 'last_name', None),
+)
+patient_serializer = RowSerializer(_person_fields)
+provider_serializer = RowSerializer(_person_fields)
+
+provider_schedule_serializer = RowSerializer((
+    ('created', 'created', isoformat),
+    ('updated', 'updated', isoformat),
+    ('id', 'id', None),
+    ('provider', 'provider_id', None),
+    ('weekday', 'weekday', None),
+    ('start_time', 'start_time', time.isoformat),
+    ('end_time', 'end_time', time.isoformat),
+))
+
+schedule_exception_serializer = RowSerializer((
+    ('created', 'created', isoformat),
+    ('updated', 'updated', isoformat),
+    ('id', 'id', None),
+    ('provider', 'provider_id', None),
+    ('date', 'date', date.isoformat),
+    ('start_time', 'start_time', time.isoformat),
+    ('end_time', 'end_time', time.isoformat),
+    ('is_open', 'is_open', None),
+))
+
+
+def appointment_ids_by(foreign_key, ids):
+    """
+    Map each of ids to the ids of its appointments, hot and archived, using
+    a single query on the named appointment foreign key column
+    """
+    appointment_ids = defaultdict(list)
+    if not ids:
+        return appointment_ids
+
+    appointments = appointments_table()
+    rows = db.session.execute(
+        select([appointments.c[foreign_key], appointments.c.id])
+        .where(appointments.c[foreign_key].in_(ids))
+        .order_by(appointments.c.id))
+    for owner_id, appointment_id in rows:
+        appointment_ids[owner_id].append(appointment_id)
+    return appointment_ids
+
+
+def _dump_with_appointments(serializer, foreign_key, rows):
+    appointment_ids = appointment_ids_by(foreign_key, [row.id for row in rows])
+    output = serializer.dump_many(rows)
+    for data in output:
+        data['appointments'] = appointment_ids[data['id']]
+    return output
+
+
+def dump_patients(rows):
+    return _dump_with_appointments(
+        patient_serializer, 'patient_id', rows)
+
+
+def dump_providers(rows):
+    return _dump_with_appointments(
+        provider_serializer, 'provider_id', rows)
@@ -0,0 +1,177 @@
+"""
+Model Change Signals
+
+Call receivers once a transaction that changed instances of the given models
+commits. Used to keep in-process caches consistent with the database.
+
+Receivers registered with before_commit run inside the transaction instead,
+so they can queue a Postgres NOTIFY that is delivered if, and only if, the
+transaction commits; listen() runs the other end of it in each process.
+
+A change to an instance also counts as a change to the rows it points at
+through a many-to-one relationship (an appointment changes its patient and
+provider), as their one-to-many collections change with it.
+"""
+
+import itertools
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.interfaces import MANYTOONE
+
+logger = logging.getLogger(__name__)
+
+_receivers = []  # (models, receiver)
+_before_commit_receivers = []  # (models, receiver)
+
+
+def on_commit(*models):
+    """
+    Register receiver(changes) to be called after a commit that inserted,
+    updated or deleted instances of models
+
+    changes is a list of (model, primary key) tuples
+    """
+    def decorator(receiver):
+        _receivers.append((models, receiver))
+        return receiver
+    return decorator
+
+
+def before_commit(*models):
+    """
+    Register receiver(session, changes) to be called in a transaction that
+    inserted, updated or deleted instances of models, just before it commits
+
+    changes is a list of (model, primary key) tuples
+    """
+    def decorator(receiver):
+        _before_commit_receivers.append((models, receiver))
+        return receiver
+    return decorator
+
+
+def _watched_models():
+    return tuple(model for models, _ in _receivers + _before_commit_receivers
+                 for model in models)
+
+
+def _relevant(changes, models):
+    return [(model, primary_key) for model, primary_key in changes
+            if issubclass(model, models)]
+
+
+def _primary_key(instance):
+    # read from the instance as new rows do not have an identity key until
+    # the flush is finalized
+    state = inspect(instance)
+    primary_key = state.mapper.primary_key_from_instance(instance)
+    return primary_key[0] if len(primary_key) == 1 else tuple(primary_key)
+
+
+def _parents(instance):
+    """
+    (model, primary key) of the rows instance points at, before and after
+    this flush
+    """
+    state = inspect(instance)
+    for relationship in state.mapper.relationships:
+        if relationship.direction is not MANYTOONE or len(relationship.local_columns) != 1:
+            continue
+        column, = relationship.local_columns
+        history = state.attrs[state.mapper.get_property_by_column(column).key].history
+        for primary_key in itertools.chain(history.added, history.unchanged, history.deleted):
+            if primary_key is not None:
+                yield relationship.mapper.class_, primary_key
+
+
+def record_changes(session, changes):
+    """
+    Report (model, primary key) changes made outside the ORM, e.g. with Core
+    inserts, so receivers are called when session commits
+    """
+    session.info.setdefault('model_changes', set()).update(changes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changes(session, flush_context):
+    watched_models = _watched_models()
+    if not watched_models:
+        return
+
+    changes = session.info.setdefault('model_changes', set())
+    for instance in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, watched_models):
+            changes.add((type(instance), _primary_key(instance)))
+            changes.update(_parents(instance))
+
+
+@event.listens_for(Session, 'before_commit')
+def _send_pending_changes(session):
+    if not _before_commit_receivers or session.transaction.nested:
+        return
+
+    # commit flushes after this event, record those changes too
+    session.flush()
+    changes = session.info.get('model_changes')
+    if not changes:
+        return
+
+    for models, receiver in _before_commit_receivers:
+        relevant_changes = _relevant(changes, models)
+        if relevant_changes:
+            receiver(session, relevant_changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_changes(session):
+    changes = session.info.pop('model_changes', None)
+    if not changes:
+        return
+
+    for models, receiver in _receivers:
+        relevant_changes = _relevant(changes, models)
+        if relevant_changes:
+            receiver(relevant_changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('model_changes', None)
+
+
+def listen(database_uri, channel, received, connected, timeout=60):
+    """
+    Call received(payload) for every notification on channel, forever, in a
+    daemon thread
+
+    connected() is called after every (re)connect, as notifications sent while
+    the thread was not listening are lost. Needs a session connection to
+    Postgres, i.e. not through PgBouncer in transaction pooling mode
+    """
+    def listen_for_notifications():
+        while True:
+            try:
+                connection = psycopg2.connect(database_uri)
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {channel}')
+                connected()
+
+                while True:
+                    if select.select([connection], [], [], timeout) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        received(connection.notifies.pop(0).payload)
+            except psycopg2.Error:
+                logger.exception('%s listener lost connection', channel)
+                time.sleep(1)
+
+    listener = threading.Thread(target=listen_for_notifications, daemon=True)
+    listener.start()
+    return listener
@@ -2,32 +2,53 @@
 Useful Utility Functions
 """
 
+import base64
+import binascii
+from collections import namedtuple
 from datetime import datetime
+from functools import lru_cache
 import json
 import logging
-from typing import Dict
+from typing import Callable, Dict, List
+from urllib.parse import urlencode
 
-from flask import abort, Response
-import requests
+from flask import abort, request, Response
+from sqlalchemy import inspect, literal, select, tuple_
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.util import identity_key
+from webargs import fields, validate
 
-from app import Webhook
+from app import app, db, WebhookDelivery
+from app.cache import etag_for, item_cache
+from app.registry import webhook_registry
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAGE_SIZE = app.config.get('DEFAULT_PAGE_SIZE')
+MAX_PAGE_SIZE = app.config.get('MAX_PAGE_SIZE')
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+PRECONDITION_FAILED_ERROR = 'Item was changed since it was read'
+
+# Query parameters for list endpoints, see paginate
+PAGINATION_ARGS = {
+    'limit': fields.Int(location='query', missing=DEFAULT_PAGE_SIZE,
+                        validate=validate.Range(min=1, max=MAX_PAGE_SIZE)),
+    'cursor': fields.Str(location='query'),
+}
+
 
 def appointment_notification_webhook(notification_type: str, data: Dict) -> None:
     """
-    Webhook that goes thru all active webhooks and sends notification if
-    appointment has been created or updated.
+    Queue a notification to all active webhooks that an appointment has been
+    created or updated.
 
-    Being a prototype, I'm directly calling the endpoints which subscribed to
-    the appointment_notification webhook. Also passing in data directly,
-    should probably pass in a reference to the database just in case something
-    changes.
-
-    If this was going into production, it would make sense to use a task
-    queue and message broker (RabbitMQ, SQS, PubSub, Kafka) to inform another
-    process which would have workers go out and send notifications.
+    Notifications are added to the webhook_delivery outbox in the current
+    session, so they are committed in the same transaction as the appointment
+    change and never sent for changes that get rolled back. The webhook
+    dispatcher process (app.dispatcher) delivers them, which keeps slow or
+    hung subscribers out of the request thread. Still passing in data
+    directly, should probably pass in a reference to the database just in
+    case something changes.
 
     Also discuss if we should include patient and provider information so the
     receiving API does not need to make another 2 round-trips to get that
@@ -39,14 +60,17 @@ def appointment_notification_webhook(notification_type: str, data: Dict) -> None
     output = {}
     output['data'] = data_copy
     output['authorization'] = 'Some user specific hash to verify sender'
-    output['timestamp'] = datetime.utcnow()
+    output['timestamp'] = str(datetime.utcnow())
     output['type'] = notification_type
+    payload = json.dumps(output)
 
-    all_active_webhooks = Webhook.query.filter(Webhook.active == True).all()
-
-    for webhook in all_active_webhooks:
-        r = requests.post(webhook.endpoint_url, data=output)
-        logger.info(f"{r.status_code} for {webhook.id}")
+    webhook_ids = webhook_registry.active_webhook_ids()
+    for webhook_id in webhook_ids:
+        db.session.add(WebhookDelivery(webhook_id=webhook_id,
+                                       notification_type=notification_type,
+                                       payload=payload))
+    logger.debug('queued %s notification for %s webhooks', notification_type, len(webhook_ids),
+                 extra={'appointment_id': data.get('id')})
 
 
 def create_response(status_code=200, headers=None, data=None, error=None):
@@ -68,14 +92,185 @@ def create_response(status_code=200, headers=None, data=None, error=None):
     )
 
 
-def getitem_or_404(model, model_id_field, id_to_search, error_text=None):
+def cached_item_response(model, item_id, dump_item: Callable[[], Dict]) -> Response:
+    """
+    Respond with the item from the item cache, calling dump_item() to read it
+    from the database when it is not cached
+
+    Responses carry an ETag; a request whose If-None-Match matches it gets an
+    empty 304 instead. Items are read from the primary, as a stale replica
+    read would stay in the cache after the write's invalidation
+    """
+    def load():
+        with db.using_primary():
+            return create_response(status_code=200, data=dump_item()).get_data()
+
+    etag, body = item_cache.read_through(model, item_id, load)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(response=body, status=200, content_type='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def check_if_match(dump_item: Callable[[], Dict]) -> None:
     """
-    Helper function to search model for given id
+    Abort with a 412 when the request has an If-Match header and the item,
+    as dump_item() returns it, no longer has that ETag
+
+    ETags are the ones cached_item_response serves for the item, so clients
+    send back what they got from GET
     """
-    item = model.query.filter(model_id_field == id_to_search).all()
+    if not request.if_match:
+        return
+
+    etag = etag_for(create_response(status_code=200, data=dump_item()).get_data())
+    if not request.if_match.contains(etag):
+        response = create_response(status_code=412, error=PRECONDITION_FAILED_ERROR)
+        abort(response)
+
 
-    if len(item) == 0:
+def getitem_or_404(model, item_id, error_text=None, columns: List[str] = None):
+    """
+    Look up model by primary key, or abort with a 404
+
+    Instances already in the session's identity map are returned without a
+    query. When columns (attribute names) are given, only those columns are
+    loaded and a row is returned instead of a model instance
+    """
+    if columns is None:
+        item = db.session.query(model).get(item_id)
+    else:
+        primary_key = inspect(model).primary_key[0]
+        item = (db.session.query(*[getattr(model, name) for name in columns])
+                          .filter(primary_key == item_id)
+                          .first())
+
+    if item is None:
         response = create_response(status_code=404, error=error_text)
         return abort(response)
 
-    return item[0]
+    return item
+
+
+@lru_cache(maxsize=None)
+def _row_type(model, names):
+    return namedtuple(f'{model.__name__}Row', names)
+
+
+def getitems_or_404(lookups: List, columns: Dict = None) -> List:
+    """
+    Look up several (model, id, error_text) by primary key in one round
+    trip, or abort with a 404 for the first one that is missing
+
+    Like getitem_or_404, instances in the identity map are not queried again
+    and columns maps a model to the attribute names to load for it. The rest
+    are loaded by left joining each table, by primary key, onto a single row
+    """
+    columns = columns or {}
+    items = [None] * len(lookups)
+
+    entities, joins, to_load = [], [], []
+    for index, (model, item_id, _) in enumerate(lookups):
+        if model not in columns:
+            instance = db.session.identity_map.get(identity_key(model, item_id))
+            if instance is not None and not inspect(instance).expired:
+                items[index] = instance
+                continue
+
+        alias = aliased(model)
+        primary_key = inspect(model).primary_key[0].key
+        if model in columns:
+            names = tuple(dict.fromkeys([primary_key, *columns[model]]))
+            selected = [getattr(alias, name) for name in names]
+        else:
+            names, selected = None, [alias]
+        to_load.append((index, model, names, len(entities), len(entities) + len(selected)))
+        entities.extend(selected)
+        joins.append((alias, getattr(alias, primary_key) == item_id))
+
+    if to_load:
+        query = db.session.query(*entities).select_from(select([literal(1)]).alias('lookup'))
+        for alias, onclause in joins:
+            query = query.outerjoin(alias, onclause)
+        row = query.one()
+        if len(entities) == 1 and to_load[0][2] is None:
+            # a query for a single mapped entity returns it bare, columns
+            # always come back in a row
+            row = (row,)
+
+        for index, model, names, start, end in to_load:
+            values = row[start:end]
+            if values[0] is not None:
+                items[index] = values[0] if names is None else _row_type(model, names)(*values)
+
+    for item, (_, _, error_text) in zip(items, lookups):
+        if item is None:
+            response = create_response(status_code=404, error=error_text)
+            return abort(response)
+
+    return items
+
+
+def encode_cursor(values: List) -> str:
+    """
+    Opaque cursor pointing at the position of a row in a keyset ordering
+    """
+    values = [value.strftime(CURSOR_DATETIME_FORMAT) if isinstance(value, datetime) else value
+              for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, order_by: List) -> List:
+    """
+    Read cursor values back, converting them to the type of each order_by
+    column. Tampered or malformed cursors are a 400
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if len(values) != len(order_by):
+            raise ValueError
+        return [datetime.strptime(value, CURSOR_DATETIME_FORMAT)
+                if column.type.python_type is datetime else value
+                for column, value in zip(order_by, values)]
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        response = create_response(status_code=400, error='Invalid cursor')
+        return abort(response)
+
+
+def paginate(selectable, order_by: List, limit: int, cursor: str = None):
+    """
+    Keyset pagination: return a page of rows from the Core select ordered by
+    the order_by columns, which must be unique together, and the cursor for
+    the next page (None on the last page)
+
+    Rows after the cursor are found with a row comparison, so an index on the
+    order_by columns makes every page cost the same no matter how deep it is
+    """
+    if cursor is not None:
+        selectable = selectable.where(
+            tuple_(*order_by) > tuple_(*decode_cursor(cursor, order_by)))
+
+    items = db.session.execute(selectable.order_by(*order_by).limit(limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in order_by])
+
+    return items, next_cursor
+
+
+def pagination_headers(next_cursor: str, cursor_arg: str = 'cursor') -> Dict:
+    """
+    Link header pointing at the next page of the current request
+    """
+    if next_cursor is None:
+        return {}
+
+    query_args = [(key, value) for key, value in request.args.items(multi=True)
+                  if key != cursor_arg]
+    query_args.append((cursor_arg, next_cursor))
+    return {'Link': f'<{request.base_url}?{urlencode(query_args)}>; rel="next"'}
@@ -0,0 +1,304 @@
+"""
+Benchmark the API endpoints against a realistic volume of data
+
+Seeds the database (see benchmarks.seed) unless it is already seeded, then
+drives appointment create, item get, patch, list by window and delete
+through the app with --concurrency threads, each with its own test client.
+Reports requests/sec, latency percentiles, errors and SQL statements per
+request for every endpoint; --output also writes them as JSON.
+
+--compare reads two result files and flags endpoints whose throughput fell,
+or p99 latency rose, by more than --threshold percent, or that send more
+statements than before, exiting with status 1 if there are any.
+
+Usage:
+    make bench
+    docker-compose exec web python -m benchmarks.api --requests 2000 --concurrency 8
+    docker-compose exec web python -m benchmarks.api --output benchmarks/results/new.json
+    docker-compose exec web python -m benchmarks.api --compare old.json new.json
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import json
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+from app import app, db, Patient, Provider
+from app.partitions import appointments_table
+from app.routes import API_PREFIX
+from benchmarks import seed
+
+BENCHMARK_DEPARTMENT = 'benchmark'
+# far enough in the future to always be inside the booking window
+FIRST_DAY = datetime(2100, 1, 1)
+ENDPOINTS = ['create', 'item_get', 'patch', 'list_window', 'delete']
+
+
+class ThreadQueryCounter(object):
+    """
+    Counts the statements each thread sends to the database
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.count = self.count + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+query_counter = ThreadQueryCounter()
+
+
+#########
+# Running
+#########
+
+def run_requests(planned, concurrency):
+    """
+    Send the planned (method, url, data) requests from concurrency threads;
+    returns the wall time and a (seconds, queries, request, response) sample
+    per request
+    """
+    planned = iter(planned)
+    lock = threading.Lock()
+    samples = []
+
+    def next_request():
+        with lock:
+            return next(planned, None)
+
+    def run_client():
+        client = app.test_client()
+        client_samples = []
+        while True:
+            planned_request = next_request()
+            if planned_request is None:
+                break
+            method, url, data = planned_request
+            query_counter.reset()
+            begin = time.perf_counter()
+            result = client.open(url, method=method, data=data)
+            client_samples.append(
+                (time.perf_counter() - begin, query_counter.count, planned_request, result))
+        with lock:
+            samples.extend(client_samples)
+
+    threads = [threading.Thread(target=run_client) for _ in range(concurrency)]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - begin, samples
+
+
+def summarize(seconds, samples):
+    timings_ms = sorted(sample[0] * 1000 for sample in samples)
+    queries = [sample[1] for sample in samples]
+
+    def percentile(p):
+        return timings_ms[max(int(len(timings_ms) * p) - 1, 0)]
+
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample[3].status_code >= 400),
+        'seconds': seconds,
+        'throughput': len(samples) / seconds,
+        'p50_ms': statistics.median(timings_ms),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': timings_ms[-1],
+        'queries_per_request': statistics.mean(queries),
+        'max_queries': max(queries),
+    }
+
+
+def run_endpoints(num_requests, concurrency, rng):
+    """
+    Benchmark each endpoint in turn; the appointments created first are the
+    ones read, patched and deleted after
+    """
+    provider_ids = seed.seeded_ids(Provider)
+    patient_ids = seed.seeded_ids(Patient)
+    appointments = appointments_table()  # seeded appointments may have been archived
+    first_day, last_day = db.session.query(
+        db.func.min(appointments.c.start), db.func.max(appointments.c.start)
+    ).filter(appointments.c.department == seed.SEED_DEPARTMENT).one()
+    db.session.remove()
+
+    results = {}
+
+    def run(name, planned):
+        seconds, samples = run_requests(planned, concurrency)
+        results[name] = summarize(seconds, samples)
+        print(report_line(name, results[name]))
+        return samples
+
+    # one half hour appointment per hour, spread over the providers
+    samples = run('create', [
+        ('POST', f'{API_PREFIX}/appointments', {
+            'start': (FIRST_DAY + timedelta(hours=i // len(provider_ids))).isoformat(),
+            'duration': 30,
+            'department': BENCHMARK_DEPARTMENT,
+            'patient_id': rng.choice(patient_ids),
+            'provider_id': provider_ids[i % len(provider_ids)],
+        }) for i in range(num_requests)])
+    created = sorted(
+        (int(result.headers['Location'].split('/')[-1]), data['start'])
+        for _, _, (_, _, data), result in samples if result.status_code == 201)
+    if not created:
+        raise SystemExit('no appointments were created')
+    created_ids = [appointment_id for appointment_id, _ in created]
+
+    run('item_get', [('GET', f'{API_PREFIX}/appointments/{rng.choice(created_ids)}', None)
+                     for _ in range(num_requests)])
+
+    run('patch', [('PATCH', f'{API_PREFIX}/appointments/{appointment_id}',
+                   {'start': start, 'duration': 45})
+                  for appointment_id, start in created])
+
+    days = (last_day - first_day).days
+    windows = []
+    for _ in range(num_requests):
+        window_start = first_day + timedelta(days=rng.randrange(days))
+        window_end = window_start + timedelta(days=1)
+        windows.append(('GET', f'{API_PREFIX}/appointments?dt_gte={window_start.isoformat()}'
+                               f'&dt_lte={window_end.isoformat()}', None))
+    run('list_window', windows)
+
+    run('delete', [('DELETE', f'{API_PREFIX}/appointments/{appointment_id}', None)
+                   for appointment_id in created_ids])
+    return results
+
+
+def clean_up():
+    db.session.rollback()
+    db.session.execute(
+        'DELETE FROM appointment WHERE department = :department',
+        {'department': BENCHMARK_DEPARTMENT})
+    db.session.commit()
+
+
+def seeded_counts():
+    appointments = appointments_table()
+    return {
+        'providers': len(seed.seeded_ids(Provider)),
+        'patients': len(seed.seeded_ids(Patient)),
+        'appointments': (db.session.query(db.func.count(appointments.c.id))
+                                   .filter(appointments.c.department == seed.SEED_DEPARTMENT)
+                                   .scalar()),
+    }
+
+
+###########
+# Reporting
+###########
+
+def report_line(name, result):
+    return (f'{name:<12} | {result["throughput"]:8.1f} req/s | '
+            f'p50 {result["p50_ms"]:7.2f} ms | p90 {result["p90_ms"]:7.2f} ms | '
+            f'p99 {result["p99_ms"]:7.2f} ms | {result["queries_per_request"]:5.2f} queries | '
+            f'{result["errors"]} errors')
+
+
+def percent_change(old, new):
+    return 100 * (new - old) / old if old else 0
+
+
+def compare(baseline, current, threshold):
+    """
+    Print how each endpoint changed between two runs; returns the names of
+    the endpoints that regressed
+    """
+    if baseline['meta']['seeded'] != current['meta']['seeded']:
+        print('warning: the runs were seeded with different data volumes')
+
+    regressed = []
+    for name in ENDPOINTS:
+        if name not in baseline['endpoints'] or name not in current['endpoints']:
+            continue
+        old, new = baseline['endpoints'][name], current['endpoints'][name]
+        throughput = percent_change(old['throughput'], new['throughput'])
+        p99 = percent_change(old['p99_ms'], new['p99_ms'])
+        queries = new['queries_per_request'] - old['queries_per_request']
+
+        problems = []
+        if throughput < -threshold:
+            problems.append('throughput')
+        if p99 > threshold:
+            problems.append('p99')
+        if queries > 0:
+            problems.append('queries')
+        if problems:
+            regressed.append(name)
+
+        status = 'REGRESSED: ' + ', '.join(problems) if problems else 'ok'
+        print(f'{name:<12} | throughput {throughput:+7.1f}% | p99 {p99:+7.1f}% | '
+              f'queries {queries:+5.2f} | {status}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500, help='per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--providers', type=int, default=seed.DEFAULT_PROVIDERS)
+    parser.add_argument('--patients', type=int, default=seed.DEFAULT_PATIENTS)
+    parser.add_argument('--years', type=int, default=seed.DEFAULT_YEARS)
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=10, help='percent')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            regressed = compare(json.load(baseline), json.load(current), args.threshold)
+        sys.exit(1 if regressed else 0)
+
+    started = datetime.utcnow()
+    if seed.is_seeded():
+        print('using the seeded data, run benchmarks.seed to seed it again')
+    else:
+        print('seeding...')
+        seed.seed(args.providers, args.patients, args.years, random_seed=args.random_seed)
+
+    event.listen(db.engine, 'before_cursor_execute', query_counter)
+    try:
+        endpoints = run_endpoints(args.requests, args.concurrency, random.Random(args.random_seed))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', query_counter)
+        clean_up()
+
+    results = {
+        'meta': {
+            'started': started.isoformat(),
+            'python': platform.python_version(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seeded': seeded_counts(),
+        },
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark free slot search for a provider with a year of bookings
+
+Times the in-memory BookedIntervals search on its own, then the whole
+GET /v1/providers/<id>/availability request against the configured database.
+
+Usage:
+    docker-compose exec web python -m benchmarks.availability
+    docker-compose exec web python -m benchmarks.availability --window-days 7
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import statistics
+import time
+
+from app import app, db, Appointment, Patient, Provider
+from app.availability import BookedIntervals
+from app.routes import API_PREFIX
+
+BENCHMARK_DEPARTMENT = 'benchmark'
+# far enough in the future to always be inside the booking window
+FIRST_DAY = datetime(2100, 1, 1)
+
+
+def year_of_bookings():
+    """
+    Half hour appointments every other slot, 8am to 6pm, every day for a year
+    """
+    bookings = []
+    for day in range(365):
+        opening = FIRST_DAY + timedelta(days=day, hours=8)
+        for slot in range(0, 20, 2):
+            start = opening + timedelta(minutes=30 * slot)
+            bookings.append((start, start + timedelta(minutes=30)))
+    return bookings
+
+
+def percentiles(timings):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[int(len(timings_ms) * 0.99) - 1]
+    return f'p50 {statistics.median(timings_ms):7.3f} ms | p99 {p99:7.3f} ms'
+
+
+def time_in_memory(bookings, window, iterations):
+    booked = BookedIntervals(bookings)
+    timings = []
+    for i in range(iterations):
+        window_start = FIRST_DAY + timedelta(days=i % (365 - window.days))
+        begin = time.perf_counter()
+        booked.free_slots(window_start, window_start + window, timedelta(minutes=30))
+        timings.append(time.perf_counter() - begin)
+    return timings
+
+
+def time_requests(bookings, window, iterations):
+    client = app.test_client()
+    patient = Patient(first_name='bench', last_name='patient')
+    provider = Provider(first_name='bench', last_name='provider')
+    db.session.add_all([patient, provider])
+    db.session.commit()
+
+    try:
+        db.session.execute(Appointment.__table__.insert(), [{
+            'created': datetime.utcnow(),
+            'start': start,
+            'end': end,
+            'department': BENCHMARK_DEPARTMENT,
+            'patient_id': patient.id,
+            'provider_id': provider.id,
+        } for start, end in bookings])
+        db.session.commit()
+
+        timings = []
+        for i in range(iterations):
+            window_start = FIRST_DAY + timedelta(days=i % (365 - window.days))
+            window_end = window_start + window
+            url = (f'{API_PREFIX}/providers/{provider.id}/availability'
+                   f'?from={window_start.isoformat()}&to={window_end.isoformat()}&duration=30')
+            begin = time.perf_counter()
+            result = client.get(url)
+            timings.append(time.perf_counter() - begin)
+            assert result.status_code == 200, result.get_data(as_text=True)
+        return timings
+    finally:
+        db.session.rollback()
+        db.session.execute(
+            'DELETE FROM appointment WHERE department = :department',
+            {'department': BENCHMARK_DEPARTMENT})
+        db.session.delete(provider)
+        db.session.delete(patient)
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--window-days', type=int, nargs='+', default=[1, 7, 31])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    bookings = year_of_bookings()
+    print(f'{len(bookings):,} bookings over a year')
+
+    for window_days in args.window_days:
+        window = timedelta(days=window_days)
+        print(f'{window_days:>3} day window | in-memory | '
+              f'{percentiles(time_in_memory(bookings, window, args.iterations))}')
+        print(f'{window_days:>3} day window | request   | '
+              f'{percentiles(time_requests(bookings, window, args.iterations))}')
+
+
+if __name__ == '__main__':
+    main()
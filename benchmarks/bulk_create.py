@@ -0,0 +1,100 @@
+"""
+Benchmark bulk appointment creation against the per-row POST endpoint
+
+Creates the same number of appointments through POST /v1/appointments one at
+a time and through POST /v1/appointments/bulk, then reports throughput for
+both paths.
+
+Usage:
+    docker-compose exec web python -m benchmarks.bulk_create
+    docker-compose exec web python -m benchmarks.bulk_create --count 5000
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import json
+import time
+
+from app import app, db, Patient, Provider
+from app.routes import API_PREFIX
+
+NUM_PROVIDERS = 20
+BENCHMARK_DEPARTMENT = 'benchmark'
+# far enough in the future to always be inside the booking window
+FIRST_SLOT = datetime(2100, 1, 1)
+
+
+def build_appointments(patient_id, provider_ids, count, first_slot):
+    """
+    Build back-to-back 30 minute appointments spread across providers
+    """
+    return [{
+        'start': (first_slot + timedelta(minutes=30 * (i // len(provider_ids)))).isoformat(),
+        'duration': 30,
+        'patient_id': patient_id,
+        'provider_id': provider_ids[i % len(provider_ids)],
+        'department': BENCHMARK_DEPARTMENT,
+    } for i in range(count)]
+
+
+def time_per_row(client, appointments):
+    begin = time.perf_counter()
+    for appointment in appointments:
+        result = client.post(f'{API_PREFIX}/appointments', data=appointment)
+        assert result.status_code == 201, result.get_data(as_text=True)
+    return time.perf_counter() - begin
+
+
+def time_bulk(client, appointments, batch_size):
+    begin = time.perf_counter()
+    for i in range(0, len(appointments), batch_size):
+        body = {'appointments': appointments[i:i + batch_size]}
+        result = client.post(f'{API_PREFIX}/appointments/bulk',
+                             data=json.dumps(body), content_type='application/json')
+        assert result.status_code == 201, result.get_data(as_text=True)
+    return time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int,
+                        default=app.config.get('MAX_BULK_APPOINTMENTS'))
+    args = parser.parse_args()
+
+    client = app.test_client()
+
+    patient = Patient(first_name='bench', last_name='patient')
+    providers = [Provider(first_name='bench', last_name=f'provider {i}')
+                 for i in range(NUM_PROVIDERS)]
+    db.session.add(patient)
+    db.session.add_all(providers)
+    db.session.commit()
+    provider_ids = [provider.id for provider in providers]
+
+    try:
+        per_row = build_appointments(patient.id, provider_ids, args.count, FIRST_SLOT)
+        bulk = build_appointments(
+            patient.id, provider_ids, args.count, FIRST_SLOT + timedelta(days=3650))
+
+        per_row_seconds = time_per_row(client, per_row)
+        bulk_seconds = time_bulk(client, bulk, args.batch_size)
+
+        print(f'per-row : {args.count / per_row_seconds:10,.0f} appointments/sec')
+        print(f'bulk    : {args.count / bulk_seconds:10,.0f} appointments/sec')
+        print(f'speedup : {per_row_seconds / bulk_seconds:10,.1f}x')
+    finally:
+        db.session.rollback()
+        db.session.execute(
+            'DELETE FROM appointment WHERE department = :department',
+            {'department': BENCHMARK_DEPARTMENT})
+        db.session.execute(
+            'DELETE FROM provider WHERE id = ANY(:provider_ids)',
+            {'provider_ids': provider_ids})
+        db.session.execute(
+            'DELETE FROM patient WHERE id = :patient_id', {'patient_id': patient.id})
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
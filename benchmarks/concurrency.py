@@ -0,0 +1,160 @@
+"""
+Load test the running web servers with more and more concurrent clients
+
+Runs 1, 100 and 1000 clients against each server URL, each client sending
+requests one after another over its own keep-alive connection for a fixed
+time, and reports requests/sec, p50 and p99 latency and errors. Compare the
+sync workers (web) with the gevent workers (web_gevent). Clients list
+appointments and check availability, then book and cancel appointments with
+--writes.
+
+Usage:
+    docker-compose up -d web_gevent
+    docker-compose exec web python -m benchmarks.concurrency
+    docker-compose exec web python -m benchmarks.concurrency --clients 1 10 100 \
+        --urls http://web:5000 --seconds 30 --writes
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import itertools
+import statistics
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+
+from app import db, Appointment, Patient, Provider
+from app.routes import API_PREFIX
+
+BENCHMARK_DEPARTMENT = 'benchmark'
+FIRST_DAY = datetime(2100, 1, 1)
+DEFAULT_URLS = ['http://web:5000', 'http://web_gevent:5001']
+DEFAULT_CLIENTS = [1, 100, 1000]
+
+
+def seed(num_appointments):
+    patient = Patient(first_name='bench', last_name='patient')
+    provider = Provider(first_name='bench', last_name='provider')
+    db.session.add_all([patient, provider])
+    db.session.commit()
+
+    db.session.execute(Appointment.__table__.insert(), [{
+        'created': datetime.utcnow(),
+        'start': FIRST_DAY + timedelta(hours=i),
+        'end': FIRST_DAY + timedelta(hours=i, minutes=30),
+        'department': BENCHMARK_DEPARTMENT,
+        'patient_id': patient.id,
+        'provider_id': provider.id,
+    } for i in range(num_appointments)])
+    db.session.commit()
+    return patient, provider
+
+
+def clean_up(patient, provider):
+    db.session.rollback()
+    db.session.execute(
+        'DELETE FROM appointment WHERE department = :department',
+        {'department': BENCHMARK_DEPARTMENT})
+    db.session.delete(provider)
+    db.session.delete(patient)
+    db.session.commit()
+
+
+def client_requests(base_url, patient_id, provider_id, writes, slots):
+    """
+    Requests one client sends in a loop, as (method, url, data) tuples
+    """
+    window = (f'from={FIRST_DAY.isoformat()}&to={(FIRST_DAY + timedelta(days=1)).isoformat()}'
+              f'&duration=30')
+    reads = [
+        ('GET', f'{base_url}{API_PREFIX}/appointments?department={BENCHMARK_DEPARTMENT}&limit=20',
+         None),
+        ('GET', f'{base_url}{API_PREFIX}/providers/{provider_id}/availability?{window}', None),
+    ]
+    if not writes:
+        return itertools.cycle(reads)
+
+    def with_writes():
+        while True:
+            yield from reads
+            # half hour appointments in the gaps between the seeded ones
+            start = FIRST_DAY + timedelta(hours=next(slots), minutes=30)
+            yield ('POST', f'{base_url}{API_PREFIX}/appointments', {
+                'start': start.isoformat(),
+                'duration': 30,
+                'department': BENCHMARK_DEPARTMENT,
+                'patient_id': patient_id,
+                'provider_id': provider_id,
+            })
+    return with_writes()
+
+
+def load_test(base_url, clients, seconds, patient_id, provider_id, writes, slots):
+    timings = []
+    errors = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(clients + 1)
+    deadline = None
+
+    def run_client():
+        session = requests.Session()
+        client_timings, client_errors = [], 0
+        planned = client_requests(base_url, patient_id, provider_id, writes, slots)
+        start_line.wait()
+        while time.monotonic() < deadline:
+            method, url, data = next(planned)
+            begin = time.perf_counter()
+            try:
+                result = session.request(method, url, data=data, timeout=60)
+                ok = result.status_code < 400
+                if ok and method == 'POST':
+                    session.delete(urljoin(base_url, result.headers['Location']), timeout=60)
+            except requests.RequestException:
+                ok = False
+            client_timings.append(time.perf_counter() - begin)
+            client_errors += not ok
+        with lock:
+            timings.extend(client_timings)
+            errors.append(client_errors)
+
+    threads = [threading.Thread(target=run_client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + seconds
+    start_line.wait()
+    for thread in threads:
+        thread.join()
+
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[int(len(timings_ms) * 0.99) - 1]
+    print(f'{base_url:<24} | {clients:>5} clients | '
+          f'{len(timings) / seconds:8.1f} req/s | '
+          f'p50 {statistics.median(timings_ms):8.2f} ms | p99 {p99:8.2f} ms | '
+          f'{sum(errors)} errors')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--urls', nargs='+', default=DEFAULT_URLS)
+    parser.add_argument('--clients', type=int, nargs='+', default=DEFAULT_CLIENTS)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--appointments', type=int, default=1000)
+    parser.add_argument('--writes', action='store_true', help='also book appointments')
+    args = parser.parse_args()
+
+    patient, provider = seed(args.appointments)
+    # every booking gets its own gap, so bookings never overlap
+    slots = itertools.count()
+    try:
+        for base_url in args.urls:
+            for clients in args.clients:
+                load_test(base_url, clients, args.seconds, patient.id, provider.id,
+                          args.writes, slots)
+    finally:
+        clean_up(patient, provider)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark request throughput with logging off, synchronous and queued
+
+Sends requests that each log an access record and a notification record,
+with the app logger off, writing JSON from the request thread, and writing
+JSON through the QueueHandler/QueueListener pipeline of STRUCTURED_LOGGING.
+Reports req/s and latency for each. Logging to a terminal (--log-file
+/dev/stderr) is a lot slower than to a file, and shows the difference best.
+
+Usage:
+    docker-compose exec web python -m benchmarks.logging_overhead
+    docker-compose exec web python -m benchmarks.logging_overhead --requests 5000 \
+        --concurrency 8 --log-file /dev/stderr
+"""
+
+import argparse
+import logging
+import statistics
+import threading
+import time
+
+from app import app
+from app.log import JsonFormatter, RequestContextFilter, queue_handlers
+
+MODES = ['off', 'sync', 'queue']
+
+
+def file_handler(path):
+    handler = logging.FileHandler(path)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(RequestContextFilter())
+    return handler
+
+
+def time_requests(num_requests, concurrency):
+    per_thread = num_requests // concurrency
+    timings = []
+    lock = threading.Lock()
+
+    def run_client():
+        client = app.test_client()
+        client_timings = []
+        for i in range(per_thread):
+            begin = time.perf_counter()
+            result = client.post('/receive_notifications', data={'type': 'created', 'id': i})
+            client_timings.append(time.perf_counter() - begin)
+            assert result.status_code == 200
+        with lock:
+            timings.extend(client_timings)
+
+    threads = [threading.Thread(target=run_client) for _ in range(concurrency)]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - begin, timings
+
+
+def run_mode(mode, num_requests, concurrency, log_file):
+    logger = logging.getLogger('app')
+    handlers, level = list(logger.handlers), logger.level
+    for handler in handlers:
+        logger.removeHandler(handler)
+
+    listener = None
+    if mode == 'off':
+        logger.setLevel(logging.WARNING)
+    else:
+        logger.setLevel(logging.INFO)
+        handler = file_handler(log_file)
+        if mode == 'sync':
+            logger.addHandler(handler)
+        else:
+            listener = queue_handlers(logger, [handler])
+
+    try:
+        seconds, timings = time_requests(num_requests, concurrency)
+    finally:
+        if listener is not None:
+            # the queue is drained here, after the requests were timed
+            listener.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        for handler in handlers:
+            logger.addHandler(handler)
+        logger.setLevel(level)
+
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[int(len(timings_ms) * 0.99) - 1]
+    print(f'{mode:<5} | {len(timings) / seconds:8.1f} req/s | '
+          f'p50 {statistics.median(timings_ms):7.3f} ms | p99 {p99:7.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--log-file', default='/tmp/benchmark.log')
+    args = parser.parse_args()
+
+    access_log = app.config.get('ACCESS_LOG')
+    app.config['ACCESS_LOG'] = True
+    try:
+        for mode in MODES:
+            run_mode(mode, args.requests, args.concurrency, args.log_file)
+    finally:
+        app.config['ACCESS_LOG'] = access_log
+
+
+if __name__ == '__main__':
+    main()
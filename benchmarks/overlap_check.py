@@ -0,0 +1,142 @@
+"""
+Benchmark appointment conflict detection as the appointment table grows
+
+Seeds the configured database with back-to-back 30 minute appointments
+(generated server-side with generate_series) and times the overlap check used
+by POST / PATCH /v1/appointments at each table size. The check is enforced by
+the appointment exclusion constraint, so we time INSERTs that are rolled back.
+
+Usage:
+    docker-compose exec web python -m benchmarks.overlap_check
+    docker-compose exec web python -m benchmarks.overlap_check --sizes 10000 100000
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import random
+import statistics
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db, Appointment, Patient, Provider
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+NUM_PROVIDERS = 100
+SLOT_IN_MINUTES = 30
+BENCHMARK_DEPARTMENT = 'benchmark'
+SEED_START = datetime(2018, 1, 1)
+
+SEED_APPOINTMENTS_SQL = """
+INSERT INTO appointment (created, start, "end", department, patient_id, provider_id)
+SELECT now(),
+       :seed_start + (n / :num_providers) * interval '30 minutes',
+       :seed_start + (n / :num_providers + 1) * interval '30 minutes',
+       :department,
+       :patient_id,
+       (:provider_ids)[n % :num_providers + 1]
+FROM generate_series(:first, :last) AS n
+"""
+
+
+def seed(patient_id, provider_ids, first, last):
+    """
+    Insert appointments numbered [first, last] for the benchmark providers
+    """
+    db.session.execute(SEED_APPOINTMENTS_SQL, {
+        'seed_start': SEED_START,
+        'num_providers': len(provider_ids),
+        'department': BENCHMARK_DEPARTMENT,
+        'patient_id': patient_id,
+        'provider_ids': provider_ids,
+        'first': first,
+        'last': last,
+    })
+    db.session.commit()
+    db.session.execute('ANALYZE appointment')
+    db.session.commit()
+
+
+def time_checks(patient_id, provider_ids, num_rows, iterations):
+    """
+    Time conflict checked INSERTs at random points around the seeded range
+    """
+    last_slot = num_rows // len(provider_ids)
+    insert_appointment = Appointment.__table__.insert()
+    timings = []
+    conflicts = 0
+
+    for _ in range(iterations):
+        provider_id = random.choice(provider_ids)
+        # half of the slots are past the seeded range so we hit both outcomes
+        slot = random.randrange(2 * last_slot)
+        start = SEED_START + timedelta(minutes=slot * SLOT_IN_MINUTES + 15)
+        end = start + timedelta(minutes=SLOT_IN_MINUTES)
+
+        begin = time.perf_counter()
+        try:
+            db.session.execute(insert_appointment, {
+                'created': datetime.utcnow(),
+                'start': start,
+                'end': end,
+                'department': BENCHMARK_DEPARTMENT,
+                'patient_id': patient_id,
+                'provider_id': provider_id,
+            })
+        except IntegrityError:
+            conflicts += 1
+        timings.append(time.perf_counter() - begin)
+
+        db.session.rollback()
+
+    return timings, conflicts
+
+
+def report(num_rows, timings, conflicts):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[int(len(timings_ms) * 0.99) - 1]
+    print(f'{num_rows:>12,} rows | '
+          f'mean {statistics.mean(timings_ms):7.3f} ms | '
+          f'p50 {statistics.median(timings_ms):7.3f} ms | '
+          f'p99 {p99:7.3f} ms | '
+          f'conflicts {conflicts}/{len(timings_ms)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    patient = Patient(first_name='bench', last_name='patient')
+    providers = [Provider(first_name='bench', last_name=f'provider {i}')
+                 for i in range(NUM_PROVIDERS)]
+    db.session.add(patient)
+    db.session.add_all(providers)
+    db.session.commit()
+    provider_ids = [provider.id for provider in providers]
+
+    try:
+        seeded = 0
+        for num_rows in sorted(args.sizes):
+            seed(patient.id, provider_ids, seeded, num_rows - 1)
+            seeded = num_rows
+
+            timings, conflicts = time_checks(
+                patient.id, provider_ids, num_rows, args.iterations)
+            report(num_rows, timings, conflicts)
+    finally:
+        db.session.rollback()
+        db.session.execute(
+            'DELETE FROM appointment WHERE department = :department',
+            {'department': BENCHMARK_DEPARTMENT})
+        db.session.execute(
+            'DELETE FROM provider WHERE id = ANY(:provider_ids)',
+            {'provider_ids': provider_ids})
+        db.session.execute(
+            'DELETE FROM patient WHERE id = :patient_id', {'patient_id': patient.id})
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Load test the connection pool as the number of workers grows
+
+Forks worker processes the way gunicorn does, each with its own pool and a
+few request threads, all listing appointments as fast as they can. Prints
+throughput, latency, how long requests waited for a pooled connection and
+the most connections Postgres saw at once. Try it with DATABASE_PGBOUNCER
+and DATABASE_URL pointing at PgBouncer to compare.
+
+Usage:
+    docker-compose exec web python -m benchmarks.pool
+    docker-compose exec web python -m benchmarks.pool --workers 1 4 16 --threads 8
+    docker-compose exec -e DATABASE_POOL_SIZE=2 web python -m benchmarks.pool
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import multiprocessing
+import statistics
+import threading
+import time
+
+from app import app, db, Appointment, Patient, Provider
+from app.database import pool_wait
+from app.routes import API_PREFIX
+
+BENCHMARK_DEPARTMENT = 'benchmark'
+FIRST_DAY = datetime(2100, 1, 1)
+
+
+def seed(num_appointments):
+    patient = Patient(first_name='bench', last_name='patient')
+    provider = Provider(first_name='bench', last_name='provider')
+    db.session.add_all([patient, provider])
+    db.session.commit()
+
+    db.session.execute(Appointment.__table__.insert(), [{
+        'created': datetime.utcnow(),
+        'start': FIRST_DAY + timedelta(hours=i),
+        'end': FIRST_DAY + timedelta(hours=i, minutes=30),
+        'department': BENCHMARK_DEPARTMENT,
+        'patient_id': patient.id,
+        'provider_id': provider.id,
+    } for i in range(num_appointments)])
+    db.session.commit()
+    return patient, provider
+
+
+def clean_up(patient, provider):
+    db.session.rollback()
+    db.session.execute(
+        'DELETE FROM appointment WHERE department = :department',
+        {'department': BENCHMARK_DEPARTMENT})
+    db.session.delete(provider)
+    db.session.delete(patient)
+    db.session.commit()
+
+
+def run_worker(threads, seconds, results):
+    """
+    One worker process: request threads sharing this process's pool
+    """
+    # connections must not be shared with the parent process
+    db.engine.dispose()
+    url = f'{API_PREFIX}/appointments?department={BENCHMARK_DEPARTMENT}&limit=20'
+    timings = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def request_loop():
+        client = app.test_client()
+        thread_timings = []
+        while time.monotonic() < deadline:
+            begin = time.perf_counter()
+            result = client.get(url)
+            thread_timings.append(time.perf_counter() - begin)
+            assert result.status_code == 200, result.get_data(as_text=True)
+        with lock:
+            timings.extend(thread_timings)
+
+    request_threads = [threading.Thread(target=request_loop) for _ in range(threads)]
+    for thread in request_threads:
+        thread.start()
+    for thread in request_threads:
+        thread.join()
+
+    results.put((timings, pool_wait.stats()))
+
+
+def count_connections():
+    return db.session.execute(
+        'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()').scalar()
+
+
+def load_test(workers, threads, seconds):
+    results = multiprocessing.Queue()
+    db.session.remove()
+    db.engine.dispose()
+    processes = [multiprocessing.Process(target=run_worker, args=(threads, seconds, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    # sample connections from here while the workers run
+    max_connections = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        max_connections = max(max_connections, count_connections())
+        db.session.rollback()
+        time.sleep(0.1)
+
+    timings, waits = [], []
+    for _ in processes:
+        worker_timings, worker_waits = results.get()
+        timings.extend(worker_timings)
+        waits.append(worker_waits)
+    for process in processes:
+        process.join()
+
+    timings_ms = sorted(t * 1000 for t in timings)
+    checkouts = sum(wait['checkouts'] for wait in waits)
+    mean_wait = (sum(wait['mean_wait_ms'] * wait['checkouts'] for wait in waits) / checkouts
+                 if checkouts else 0)
+    max_wait = max(wait['max_wait_ms'] for wait in waits)
+    print(f'{workers:>3} workers x {threads} threads | '
+          f'{len(timings) / seconds:8.1f} req/s | '
+          f'p50 {statistics.median(timings_ms):7.2f} ms | '
+          f'p99 {timings_ms[int(len(timings_ms) * 0.99) - 1]:7.2f} ms | '
+          f'wait mean {mean_wait:6.2f} ms max {max_wait:7.2f} ms | '
+          f'{max_connections:>3} connections')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--appointments', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"pool: {db.pool_stats()['pool']}, size {app.config.get('DATABASE_POOL_SIZE')}, "
+          f"max overflow {app.config.get('DATABASE_MAX_OVERFLOW')}")
+    patient, provider = seed(args.appointments)
+    try:
+        for workers in args.workers:
+            load_test(workers, args.threads, args.seconds)
+    finally:
+        clean_up(patient, provider)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Seed the database with a realistic volume of benchmark data
+
+Creates providers, patients and years of past appointments, up to today,
+with COPY so millions of rows load in seconds. Providers see patients every
+hour, 9am to 5pm UTC on weekdays, with some slots left open; apart from the
+dates, which end today, the data only depends on the arguments and
+--random-seed, so runs can be compared.
+Seeded rows are kept apart from the other benchmarks' data and removed with
+--clean, or before seeding again.
+
+Usage:
+    docker-compose exec web python -m benchmarks.seed
+    docker-compose exec web python -m benchmarks.seed --providers 200 --patients 50000 --years 3
+    docker-compose exec web python -m benchmarks.seed --clean
+"""
+
+import argparse
+import csv
+from datetime import datetime, timedelta
+import io
+import itertools
+import random
+import time
+
+from app import db, Patient, Provider
+
+# apart from the 'benchmark' rows the other benchmarks create and delete
+SEED_DEPARTMENT = 'benchmark-seed'
+SEED_FIRST_NAME = 'seed'
+
+DEFAULT_PROVIDERS = 50
+DEFAULT_PATIENTS = 5000
+DEFAULT_YEARS = 2
+DEFAULT_FILL = 0.75  # share of slots that are booked
+FIRST_HOUR, LAST_HOUR = 9, 17
+APPOINTMENT_LENGTH = timedelta(minutes=30)
+COPY_CHUNK_SIZE = 100000
+
+
+def copy_rows(table, columns, rows):
+    """
+    Load rows into table with COPY, a chunk at a time; returns the number of
+    rows loaded
+    """
+    quoted_columns = ', '.join(f'"{column}"' for column in columns)
+    rows = iter(rows)
+    count = 0
+    connection = db.engine.raw_connection()
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, COPY_CHUNK_SIZE))
+            if not chunk:
+                break
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            connection.cursor().copy_expert(
+                f'COPY {table} ({quoted_columns}) FROM STDIN WITH CSV', buffer)
+            count += len(chunk)
+        connection.commit()
+    finally:
+        connection.close()
+    return count
+
+
+def seeded_ids(model):
+    return [item_id for item_id, in (db.session.query(model.id)
+                                     .filter(model.first_name == SEED_FIRST_NAME)
+                                     .order_by(model.id))]
+
+
+def appointment_rows(provider_ids, patient_ids, years, fill, rng):
+    """
+    Past appointments for every provider, one per booked hourly slot
+    """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = today - timedelta(days=365 * years)
+    created = datetime.utcnow()
+
+    day = first_day
+    while day < today:
+        if day.weekday() < 5:
+            for provider_id in provider_ids:
+                for hour in range(FIRST_HOUR, LAST_HOUR):
+                    if rng.random() >= fill:
+                        continue
+                    start = day + timedelta(hours=hour)
+                    yield (created, start, start + APPOINTMENT_LENGTH, SEED_DEPARTMENT,
+                           rng.choice(patient_ids), provider_id)
+        day += timedelta(days=1)
+
+
+def seed(providers, patients, years, fill=DEFAULT_FILL, random_seed=0):
+    """
+    Seed benchmark data, returns the number of rows created per table
+    """
+    rng = random.Random(random_seed)
+    created = datetime.utcnow()
+
+    copy_rows('provider', ['created', 'first_name', 'last_name'],
+              [(created, SEED_FIRST_NAME, f'provider {i}') for i in range(providers)])
+    copy_rows('patient', ['created', 'first_name', 'last_name'],
+              [(created, SEED_FIRST_NAME, f'patient {i}') for i in range(patients)])
+
+    num_appointments = copy_rows(
+        'appointment', ['created', 'start', 'end', 'department', 'patient_id', 'provider_id'],
+        appointment_rows(seeded_ids(Provider), seeded_ids(Patient), years, fill, rng))
+    db.session.execute('ANALYZE appointment')
+    db.session.commit()
+    return {'providers': providers, 'patients': patients, 'appointments': num_appointments}
+
+
+def is_seeded():
+    return db.session.query(
+        db.session.query(Provider).filter(Provider.first_name == SEED_FIRST_NAME).exists()
+    ).scalar()
+
+
+def clean():
+    """
+    Remove all seeded data
+    """
+    db.session.rollback()
+    for table in ('appointment', 'appointment_archive'):
+        db.session.execute(f'DELETE FROM {table} WHERE department = :department',
+                           {'department': SEED_DEPARTMENT})
+    db.session.query(Provider).filter(Provider.first_name == SEED_FIRST_NAME).delete()
+    db.session.query(Patient).filter(Patient.first_name == SEED_FIRST_NAME).delete()
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--providers', type=int, default=DEFAULT_PROVIDERS)
+    parser.add_argument('--patients', type=int, default=DEFAULT_PATIENTS)
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--fill', type=float, default=DEFAULT_FILL)
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--clean', action='store_true', help='remove benchmark data and exit')
+    args = parser.parse_args()
+
+    clean()
+    if args.clean:
+        return
+
+    begin = time.perf_counter()
+    counts = seed(args.providers, args.patients, args.years, args.fill, args.random_seed)
+    print(f"seeded {counts['providers']:,} providers, {counts['patients']:,} patients and "
+          f"{counts['appointments']:,} appointments in {time.perf_counter() - begin:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
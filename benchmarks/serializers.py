@@ -0,0 +1,81 @@
+"""
+Micro-benchmark the compiled serializers against the marshmallow schemas
+
+Dumps the same in-memory appointments with appointments_list_schema (the
+ModelSchema previously used by GET /v1/appointments) and with
+app.serializers.appointment_serializer. No database is needed.
+
+Usage:
+    docker-compose exec web python -m benchmarks.serializers
+    docker-compose exec web python -m benchmarks.serializers --count 100000
+"""
+
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+import time
+
+from app import Appointment, Patient, Provider
+from app.schemas import AppointmentSchema
+from app.serializers import appointment_serializer
+
+AppointmentRow = namedtuple('AppointmentRow', [
+    'created', 'updated', 'id', 'start', 'end', 'department', 'patient_id', 'provider_id'])
+
+
+def build_appointments(count):
+    patient = Patient(id=1, first_name='bench', last_name='patient')
+    provider = Provider(id=1, first_name='bench', last_name='provider')
+    first_slot = datetime(2018, 4, 5, 10, 0, 0, 123456)
+
+    appointments, rows = [], []
+    for i in range(count):
+        start = first_slot + timedelta(minutes=30 * i)
+        values = {
+            'created': first_slot,
+            'updated': None,
+            'id': i,
+            'start': start,
+            'end': start + timedelta(minutes=30),
+            'department': 'radiology',
+            'patient_id': patient.id,
+            'provider_id': provider.id,
+        }
+        appointments.append(Appointment(patient=patient, provider=provider, **values))
+        rows.append(AppointmentRow(**values))
+    return appointments, rows
+
+
+def time_dump(dump, items, repeat):
+    best = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        dump(items)
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return len(items) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    appointments, rows = build_appointments(args.count)
+    appointments_list_schema = AppointmentSchema(many=True)
+
+    assert appointments_list_schema.dump(appointments[:10]).data == \
+        appointment_serializer.dump_many(rows[:10])
+
+    schema_rate = time_dump(
+        lambda items: appointments_list_schema.dump(items), appointments, args.repeat)
+    serializer_rate = time_dump(appointment_serializer.dump_many, rows, args.repeat)
+
+    print(f'ModelSchema    : {schema_rate:12,.0f} objects/sec')
+    print(f'RowSerializer  : {serializer_rate:12,.0f} objects/sec')
+    print(f'speedup        : {serializer_rate / schema_rate:12,.1f}x')
+
+
+if __name__ == '__main__':
+    main()
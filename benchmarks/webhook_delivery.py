@@ -0,0 +1,88 @@
+"""
+Benchmark webhook delivery with and without the shared connection pool
+
+Delivers notifications to 1, 10 and 100 subscribers, all pointing at a running
+receiver (the /receive_notifications route works), once with a fresh
+requests.post per delivery and once through app.http_client. Reports latency
+per delivery and how many TCP connections each approach opened.
+
+Usage:
+    docker-compose exec web python -m benchmarks.webhook_delivery
+    docker-compose exec web python -m benchmarks.webhook_delivery \
+        --receiver-url http://web:5000/receive_notifications --events 50
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import time
+
+import requests
+
+from app import app, http_client
+
+DEFAULT_SUBSCRIBERS = [1, 10, 100]
+PAYLOAD = {
+    'data': 'benchmark',
+    'authorization': 'Some user specific hash to verify sender',
+    'type': 'created',
+}
+
+
+def fresh_connection_post(url, data):
+    r = requests.post(url, data=data)
+    r.raise_for_status()
+    return r.status_code
+
+
+def time_deliveries(post, urls, events, workers):
+    """
+    Deliver every event to every subscriber, returning per-delivery latency
+    """
+    def timed_post(url):
+        begin = time.perf_counter()
+        post(url, data=PAYLOAD)
+        return time.perf_counter() - begin
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(timed_post, urls * events))
+
+
+def pooled_connections_opened():
+    client = http_client.get_client()
+    adapter = client.get_adapter('http://')
+    return sum(pool.num_connections for pool in adapter.poolmanager.pools._container.values())
+
+
+def report(label, num_subscribers, timings, connections):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p99 = timings_ms[int(len(timings_ms) * 0.99) - 1]
+    print(f'{label:<8} | {num_subscribers:>4} subscribers | '
+          f'mean {statistics.mean(timings_ms):7.2f} ms | '
+          f'p99 {p99:7.2f} ms | '
+          f'connections opened {connections:>6}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receiver-url', default='http://web:5000/receive_notifications')
+    parser.add_argument('--subscribers', nargs='+', type=int, default=DEFAULT_SUBSCRIBERS)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--workers', type=int,
+                        default=app.config.get('WEBHOOK_DISPATCHER_WORKERS'))
+    args = parser.parse_args()
+
+    for num_subscribers in args.subscribers:
+        # distinct query strings so each subscriber looks like its own endpoint
+        urls = [f'{args.receiver_url}?subscriber={i}' for i in range(num_subscribers)]
+
+        timings = time_deliveries(fresh_connection_post, urls, args.events, args.workers)
+        report('fresh', num_subscribers, timings, len(timings))
+
+        before = pooled_connections_opened()
+        timings = time_deliveries(http_client.post, urls, args.events, args.workers)
+        report('pooled', num_subscribers, timings, pooled_connections_opened() - before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Add appointment overlap exclusion constraint
+
+Revision ID: 8d2e4a6c1b57
+Revises: 3f1c9b7d2e10
+Create Date: 2018-04-17 15:40:02.731946
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e4a6c1b57'
+down_revision = '3f1c9b7d2e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # btree_gist lets the gist index compare provider_id with =
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    # Postgres 10 does not support generated columns, so the half-open
+    # [start, end) period is an index expression instead of a stored column
+    op.execute(
+        'ALTER TABLE appointment '
+        'ADD CONSTRAINT appointment_provider_id_period_excl '
+        'EXCLUDE USING gist ('
+        '    provider_id WITH =, '
+        '    tsrange(start, "end", \'[)\') WITH &&'
+        ')'
+    )
+
+
+def downgrade():
+    op.execute(
+        'ALTER TABLE appointment '
+        'DROP CONSTRAINT appointment_provider_id_period_excl'
+    )
@@ -0,0 +1,37 @@
+"""Create appointment archive
+
+Revision ID: 9a3e5c7d1f24
+Revises: e2b6d8f41a93
+Create Date: 2018-04-28 11:02:37.418560
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3e5c7d1f24'
+down_revision = 'e2b6d8f41a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Alembic cannot create declaratively partitioned tables; monthly
+    # partitions are created by `flask maintain_partitions` (app.partitions)
+    op.execute(
+        'CREATE TABLE appointment_archive ('
+        '    created TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+        '    updated TIMESTAMP WITHOUT TIME ZONE, '
+        '    id INTEGER NOT NULL, '
+        '    start TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+        '    "end" TIMESTAMP WITHOUT TIME ZONE NOT NULL, '
+        '    department VARCHAR(50) NOT NULL, '
+        '    patient_id INTEGER NOT NULL, '
+        '    provider_id INTEGER NOT NULL'
+        ') PARTITION BY RANGE (start)'
+    )
+
+
+def downgrade():
+    # drops attached partitions too; detached partitions are left alone
+    op.drop_table('appointment_archive')
@@ -10,7 +10,7 @@ setup(
     classifiers=[
         'Programming Language :: Python :: 3.6',
     ],
-    packages=find_packages(exclude=['tests', ]),
+    packages=find_packages(exclude=['tests', 'benchmarks', ]),
     install_requires=[''],
     download_url='https://github.com/alysivji/appointment-manager',
 )
@@ -0,0 +1,59 @@
+"""
+Test free slot search
+"""
+
+from datetime import datetime, timedelta
+
+from app.availability import BookedIntervals
+
+DAY = datetime(2018, 4, 5)
+
+
+def at(hour, minute=0):
+    return DAY + timedelta(hours=hour, minutes=minute)
+
+
+def test_free_slots_with_no_bookings():
+    """
+    Test the whole window is free when nothing is booked
+    """
+    booked = BookedIntervals([])
+
+    assert booked.free_slots(at(9), at(17), timedelta(minutes=30)) == [(at(9), at(17))]
+
+
+def test_free_slots_between_bookings():
+    """
+    Test gaps between, before and after bookings are returned
+    """
+    booked = BookedIntervals([
+        (at(13), at(14)),
+        (at(10), at(11)),
+        (at(11), at(12)),  # back-to-back with the previous booking
+    ])
+
+    slots = booked.free_slots(at(9), at(17), timedelta(minutes=30))
+
+    assert slots == [(at(9), at(10)), (at(12), at(13)), (at(14), at(17))]
+
+
+def test_free_slots_skip_short_gaps():
+    """
+    Test gaps shorter than the requested duration are skipped
+    """
+    booked = BookedIntervals([(at(9), at(10)), (at(10, 20), at(12))])
+
+    slots = booked.free_slots(at(9), at(13), timedelta(minutes=30))
+
+    assert slots == [(at(12), at(13))]
+
+
+def test_free_slots_with_bookings_crossing_window():
+    """
+    Test bookings that start before or end after the window are clipped
+    """
+    booked = BookedIntervals([(at(8), at(9, 30)), (at(16, 30), at(18))])
+
+    slots = booked.free_slots(at(9), at(17), timedelta(minutes=30))
+
+    assert slots == [(at(9, 30), at(16, 30))]
@@ -0,0 +1,83 @@
+"""
+Smoke test the benchmarks at tiny sizes, so they keep working as the app
+changes; the numbers they print are not checked
+"""
+
+import importlib
+import json
+import sys
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from app import app
+
+
+def run_benchmark(monkeypatch, name, *args):
+    """
+    Run python -m benchmarks.<name> with args
+    """
+    module = importlib.import_module(f'benchmarks.{name}')
+    monkeypatch.setattr(sys, 'argv', [f'benchmarks.{name}', *args])
+    module.main()
+
+
+@pytest.fixture(scope='module')
+def live_server():
+    """
+    Serve the app over HTTP, for benchmarks that use a real client; yields
+    its base URL
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.mark.parametrize('name, args', [
+    ('availability', ['--window-days', '1', '--iterations', '2']),
+    ('bulk_create', ['--count', '4', '--batch-size', '2']),
+    ('logging_overhead', ['--requests', '4', '--concurrency', '2']),
+    ('overlap_check', ['--sizes', '200', '--iterations', '2']),
+    ('pool', ['--workers', '1', '--threads', '1', '--seconds', '1', '--appointments', '5']),
+    ('serializers', ['--count', '10', '--repeat', '1']),
+])
+def test_benchmark(monkeypatch, tmpdir, name, args):
+    """
+    Test the benchmark runs
+    """
+    if name == 'logging_overhead':
+        args = [*args, '--log-file', str(tmpdir.join('benchmark.log'))]
+    run_benchmark(monkeypatch, name, *args)
+
+
+def test_http_benchmarks(monkeypatch, live_server):
+    """
+    Test the benchmarks that send requests over HTTP run
+    """
+    run_benchmark(monkeypatch, 'concurrency', '--urls', live_server, '--clients', '2',
+                  '--seconds', '1', '--appointments', '5', '--writes')
+    run_benchmark(monkeypatch, 'webhook_delivery',
+                  '--receiver-url', f'{live_server}/receive_notifications',
+                  '--subscribers', '2', '--events', '2', '--workers', '2')
+
+
+def test_api_benchmark(monkeypatch, tmpdir):
+    """
+    Test seeding, the API benchmark and comparing its results
+    """
+    output = str(tmpdir.join('results.json'))
+    try:
+        run_benchmark(monkeypatch, 'seed', '--providers', '1', '--patients', '2', '--years', '1')
+        run_benchmark(monkeypatch, 'api', '--requests', '2', '--concurrency', '1',
+                      '--output', output)
+    finally:
+        run_benchmark(monkeypatch, 'seed', '--clean')
+
+    with open(output) as results:
+        assert json.load(results)['endpoints']
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_benchmark(monkeypatch, 'api', '--compare', output, output)
+    assert exit_info.value.code == 0
@@ -0,0 +1,111 @@
+"""
+Test item cache backends
+"""
+
+import os
+import select
+
+import psycopg2
+
+from app import app, db
+from app.cache import NOTIFY_CHANNEL, ItemCache, LocalCache, item_cache
+from app.models import Appointment, Patient
+
+
+def test_local_cache_evicts_least_recently_used():
+    """
+    Test the cache stays within max_size, dropping the oldest entry first
+    """
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.set('a', b'1')
+    cache.set('b', b'2')
+    cache.get('a')
+
+    cache.set('c', b'3')
+
+    assert len(cache) == 2
+    assert cache.get('a') == b'1'
+    assert cache.get('b') is None
+    assert cache.get('c') == b'3'
+
+
+def test_local_cache_expires_entries():
+    """
+    Test entries are not served after their time to live
+    """
+    cache = LocalCache(max_size=2, ttl=0)
+    cache.set('a', b'1')
+
+    assert cache.get('a') is None
+
+
+def test_item_cache_read_through():
+    """
+    Test bodies are loaded once, then served with the same ETag until the
+    item changes
+    """
+    cache = ItemCache(LocalCache(max_size=10, ttl=60))
+    loads = []
+
+    def load():
+        loads.append(1)
+        return b'{"data": {"id": 1}}'
+
+    etag, body = cache.read_through(Appointment, 1, load)
+    assert cache.read_through(Appointment, 1, load) == (etag, body)
+    assert len(loads) == 1
+
+    cache.invalidate([(Appointment, 1)])
+    cache.read_through(Appointment, 1, load)
+    assert len(loads) == 2
+
+
+def test_item_cache_applies_other_processes_invalidations():
+    """
+    Test notifications from other processes drop entries, and ones this
+    process sent itself are ignored
+    """
+    cache = ItemCache(LocalCache(max_size=10, ttl=60))
+    cache.read_through(Appointment, 1, lambda: b'{"data": {"id": 1}}')
+    cache.read_through(Appointment, 2, lambda: b'{"data": {"id": 2}}')
+
+    cache.received(f'{os.getpid()} appointment:1')
+    assert cache.get(Appointment, 1) is not None
+
+    cache.received(f'{os.getpid() + 1} appointment:1 appointment:2')
+    assert cache.get(Appointment, 1) is None
+    assert cache.get(Appointment, 2) is None
+
+
+def test_item_changes_are_notified_when_the_transaction_commits(monkeypatch):
+    """
+    Test invalidations are sent by the writing transaction, so they go out on
+    commit and never for a rollback
+    """
+    monkeypatch.setattr(item_cache, 'listen', True)
+    listener = psycopg2.connect(app.config.get('SQLALCHEMY_DATABASE_URI'))
+    listener.autocommit = True
+    listener.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+
+    def notifications():
+        select.select([listener], [], [], 0.5)
+        listener.poll()
+        payloads = [notify.payload for notify in listener.notifies]
+        del listener.notifies[:]
+        return payloads
+
+    try:
+        db.session.add(Patient(first_name='a', last_name='b'))
+        db.session.flush()
+        db.session.rollback()
+        assert notifications() == []
+
+        patient = Patient(first_name='a', last_name='b')
+        db.session.add(patient)
+        db.session.commit()
+        assert notifications() == [f'{os.getpid()} patient:{patient.id}']
+
+        db.session.delete(patient)
+        db.session.commit()
+    finally:
+        listener.close()
@@ -1,15 +1,58 @@
+from contextlib import contextmanager
+
 import pytest
+from sqlalchemy import event
 
-from app import app
+from app import app, db
 from app.routes import API_PREFIX
 
 
+class QueryCounter(object):
+    """
+    Records SQL statements sent to the database
+    """
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
 @pytest.fixture(scope='session')
 def client():
     app.testing = True
     return app.test_client()
 
 
+@pytest.fixture
+def query_budget():
+    """
+    Fail the test if the code in the block sends more than max_queries
+    statements to the database
+
+        with query_budget(2):
+            client.get(f'{API_PREFIX}/patients')
+    """
+    @contextmanager
+    def budget(max_queries):
+        counter = QueryCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+        try:
+            yield counter
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', counter)
+
+        assert counter.count <= max_queries, (
+            f'{counter.count} queries, budget is {max_queries}:\n' +
+            '\n'.join(counter.statements))
+
+    return budget
+
+
 @pytest.fixture
 def single_patient(client):
     """
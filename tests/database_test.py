@@ -0,0 +1,141 @@
+"""
+Test connection pooling and read replica routing
+
+The replica is a second engine on the test database, i.e. a replica with no
+replication lag
+"""
+
+from flask import Flask
+import pytest
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+from app import app, db, Patient
+from app.config import Config, _env_bool, _env_int
+from app.database import STICKY_COOKIE, RoutingSession, SQLAlchemy, TimedQueuePool
+from app.routes import API_PREFIX
+from tests.conftest import QueryCounter
+
+
+def test_env_flags_and_numbers(monkeypatch):
+    """
+    Test settings from the environment are parsed, not used as strings
+    """
+    monkeypatch.setenv('TEST_FLAG', 'false')
+    monkeypatch.setenv('TEST_NUMBER', '7')
+    assert _env_bool('TEST_FLAG', True) is False
+    assert _env_int('TEST_NUMBER', 1) == 7
+
+    for value in ('1', 'true', 'True', 'yes', 'on'):
+        monkeypatch.setenv('TEST_FLAG', value)
+        assert _env_bool('TEST_FLAG', False) is True
+    for value in ('0', 'false', 'no', 'off', ''):
+        monkeypatch.setenv('TEST_FLAG', value)
+        assert _env_bool('TEST_FLAG', True) is False
+
+    monkeypatch.delenv('TEST_FLAG')
+    monkeypatch.delenv('TEST_NUMBER')
+    assert _env_bool('TEST_FLAG', True) is True
+    assert _env_int('TEST_NUMBER', 1) == 1
+
+
+@pytest.mark.parametrize('pgbouncer, poolclass', [(False, TimedQueuePool), (True, NullPool)])
+def test_pool_follows_config(pgbouncer, poolclass):
+    """
+    Test the app pools connections itself, unless PgBouncer does, and sessions
+    route reads
+    """
+    other_app = Flask('other')
+    other_app.config.from_object(Config)
+    other_app.config['DATABASE_PGBOUNCER'] = pgbouncer
+    # per transaction statement_timeout would be set on every Session
+    other_app.config['DATABASE_STATEMENT_TIMEOUT_IN_MS'] = 0
+    other_db = SQLAlchemy(other_app)
+
+    with other_app.app_context():
+        engine = other_db.engine
+        assert isinstance(other_db.session(), RoutingSession)
+        other_db.session.remove()
+
+    assert isinstance(engine.pool, poolclass)
+    if not pgbouncer:
+        assert engine.pool.size() == Config.DATABASE_POOL_SIZE
+        assert engine.pool._max_overflow == Config.DATABASE_MAX_OVERFLOW
+    engine.dispose()
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """
+    Configure a replica bind, yield its engine
+    """
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS',
+                        {'replica_test': app.config.get('SQLALCHEMY_DATABASE_URI')})
+    yield db.get_engine(app, bind='replica_test')
+    db.session.remove()
+
+
+@pytest.fixture
+def counters(replica):
+    """
+    Count statements sent to the primary and to the replica
+    """
+    primary_counter, replica_counter = QueryCounter(), QueryCounter()
+    event.listen(db.engine, 'before_cursor_execute', primary_counter)
+    event.listen(replica, 'before_cursor_execute', replica_counter)
+    yield primary_counter, replica_counter
+    event.remove(db.engine, 'before_cursor_execute', primary_counter)
+    event.remove(replica, 'before_cursor_execute', replica_counter)
+
+
+def test_get_requests_read_from_replica(single_patient, counters):
+    """
+    Test list GETs only query the replica
+    """
+    primary_counter, replica_counter = counters
+
+    result = app.test_client().get(f'{API_PREFIX}/patients')
+
+    assert result.status_code == 200
+    assert primary_counter.count == 0
+    assert replica_counter.count > 0
+
+
+def test_reads_stick_to_primary_after_write(counters, freezer):
+    """
+    Test a client reads from the primary for a few seconds after it writes
+    """
+    primary_counter, replica_counter = counters
+    client = app.test_client()
+
+    result = client.post(f'{API_PREFIX}/patients', data={'first_name': 'a', 'last_name': 'b'})
+    assert result.status_code == 201
+    assert STICKY_COOKIE in result.headers['Set-Cookie']
+    assert replica_counter.count == 0
+
+    client.get(f'{API_PREFIX}/patients')
+    assert replica_counter.count == 0
+
+    freezer.tick(int(app.config.get('DATABASE_REPLICA_STICKY_IN_SECONDS')) + 1)
+    client.get(f'{API_PREFIX}/patients')
+    assert replica_counter.count > 0
+
+    patient_id = result.headers['Location'].split('/')[-1]
+    result = client.delete(f'{API_PREFIX}/patients/{patient_id}')
+    assert result.status_code == 204
+
+
+def test_writes_in_read_requests_use_primary(replica):
+    """
+    Test writes, and everything after them, go to the primary
+    """
+    with app.test_request_context(method='GET'):
+        app.preprocess_request()
+        assert db.session.get_bind() is replica
+
+        with db.using_primary():
+            assert db.session.get_bind() is db.engine
+        assert db.session.get_bind() is replica
+
+        assert db.session.get_bind(clause=Patient.__table__.insert()) is db.engine
+        assert db.session.get_bind() is db.engine
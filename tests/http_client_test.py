@@ -0,0 +1,131 @@
+"""
+Test shared HTTP client for webhook delivery
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+from socketserver import ThreadingMixIn
+import threading
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import app, http_client
+from app.http_client import DeliveryError
+
+
+class FakeAdapter(HTTPAdapter):
+    """
+    Answers every request with status_code (or raises error) and records the
+    keyword arguments it was sent with
+    """
+    def __init__(self, status_code=200, error=None):
+        super().__init__()
+        self.status_code = status_code
+        self.error = error
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(kwargs)
+        if self.error is not None:
+            raise self.error
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.request = request
+        response.url = request.url
+        return response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """
+    Fresh shared client for this process, so adapters mounted by a test do not
+    leak into others
+    """
+    session = http_client._create_requests_session()
+    monkeypatch.setattr(http_client, '_client', session)
+    monkeypatch.setattr(http_client, '_client_pid', os.getpid())
+    return session
+
+
+def test_post_sends_configured_timeouts(session):
+    """
+    Test deliveries are sent with the connect and read timeouts
+    """
+    adapter = FakeAdapter()
+    session.mount('http://subscriber/', adapter)
+
+    assert http_client.post('http://subscriber/hook', data={'a': 1}) == 200
+
+    assert adapter.sent[0]['timeout'] == (app.config.get('WEBHOOK_CONNECT_TIMEOUT_IN_SECONDS'),
+                                          app.config.get('WEBHOOK_READ_TIMEOUT_IN_SECONDS'))
+
+
+@pytest.mark.parametrize('adapter', [
+    FakeAdapter(status_code=503),
+    FakeAdapter(error=requests.ConnectionError('refused')),
+    FakeAdapter(error=requests.Timeout('read timed out')),
+])
+def test_failed_posts_are_not_retried_by_the_client(session, adapter):
+    """
+    Test a failed delivery is tried once and raised as DeliveryError, leaving
+    retries (with backoff) to the dispatcher
+    """
+    session.mount('http://subscriber/', adapter)
+
+    with pytest.raises(DeliveryError):
+        http_client.post('http://subscriber/hook', data={})
+
+    assert len(adapter.sent) == 1
+    assert session.get_adapter('https://subscriber/').max_retries.total == 0
+
+
+def test_client_is_shared_and_pooled():
+    """
+    Test one pooled client is used per process
+    """
+    client = http_client.get_client()
+
+    assert http_client.get_client() is client
+    adapter = client.get_adapter('http://subscriber/')
+    assert adapter._pool_connections == app.config.get('WEBHOOK_POOL_CONNECTIONS')
+    assert adapter._pool_maxsize == app.config.get('WEBHOOK_POOL_MAXSIZE_PER_HOST')
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    client_ports = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.client_ports.append(self.client_address[1])
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_deliveries_reuse_connections(session):
+    """
+    Test deliveries to the same subscriber reuse one keep-alive connection
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/hook'
+
+    try:
+        for i in range(3):
+            assert http_client.post(url, data={'i': i}) == 204
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(KeepAliveHandler.client_ports) == 3
+    assert len(set(KeepAliveHandler.client_ports)) == 1
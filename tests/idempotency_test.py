@@ -0,0 +1,101 @@
+"""
+Test idempotency keys on appointment writes
+"""
+
+from datetime import datetime, timedelta
+import json
+
+import pytest
+
+from app import db, Appointment, IdempotencyKey
+from app.idempotency import KEY_REUSED_ERROR, REPLAYED_HEADER, idempotency_store
+from app.routes import API_PREFIX
+
+
+@pytest.fixture
+def appointment_body(single_patient, single_provider):
+    return {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_retried_post_is_replayed(client, appointment_body, query_budget):
+    """
+    Test a retry with the same key gets the first response without creating
+    another appointment, and without parsing or validating it again
+    """
+    headers = {'Idempotency-Key': 'retried-post'}
+    result = client.post(f'{API_PREFIX}/appointments', data=appointment_body, headers=headers)
+    assert result.status_code == 201
+    location = result.headers['Location']
+
+    # the response is in this worker's cache now
+    with query_budget(0):
+        retry = client.post(f'{API_PREFIX}/appointments', data=appointment_body, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers['Location'] == location
+    assert retry.headers[REPLAYED_HEADER] == 'true'
+
+    # other workers read it from the table
+    idempotency_store.clear()
+    retry = client.post(f'{API_PREFIX}/appointments', data=appointment_body, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers['Location'] == location
+
+    count = (db.session.query(Appointment)
+                       .filter(Appointment.provider_id == appointment_body['provider_id'])
+                       .count())
+    assert count == 1
+
+    appointment_id = location.split('/')[-1]
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+    db.session.query(IdempotencyKey).filter(IdempotencyKey.key == 'retried-post').delete()
+    db.session.commit()
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_key_reused_for_different_request(client, appointment_body):
+    """
+    Test a key can't be used for two different requests
+    """
+    headers = {'Idempotency-Key': 'reused-key'}
+    result = client.post(f'{API_PREFIX}/appointments', data=appointment_body, headers=headers)
+    assert result.status_code == 201
+
+    other_body = {**appointment_body, 'duration': 30}
+    retry = client.post(f'{API_PREFIX}/appointments', data=other_body, headers=headers)
+    assert retry.status_code == 422
+    assert json.loads(retry.get_data(as_text=True))['error'] == KEY_REUSED_ERROR
+
+    appointment_id = result.headers['Location'].split('/')[-1]
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+    db.session.query(IdempotencyKey).filter(IdempotencyKey.key == 'reused-key').delete()
+    db.session.commit()
+
+
+def test_sweep_deletes_expired_keys():
+    """
+    Test keys older than the time to live are swept
+    """
+    db.session.add_all([
+        IdempotencyKey(key='expired', request_hash='x',
+                       created=datetime.utcnow() - timedelta(seconds=idempotency_store.ttl + 1)),
+        IdempotencyKey(key='fresh', request_hash='x', created=datetime.utcnow()),
+    ])
+    db.session.commit()
+
+    assert idempotency_store.sweep() >= 1
+
+    keys = {key for key, in db.session.query(IdempotencyKey.key)}
+    assert 'expired' not in keys
+    assert 'fresh' in keys
+
+    db.session.query(IdempotencyKey).filter(IdempotencyKey.key == 'fresh').delete()
+    db.session.commit()
@@ -0,0 +1,57 @@
+"""
+Test structured logging
+"""
+
+import json
+import logging
+import queue
+
+from app import app
+from app.log import JsonFormatter, LocalQueueHandler, RequestContextFilter
+
+
+def test_json_formatter_includes_request_and_extra_fields():
+    """
+    Test records are formatted as JSON with the request ID and extra fields
+    """
+    record = logging.makeLogRecord({
+        'name': 'app.test', 'levelname': 'INFO', 'msg': '%s booked', 'args': ('appointment',),
+        'appointment_id': 7,
+    })
+    with app.test_request_context('/v1/appointments', method='POST',
+                                  headers={'X-Request-ID': 'abc'}):
+        app.preprocess_request()
+        RequestContextFilter().filter(record)
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry['message'] == 'appointment booked'
+    assert entry['logger'] == 'app.test'
+    assert entry['request_id'] == 'abc'
+    assert entry['method'] == 'POST'
+    assert entry['appointment_id'] == 7
+
+
+def test_queue_handler_interpolates_message():
+    """
+    Test queued records carry their message, not arguments that can change
+    """
+    log_queue = queue.Queue()
+    arguments = ['before']
+    record = logging.makeLogRecord({'msg': 'value %s', 'args': (arguments,)})
+
+    LocalQueueHandler(log_queue).emit(record)
+    arguments[0] = 'after'
+
+    assert log_queue.get_nowait().getMessage() == "value ['before']"
+
+
+def test_request_id_header(client):
+    """
+    Test responses carry the request ID they were sent, or a new one
+    """
+    result = client.get('/', headers={'X-Request-ID': 'abc'})
+    assert result.headers['X-Request-ID'] == 'abc'
+
+    result = client.get('/')
+    assert len(result.headers['X-Request-ID']) == 32
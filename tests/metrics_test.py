@@ -0,0 +1,64 @@
+"""
+Test request metrics and the sampling profiler
+"""
+
+import time
+
+from app.metrics import Histogram
+from app.profiler import SamplingProfiler
+from app.routes import API_PREFIX
+
+
+def test_histogram_renders_cumulative_buckets():
+    """
+    Test observations are counted in every bucket at or above them
+    """
+    histogram = Histogram('test_seconds', 'Test', ('route',), buckets=(0.1, 1))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.5, '/a')
+    histogram.observe(5, '/a')
+
+    assert histogram.render() == [
+        '# HELP test_seconds Test',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1"} 2',
+        'test_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_seconds_sum{route="/a"} 5.55',
+        'test_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_request_metrics(client):
+    """
+    Test requests report their SQL statements and spans in Server-Timing, and
+    are counted per route in /metrics
+    """
+    result = client.post(f'{API_PREFIX}/patients', data={'first_name': 'a', 'last_name': 'b'})
+    assert result.status_code == 201
+    assert 'sql;dur=' in result.headers['Server-Timing']
+
+    patient_id = result.headers['Location'].split('/')[-1]
+    result = client.delete(f'{API_PREFIX}/patients/{patient_id}')
+    assert result.status_code == 204
+
+    result = client.get('/metrics')
+    assert result.status_code == 200
+    assert (f'http_request_duration_seconds_count{{route="{API_PREFIX}/patients",'
+            f'method="POST",status="201"}}') in result.get_data(as_text=True)
+
+
+def test_profiler_keeps_slowest_requests():
+    """
+    Test only the samples of the slowest requests are kept, slowest first
+    """
+    profiler = SamplingProfiler(interval=0.001, slowest=2)
+    profiler.start()
+    for i, seconds in enumerate([0.03, 0.01, 0.02]):
+        profiler.begin_request()
+        time.sleep(seconds)
+        profiler.end_request(f'GET /{i}', seconds)
+
+    roots = [line.split(';')[0] for line in profiler.folded().splitlines()]
+    assert roots[0] == 'GET /0 30ms'
+    assert set(roots) == {'GET /0 30ms', 'GET /2 20ms'}
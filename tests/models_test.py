@@ -2,7 +2,7 @@
 Test creation of models
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytest
 from sqlalchemy.exc import IntegrityError
@@ -149,3 +149,35 @@ def test_create_webhook():
 
     db.session.delete(w)
     db.session.commit()
+
+
+def test_create_overlapping_appointments_for_provider():
+    """
+    Test the database rejects overlapping appointments for the same provider
+    """
+    # Arrange
+    patient = Patient(first_name="Aly", last_name="Sivji")
+    provider = Provider(first_name="Doctor", last_name="Acula")
+    start = datetime(2018, 4, 5, 10)
+    a = Appointment(start=start, end=start + timedelta(hours=1),
+                    department='foo', patient=patient, provider=provider)
+    db.session.add(a)
+    db.session.commit()
+
+    # Act
+    b = Appointment(start=start + timedelta(minutes=30),
+                    end=start + timedelta(hours=2),
+                    department='foo', patient=patient, provider=provider)
+    db.session.add(b)
+
+    # Assert
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+    db.session.rollback()
+    assert len(Appointment.query.all()) == 1
+
+    db.session.delete(a)
+    db.session.delete(patient)
+    db.session.delete(provider)
+    db.session.commit()
@@ -0,0 +1,133 @@
+"""
+Test appointment archive partitions
+"""
+
+from datetime import datetime
+import json
+
+from app import db, Appointment, appointment_archive
+from app.partitions import (
+    add_months, archive_appointments, archive_partitions, create_partitions, detach_partitions,
+    hot_cutoff, month_start, partition_name)
+from app.routes import API_PREFIX
+
+
+def test_month_helpers():
+    """
+    Test month arithmetic across year boundaries
+    """
+    assert month_start(datetime(2018, 4, 30, 23, 59)) == datetime(2018, 4, 1)
+    assert add_months(datetime(2018, 11, 1), 3) == datetime(2019, 2, 1)
+    assert add_months(datetime(2018, 1, 1), -1) == datetime(2017, 12, 1)
+    assert hot_cutoff(datetime(2018, 4, 4, 10)) == datetime(2018, 1, 1)
+    assert partition_name(datetime(2018, 4, 1)) == 'appointment_archive_y2018m04'
+
+
+def test_archive_appointments(client, single_patient, single_provider):
+    """
+    Test old appointments are moved into monthly partitions and still listed
+    and readable, with their patient and provider too, but can no longer be
+    changed
+    """
+    # Arrange
+    appointment = Appointment(start=datetime(2017, 1, 10, 10), end=datetime(2017, 1, 10, 11),
+                              department='radiology', patient_id=single_patient,
+                              provider_id=single_provider)
+    db.session.add(appointment)
+    db.session.commit()
+    appointment_id = appointment.id
+
+    result = client.get(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 200
+    body = json.loads(result.get_data(as_text=True))['data']
+
+    # Act
+    moved = archive_appointments(cutoff=datetime(2017, 2, 1))
+
+    # Assert
+    assert moved == 1
+    assert datetime(2017, 1, 1) in archive_partitions()
+    db.session.expunge_all()
+    assert Appointment.query.get(appointment_id) is None
+
+    window = 'dt_gte=2017-01-10T10:30:00%2B00:00&dt_lte=2017-01-11T00:00:00%2B00:00'
+    result = client.get(f'{API_PREFIX}/appointments?{window}')
+    assert result.status_code == 200
+    assert [a['id'] for a in json.loads(result.get_data(as_text=True))] == [appointment_id]
+
+    result = client.get(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 200
+    assert json.loads(result.get_data(as_text=True))['data'] == body
+
+    result = client.patch(f'{API_PREFIX}/appointments/{appointment_id}', data={'duration': 30})
+    assert result.status_code == 409
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 409
+
+    for resource, item_id in [('patients', single_patient), ('providers', single_provider)]:
+        result = client.get(f'{API_PREFIX}/{resource}/{item_id}')
+        assert json.loads(result.get_data(as_text=True))['data']['appointments'] == \
+            [appointment_id]
+
+    archived = appointment_archive.delete().where(appointment_archive.c.id == appointment_id)
+    db.session.execute(archived)
+    db.session.commit()
+
+
+def test_archived_appointments_are_not_deleted_in_change_feed(client, single_patient,
+                                                              single_provider):
+    """
+    Test appointments moved into the archive are not tombstoned in the
+    change feed, and changes to them are read from the archive
+    """
+    # Arrange
+    def poll(token=None):
+        query = '' if token is None else f'?since={token}'
+        result = client.get(f'{API_PREFIX}/appointments/changes{query}')
+        assert result.status_code == 200
+        return json.loads(result.get_data(as_text=True))['data']
+
+    feed = poll()
+    while feed['has_more']:
+        feed = poll(feed['token'])
+
+    appointment = Appointment(start=datetime(2017, 1, 10, 10), end=datetime(2017, 1, 10, 11),
+                              department='radiology', patient_id=single_patient,
+                              provider_id=single_provider)
+    db.session.add(appointment)
+    db.session.commit()
+    appointment_id = appointment.id
+
+    # Act
+    moved = archive_appointments(cutoff=datetime(2017, 2, 1))
+    changes = poll(feed['token'])['changes']
+
+    # Assert
+    assert moved == 1
+    assert [(change['id'], change['deleted']) for change in changes] == [(appointment_id, False)]
+    assert changes[0]['appointment']['start'] == '2017-01-10T10:00:00+00:00'
+
+    archived = appointment_archive.delete().where(appointment_archive.c.id == appointment_id)
+    db.session.execute(archived)
+    db.session.commit()
+
+
+def test_detached_partitions_are_not_created_again():
+    """
+    Test months whose partition was detached are skipped, not recreated
+    """
+    # Arrange
+    month = datetime(2010, 1, 1)
+    assert create_partitions(month, month) == [month]
+    assert detach_partitions(add_months(month, 1)) == [partition_name(month)]
+
+    # Act
+    created = create_partitions(month, add_months(month, 1))
+
+    # Assert
+    assert created == [add_months(month, 1)]
+    assert month not in archive_partitions()
+
+    db.session.execute(f'DROP TABLE {partition_name(month)}')
+    db.session.execute(f'DROP TABLE {partition_name(add_months(month, 1))}')
+    db.session.commit()
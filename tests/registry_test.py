@@ -0,0 +1,94 @@
+"""
+Test webhook subscriber registry
+"""
+
+from app import db
+from app.models import Webhook
+from app.registry import webhook_registry
+
+
+def test_active_webhook_ids_are_cached():
+    """
+    Test repeated lookups are served from the cache
+    """
+    # Arrange
+    webhook_registry.invalidate()
+    webhook_registry.active_webhook_ids()
+    hits, misses = webhook_registry.hits, webhook_registry.misses
+
+    # Act
+    webhook_registry.active_webhook_ids()
+
+    # Assert
+    assert webhook_registry.hits == hits + 1
+    assert webhook_registry.misses == misses
+
+
+def test_webhook_changes_invalidate_registry():
+    """
+    Test creating, deactivating and deleting a webhook is seen right away
+    """
+    # Arrange
+    webhook_registry.active_webhook_ids()
+    w = Webhook(
+        name='test',
+        endpoint_url='http://test.com/test',
+        active=True
+    )
+
+    # Act / Assert
+    db.session.add(w)
+    db.session.commit()
+    assert w.id in webhook_registry.active_webhook_ids()
+
+    w.active = False
+    db.session.commit()
+    assert w.id not in webhook_registry.active_webhook_ids()
+
+    w.active = True
+    db.session.commit()
+    webhook_id = w.id
+    db.session.delete(w)
+    db.session.commit()
+    assert webhook_id not in webhook_registry.active_webhook_ids()
+
+
+def test_rolled_back_webhook_changes_keep_registry():
+    """
+    Test changes that are rolled back do not invalidate the registry
+    """
+    # Arrange
+    webhook_registry.active_webhook_ids()
+    invalidations = webhook_registry.invalidations
+
+    # Act
+    db.session.add(Webhook(name='test', endpoint_url='http://test.com/test', active=True))
+    db.session.flush()
+    db.session.rollback()
+
+    # Assert
+    assert webhook_registry.invalidations == invalidations
+
+
+def test_load_racing_an_invalidation_is_not_cached(monkeypatch):
+    """
+    Test webhooks read before an invalidation are not cached after it
+    """
+    # Arrange
+    webhook_registry.invalidate()
+    query = db.session.query
+
+    def query_then_invalidate(*args, **kwargs):
+        webhook_registry.invalidate()
+        return query(*args, **kwargs)
+
+    monkeypatch.setattr(db.session, 'query', query_then_invalidate)
+
+    # Act
+    webhook_registry.active_webhook_ids()
+    monkeypatch.undo()
+    misses = webhook_registry.misses
+    webhook_registry.active_webhook_ids()
+
+    # Assert
+    assert webhook_registry.misses == misses + 1
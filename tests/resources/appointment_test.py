@@ -4,10 +4,16 @@ Testing appointments resource
 
 from datetime import datetime, timedelta
 import json
+import threading
 
 import pytest
 
-from app import app, db, Webhook
+from sqlalchemy import and_
+
+from app import app, db, Appointment, Provider, Webhook, WebhookDelivery
+from app.dispatcher import Dispatcher
+from app.http_client import DeliveryError
+from app.resources.appointment import OVERLAP_ERROR, _matching_appointments
 from app.routes import API_PREFIX
 
 BOOKING_DELAY_IN_HOURS = app.config.get('BOOKING_DELAY_IN_HOURS')
@@ -110,6 +116,38 @@ def test_create_appointment_exceeding_max_duration(client, single_patient, singl
     assert resp_body['error'] == 'Appointment length exceeds maximum allowed'
 
 
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_appointment_duration_must_be_positive(client, single_patient, single_provider):
+    """
+    Create, reschedule and bulk create appointments with durations that are
+    not positive
+    """
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": -30,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 422
+
+    result = client.post(f'{API_PREFIX}/appointments/bulk',
+                         data=json.dumps({'appointments': [{**body, 'duration': 0}]}),
+                         content_type='application/json')
+    assert result.status_code == 422
+
+    result = client.post(f'{API_PREFIX}/appointments', data={**body, 'duration': 60})
+    assert result.status_code == 201
+    url = f"{API_PREFIX}/appointments/{result.headers['Location'].split('/')[-1]}"
+
+    result = client.patch(url, data={"start": body['start'], "duration": -30})
+    assert result.status_code == 422
+
+    result = client.delete(url)
+    assert result.status_code == 204
+
+
 @pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
 def test_create_appointment_that_starts_too_early(client, single_patient, single_provider):
     """
@@ -135,7 +173,7 @@ def test_create_appointment_that_starts_too_early(client, single_patient, single
 
     resp_body = json.loads(result.get_data(as_text=True))
     assert resp_body['error'] == (
-        "New appointment starts before already booked appointment ends.")
+        "New appointment overlaps with already booked appointment.")
 
     result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
     assert result.status_code == 204
@@ -168,7 +206,41 @@ def test_create_appointment_that_ends_too_late(client, single_patient, single_pr
 
     resp_body = json.loads(result.get_data(as_text=True))
     assert resp_body['error'] == (
-        "New appointment ends after already booked appointment starts.")
+        "New appointment overlaps with already booked appointment.")
+
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_create_appointment_that_contains_booked_appointment(client, single_patient,
+                                                             single_provider):
+    """
+    Create appointment that starts before and ends after a booked appointment
+    """
+    # create first apopintment
+    body = {
+        "start": "2018-04-05T11:00:00.000000+00:00",
+        "duration": 30,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+
+    # create second appointment surrounding the first one
+    body['start'] = "2018-04-05T10:00:00.000000+00:00"
+    body['duration'] = 120
+
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 409
+
+    resp_body = json.loads(result.get_data(as_text=True))
+    assert resp_body['error'] == (
+        "New appointment overlaps with already booked appointment.")
 
     result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
     assert result.status_code == 204
@@ -304,9 +376,737 @@ def test_create_appointment_webhook(caplog, client, single_patient, single_provi
     result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
     assert result.status_code == 204
 
+    # notification is queued in the same transaction as the appointment
+    delivery = WebhookDelivery.query.filter(WebhookDelivery.webhook_id == w.id).one()
+    assert delivery.notification_type == 'created'
+    assert delivery.status == WebhookDelivery.PENDING
+
     # check if posting to webhook is successful (200)
-    assert len(caplog.record_tuples) > 0
-    assert caplog.record_tuples[0][2].startswith('200 for')
+    Dispatcher(max_workers=1).drain()
+    deliveries = [message for name, _, message in caplog.record_tuples
+                  if name == 'app.dispatcher']
+    assert len(deliveries) > 0
+    assert deliveries[0].startswith('200 for')
+
+    db.session.refresh(delivery)
+    assert delivery.status == WebhookDelivery.DELIVERED
+    assert delivery.attempts == 1
+
+    db.session.delete(w)
+    db.session.commit()
+
+
+def queue_webhook_deliveries(count, active=True):
+    """
+    Queue count deliveries to a new webhook
+    """
+    w = Webhook(name='test', endpoint_url='http://test.com/test', active=active)
+    db.session.add(w)
+    db.session.flush()
+    deliveries = [WebhookDelivery(webhook_id=w.id, notification_type='created', payload='{}')
+                  for _ in range(count)]
+    db.session.add_all(deliveries)
+    db.session.commit()
+    return w, deliveries
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_failed_webhook_deliveries_back_off_then_die(monkeypatch, freezer):
+    """
+    Failed deliveries, including unexpected errors, are retried with
+    exponential backoff (capped) and dead after max attempts
+    """
+    # Arrange
+    w, (delivery,) = queue_webhook_deliveries(1)
+    errors = [ValueError('bug'), DeliveryError('503'), DeliveryError('503')]
+
+    def deliver(endpoint_url, payload):
+        raise errors.pop(0)
+
+    monkeypatch.setattr('app.dispatcher.deliver', deliver)
+    dispatcher = Dispatcher(max_workers=1)
+    dispatcher.max_attempts = 3
+    dispatcher.backoff = 5
+    dispatcher.max_backoff = 8
+    now = datetime.utcnow()
+
+    # Act / Assert
+    dispatcher.drain()
+    db.session.refresh(delivery)
+    assert delivery.status == WebhookDelivery.PENDING
+    assert delivery.attempts == 1
+    assert 'bug' in delivery.last_error
+    assert delivery.next_attempt_at == now + timedelta(seconds=5)
+
+    freezer.tick(timedelta(seconds=5))
+    dispatcher.drain()
+    db.session.refresh(delivery)
+    assert delivery.attempts == 2
+    assert delivery.next_attempt_at == now + timedelta(seconds=5 + 8)
+
+    freezer.tick(timedelta(seconds=8))
+    dispatcher.drain()
+    db.session.refresh(delivery)
+    assert delivery.attempts == 3
+    assert delivery.status == WebhookDelivery.DEAD
+    assert delivery.last_error == '503'
+
+    freezer.tick(timedelta(hours=1))
+    dispatcher.drain()
+    db.session.refresh(delivery)
+    assert delivery.attempts == 3
 
     db.session.delete(w)
     db.session.commit()
+
+
+def test_webhook_deliveries_respect_concurrency_per_endpoint(monkeypatch):
+    """
+    No more than max_concurrency_per_endpoint deliveries to one endpoint are
+    in flight at once
+    """
+    # Arrange
+    w, deliveries = queue_webhook_deliveries(4)
+    release = threading.Event()
+    lock = threading.Lock()
+    concurrency = {'now': 0, 'max': 0}
+
+    def deliver(endpoint_url, payload):
+        with lock:
+            concurrency['now'] += 1
+            concurrency['max'] = max(concurrency['max'], concurrency['now'])
+        release.wait(5)
+        with lock:
+            concurrency['now'] -= 1
+        return 200
+
+    monkeypatch.setattr('app.dispatcher.deliver', deliver)
+    dispatcher = Dispatcher(max_workers=4, max_concurrency_per_endpoint=2)
+
+    # Act
+    dispatcher.run_once()
+    in_flight, waiting = len(dispatcher.in_flight), len(dispatcher.waiting)
+    release.set()
+    dispatcher.drain()
+
+    # Assert
+    assert (in_flight, waiting) == (2, 2)
+    assert concurrency['max'] == 2
+    for delivery in deliveries:
+        db.session.refresh(delivery)
+        assert delivery.status == WebhookDelivery.DELIVERED
+
+    db.session.delete(w)
+    db.session.commit()
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_slow_webhook_deliveries_do_not_block_requests(
+        monkeypatch, client, single_patient, single_provider):
+    """
+    Requests are answered while slow deliveries are in flight, as webhooks
+    are posted by the dispatcher, outside the request path
+    """
+    # Arrange
+    w, deliveries = queue_webhook_deliveries(4)
+    started, release = threading.Semaphore(0), threading.Event()
+    delivered = []
+
+    def deliver(endpoint_url, payload):
+        started.release()
+        release.wait(10)
+        delivered.append(payload)
+        return 200
+
+    def dispatch():
+        with app.app_context():
+            dispatcher.drain()
+
+    monkeypatch.setattr('app.dispatcher.deliver', deliver)
+    dispatcher = Dispatcher(max_workers=4, max_concurrency_per_endpoint=4)
+    dispatching = threading.Thread(target=dispatch, daemon=True)
+    dispatching.start()
+    for _ in deliveries:
+        assert started.acquire(timeout=5)
+
+    # Act
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    created = client.post(f'{API_PREFIX}/appointments', data=body)
+    url = f"{API_PREFIX}/appointments/{created.headers['Location'].split('/')[-1]}"
+    read = client.get(url)
+    deleted = client.delete(url)
+    delivered_meanwhile = len(delivered)
+    release.set()
+    dispatching.join(10)
+
+    # Assert
+    assert (created.status_code, read.status_code, deleted.status_code) == (201, 200, 204)
+    assert delivered_meanwhile == 0
+    assert not dispatching.is_alive()
+    for delivery in deliveries:
+        db.session.refresh(delivery)
+        assert delivery.status == WebhookDelivery.DELIVERED
+
+    db.session.delete(w)
+    db.session.commit()
+
+
+def test_deliveries_to_inactive_webhooks_are_not_claimed():
+    """
+    Deliveries wait while their webhook is deactivated
+    """
+    # Arrange
+    w, (delivery,) = queue_webhook_deliveries(1, active=False)
+    dispatcher = Dispatcher(max_workers=1)
+
+    # Act / Assert
+    assert delivery.id not in [claimed.id for claimed in dispatcher.claim(10)]
+
+    w.active = True
+    db.session.commit()
+    assert delivery.id in [claimed.id for claimed in dispatcher.claim(10)]
+
+    db.session.delete(w)
+    db.session.commit()
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_bulk_create_appointments(client, single_patient, single_provider):
+    """
+    Create a batch of appointments and get a result for each one
+    """
+    appointment = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    body = {
+        "appointments": [
+            appointment,
+            dict(appointment, start="2018-04-05T11:00:00.000000+00:00"),
+            # overlaps with the first appointment in the batch
+            dict(appointment, start="2018-04-05T10:30:00.000000+00:00"),
+            dict(appointment, patient_id=single_patient + 100),
+            dict(appointment, duration=MAX_APPT_LENGTH_IN_MINUTES + 1),
+        ]
+    }
+    result = client.post(f'{API_PREFIX}/appointments/bulk',
+                         data=json.dumps(body), content_type='application/json')
+    assert result.status_code == 207
+
+    results = json.loads(result.get_data(as_text=True))['data']
+    assert [item['status'] for item in results] == [201, 201, 409, 404, 400]
+    assert results[2]['error'] == (
+        "New appointment overlaps with already booked appointment.")
+    assert results[3]['error'] == 'Patient not found'
+    assert results[4]['error'] == 'Appointment length exceeds maximum allowed'
+
+    appointment_ids = [int(item['location'].split('/')[-1])
+                       for item in results if item['status'] == 201]
+
+    # booked appointments are checked too
+    body = {"appointments": [appointment]}
+    result = client.post(f'{API_PREFIX}/appointments/bulk',
+                         data=json.dumps(body), content_type='application/json')
+    assert result.status_code == 207
+
+    results = json.loads(result.get_data(as_text=True))['data']
+    assert results[0]['status'] == 409
+
+    for appointment_id in appointment_ids:
+        result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+        assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_bulk_create_appointments_racing_another_booking(
+        client, monkeypatch, single_patient, single_provider):
+    """
+    Appointments booked by a concurrent request after the batch was checked
+    only reject the appointments of the batch they overlap
+    """
+    appointment = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=appointment)
+    assert result.status_code == 201
+    booked_url = f"{API_PREFIX}/appointments/{result.headers['Location'].split('/')[-1]}"
+
+    # the booking is not seen by the batch's check, as if it was made while
+    # the batch was being checked
+    monkeypatch.setattr('app.resources.appointment._find_booked_overlaps',
+                        lambda provider_id, candidates: [])
+    body = {
+        "appointments": [
+            dict(appointment, start="2018-04-05T13:00:00.000000+00:00"),
+            dict(appointment, start="2018-04-05T10:30:00.000000+00:00"),
+            dict(appointment, start="2018-04-05T12:00:00.000000+00:00"),
+        ]
+    }
+    result = client.post(f'{API_PREFIX}/appointments/bulk',
+                         data=json.dumps(body), content_type='application/json')
+    assert result.status_code == 207
+
+    results = json.loads(result.get_data(as_text=True))['data']
+    assert [item['status'] for item in results] == [201, 409, 201]
+    assert results[1]['error'] == OVERLAP_ERROR
+    for item, created in zip([results[0], results[2]], body['appointments'][::2]):
+        url = f"{API_PREFIX}/appointments/{item['location'].split('/')[-1]}"
+        result = client.get(url)
+        assert json.loads(result.get_data(as_text=True))['data']['start'] == \
+            created['start'].replace('.000000', '')
+        result = client.delete(url)
+        assert result.status_code == 204
+
+    result = client.delete(booked_url)
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_list_appointments_by_page(client, single_patient, single_provider):
+    """
+    Page through appointments in start time order by following next links
+    """
+    appointment_ids = []
+    for start in ["2018-04-05T12:00:00.000000+00:00",
+                  "2018-04-05T10:00:00.000000+00:00",
+                  "2018-04-05T11:00:00.000000+00:00"]:
+        body = {
+            "start": start,
+            "duration": 60,
+            "provider_id": single_provider,
+            "patient_id": single_patient,
+            "department": "radiology",
+        }
+        result = client.post(f'{API_PREFIX}/appointments', data=body)
+        assert result.status_code == 201
+        appointment_ids.append(int(result.headers['Location'].split('/')[-1]))
+
+    result = client.get(f'{API_PREFIX}/appointments?limit=2')
+    assert result.status_code == 200
+    first_page = json.loads(result.get_data(as_text=True))
+    assert [appt['id'] for appt in first_page] == [appointment_ids[1], appointment_ids[2]]
+
+    next_link = result.headers['Link']
+    next_url = next_link[next_link.index('/v1'):next_link.index('>')]
+    result = client.get(next_url)
+    assert result.status_code == 200
+    second_page = json.loads(result.get_data(as_text=True))
+    assert [appt['id'] for appt in second_page] == [appointment_ids[0]]
+    assert 'Link' not in result.headers
+
+    result = client.get(f'{API_PREFIX}/appointments?cursor=not-a-cursor')
+    assert result.status_code == 400
+
+    for appointment_id in appointment_ids:
+        result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+        assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_list_appointments_with_filters(client, single_patient, single_provider):
+    """
+    Filter appointments by provider, patient and department, and only return
+    the requested fields
+    """
+    other_provider = Provider(first_name='other', last_name='doctor')
+    db.session.add(other_provider)
+    db.session.commit()
+    other_provider_id = other_provider.id
+
+    appointment_ids = []
+    for provider_id, department in [(single_provider, 'radiology'),
+                                    (single_provider, 'oncology'),
+                                    (other_provider_id, 'radiology')]:
+        body = {
+            "start": "2018-04-05T12:00:00.000000+00:00",
+            "duration": 60,
+            "provider_id": provider_id,
+            "patient_id": single_patient,
+            "department": department,
+        }
+        result = client.post(f'{API_PREFIX}/appointments', data=body)
+        assert result.status_code == 201
+        appointment_ids.append(int(result.headers['Location'].split('/')[-1]))
+
+    def listed_ids(query):
+        result = client.get(f'{API_PREFIX}/appointments?{query}')
+        assert result.status_code == 200
+        return sorted(appt['id'] for appt in json.loads(result.get_data(as_text=True)))
+
+    assert listed_ids(f'provider_id={single_provider}') == appointment_ids[:2]
+    assert listed_ids(f'provider_id={single_provider}&provider_id={other_provider_id}') == \
+        appointment_ids
+    assert listed_ids(f'patient_id={single_patient}&department=radiology') == \
+        [appointment_ids[0], appointment_ids[2]]
+    assert listed_ids(
+        f'provider_id={other_provider_id}&department=oncology&dt_gte=2018-04-05T00:00:00') == []
+
+    query = f'provider_id={other_provider_id}&fields=id,start'
+    result = client.get(f'{API_PREFIX}/appointments?{query}')
+    assert json.loads(result.get_data(as_text=True)) == [
+        {'id': appointment_ids[2], 'start': '2018-04-05T12:00:00+00:00'}]
+
+    result = client.get(f'{API_PREFIX}/appointments?fields=id,secret')
+    assert result.status_code == 422
+
+    for appointment_id in appointment_ids:
+        result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+        assert result.status_code == 204
+    db.session.delete(other_provider)
+    db.session.commit()
+
+
+def _explain(query):
+    """
+    Postgres query plan for a Core select, with sequential scans disabled so
+    tiny test tables are planned the way large ones are
+    """
+    compiled = query.compile(dialect=db.engine.dialect)
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute('SET LOCAL enable_seqscan = off')
+    cursor.execute('EXPLAIN ' + str(compiled), compiled.params)
+    return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+@pytest.mark.parametrize('filters,index', [
+    ({}, 'ix_appointment_start_id'),
+    ({'provider_id': [1, 2]}, 'ix_appointment_provider_id_start_end'),
+    ({'patient_id': [1]}, 'ix_appointment_patient_id_start_id'),
+    ({'department': ['radiology', 'oncology']}, 'ix_appointment_department_start_id'),
+    ({'provider_id': [1], 'department': ['radiology']}, None),
+    ({'patient_id': [1], 'department': ['radiology']}, None),
+])
+def test_list_appointments_filters_use_indexes(filters, index):
+    """
+    Common filter combinations over a window are index scans
+    """
+    args = {
+        'dt_gte': datetime(2018, 4, 5),
+        'dt_lte': datetime(2018, 4, 12),
+        **filters,
+    }
+    appointments, where = _matching_appointments(args)
+    query = (appointments.select()
+                         .where(and_(*where))
+                         .order_by(appointments.c.start, appointments.c.id)
+                         .limit(101))
+
+    plan = _explain(query)
+    db.session.rollback()
+
+    assert 'Seq Scan' not in plan
+    assert 'Index' in plan
+    if index is not None:
+        assert index in plan
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_export_appointments(client, single_patient, single_provider):
+    """
+    Export appointments in a window as NDJSON and CSV
+    """
+    appointment_ids = []
+    for start in ["2018-04-05T10:00:00.000000+00:00",
+                  "2018-04-06T10:00:00.000000+00:00"]:
+        body = {
+            "start": start,
+            "duration": 60,
+            "provider_id": single_provider,
+            "patient_id": single_patient,
+            "department": "radiology",
+        }
+        result = client.post(f'{API_PREFIX}/appointments', data=body)
+        assert result.status_code == 201
+        appointment_ids.append(int(result.headers['Location'].split('/')[-1]))
+
+    window = 'dt_gte=2018-04-05T00:00:00%2B00:00&dt_lte=2018-04-05T23:00:00%2B00:00'
+    result = client.get(f'{API_PREFIX}/appointments/export?{window}')
+    assert result.status_code == 200
+    assert result.mimetype == 'application/x-ndjson'
+
+    exported = [json.loads(line)
+                for line in result.get_data(as_text=True).splitlines()]
+    assert [appt['id'] for appt in exported] == [appointment_ids[0]]
+
+    # same representation as the item endpoint
+    result = client.get(f'{API_PREFIX}/appointments/{appointment_ids[0]}')
+    assert exported[0] == json.loads(result.get_data(as_text=True))['data']
+
+    result = client.get(f'{API_PREFIX}/appointments/export?format=csv&{window}')
+    assert result.status_code == 200
+    lines = result.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,start,end,department,patient,provider,created,updated'
+    assert len(lines) == 2
+    assert lines[1].startswith(f'{appointment_ids[0]},2018-04-05T10:00:00+00:00,')
+
+    for appointment_id in appointment_ids:
+        result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+        assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_appointments_query_budget(client, query_budget, single_patient, single_provider):
+    """
+    Appointment endpoints stay within a fixed number of queries
+    """
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    # patient and provider + insert + active webhooks and provider schedule (if not cached)
+    with query_budget(4):
+        result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+
+    with query_budget(1):
+        result = client.get(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 200
+
+    with query_budget(1):
+        result = client.get(f'{API_PREFIX}/appointments')
+    assert result.status_code == 200
+
+    # appointment + update + active webhooks (if not cached)
+    with query_budget(3):
+        result = client.patch(f'{API_PREFIX}/appointments/{appointment_id}',
+                              data={"start": "2018-04-05T12:00:00.000000+00:00"})
+    assert result.status_code == 200
+
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_get_appointment_from_cache(client, query_budget, single_patient, single_provider):
+    """
+    Unchanged appointments are served from the cache and revalidated with
+    their ETag; changes to the appointment are seen right away
+    """
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+
+    result = client.get(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 200
+    etag = result.headers['ETag']
+
+    with query_budget(0):
+        result = client.get(f'{API_PREFIX}/appointments/{appointment_id}')
+        assert result.status_code == 200
+        assert result.headers['ETag'] == etag
+
+        result = client.get(f'{API_PREFIX}/appointments/{appointment_id}',
+                            headers={'If-None-Match': etag})
+        assert result.status_code == 304
+        assert result.get_data() == b''
+
+    # patient's appointments are cached with the patient
+    result = client.get(f'{API_PREFIX}/patients/{single_patient}')
+    assert json.loads(result.get_data(as_text=True))['data']['appointments'] == [appointment_id]
+
+    result = client.patch(f'{API_PREFIX}/appointments/{appointment_id}',
+                          data={"start": "2018-04-05T12:00:00.000000+00:00"})
+    assert result.status_code == 200
+
+    result = client.get(f'{API_PREFIX}/appointments/{appointment_id}',
+                        headers={'If-None-Match': etag})
+    assert result.status_code == 200
+    assert result.headers['ETag'] != etag
+    resp_body = json.loads(result.get_data(as_text=True))['data']
+    assert resp_body['start'] == '2018-04-05T12:00:00+00:00'
+
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+
+    result = client.get(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 404
+
+    result = client.get(f'{API_PREFIX}/patients/{single_patient}')
+    assert json.loads(result.get_data(as_text=True))['data']['appointments'] == []
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_patch_appointment_if_match(client, single_patient, single_provider):
+    """
+    Test appointments are only changed while they have the ETag in If-Match
+    """
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+    url = f'{API_PREFIX}/appointments/{appointment_id}'
+
+    etag = client.get(url).headers['ETag']
+
+    result = client.patch(url, data={"start": "2018-04-05T11:00:00.000000+00:00"},
+                          headers={'If-Match': '"not-the-etag"'})
+    assert result.status_code == 412
+
+    result = client.patch(url, data={"start": "2018-04-05T12:00:00.000000+00:00"},
+                          headers={'If-Match': etag})
+    assert result.status_code == 200
+    new_etag = result.headers['ETag']
+    assert new_etag != etag
+    assert client.get(url).headers['ETag'] == new_etag
+
+    # the appointment changed since etag was read
+    result = client.patch(url, data={"start": "2018-04-05T13:00:00.000000+00:00"},
+                          headers={'If-Match': etag})
+    assert result.status_code == 412
+    result = client.delete(url, headers={'If-Match': etag})
+    assert result.status_code == 412
+
+    resp_body = json.loads(client.get(url).get_data(as_text=True))['data']
+    assert resp_body['start'] == '2018-04-05T12:00:00+00:00'
+
+    result = client.delete(url, headers={'If-Match': new_etag})
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_concurrent_patches_are_not_lost(client, single_patient, single_provider):
+    """
+    Test concurrent reschedules of one appointment: of the writers that read
+    the same ETag exactly one wins, and every reschedule that got a 200 was
+    applied, none silently overwritten
+    """
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+    url = f'{API_PREFIX}/appointments/{appointment_id}'
+    num_writers = 8
+
+    def patch_concurrently(headers):
+        barrier = threading.Barrier(num_writers)
+        statuses = [None] * num_writers
+
+        def write(i):
+            writer = app.test_client()
+            barrier.wait()
+            result = writer.patch(url, data={"start": f"2018-04-05T11:{i:02d}:00.000000+00:00"},
+                                  headers=headers)
+            statuses[i] = result.status_code
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(num_writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def current_version():
+        db.session.rollback()
+        return (db.session.query(Appointment.version)
+                          .filter(Appointment.id == appointment_id)
+                          .scalar())
+
+    # writers that read the same state
+    statuses = patch_concurrently({'If-Match': client.get(url).headers['ETag']})
+    assert sorted(statuses) == [200] + [412] * (num_writers - 1)
+    assert current_version() == 2
+
+    # blind writers: each either applies its reschedule or gets a 412
+    statuses = patch_concurrently({})
+    assert set(statuses) <= {200, 412}
+    assert current_version() == 2 + statuses.count(200)
+
+    result = client.delete(url)
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_appointment_changes(client, query_budget, single_patient, single_provider):
+    """
+    Test polling the change feed returns appointments changed since the
+    token, once each, and tombstones for deleted ones
+    """
+    def poll(token=None):
+        query = '' if token is None else f'?since={token}'
+        result = client.get(f'{API_PREFIX}/appointments/changes{query}')
+        assert result.status_code == 200
+        return json.loads(result.get_data(as_text=True))['data']
+
+    # catch up with changes made by other tests
+    feed = poll()
+    while feed['has_more']:
+        feed = poll(feed['token'])
+    token = feed['token']
+
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    kept_id = int(result.headers['Location'].split('/')[-1])
+    kept_url = f'{API_PREFIX}/appointments/{kept_id}'
+
+    result = client.post(f'{API_PREFIX}/appointments',
+                         data={**body, "start": "2018-04-05T12:00:00.000000+00:00"})
+    assert result.status_code == 201
+    deleted_id = int(result.headers['Location'].split('/')[-1])
+    deleted_url = f'{API_PREFIX}/appointments/{deleted_id}'
+
+    result = client.patch(kept_url, data={"start": "2018-04-05T11:00:00.000000+00:00"})
+    assert result.status_code == 200
+    result = client.delete(deleted_url)
+    assert result.status_code == 204
+
+    feed = poll(token)
+    assert not feed['has_more']
+    changes = {change['id']: change for change in feed['changes']}
+    assert len(feed['changes']) == len(changes) == 2
+    assert changes[kept_id]['deleted'] is False
+    assert changes[kept_id]['appointment']['start'] == '2018-04-05T11:00:00+00:00'
+    assert changes[deleted_id] == {'id': deleted_id, 'deleted': True, 'appointment': None}
+
+    # nothing changed since
+    with query_budget(1):
+        assert poll(feed['token']) == {**feed, 'changes': []}
+
+    result = client.get(f'{API_PREFIX}/appointments/changes?since=not-a-token')
+    assert result.status_code == 400
+
+    result = client.delete(kept_url)
+    assert result.status_code == 204
@@ -0,0 +1,51 @@
+"""
+Testing availability resources
+"""
+
+import json
+
+import pytest
+
+from app.routes import API_PREFIX
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_provider_availability(client, single_patient, single_provider):
+    """
+    Free slots skip booked appointments and the booking delay
+    """
+    body = {
+        "start": "2018-04-05T12:00:00.000000+00:00",
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+
+    # window starts before the booking delay is over (2018-04-05T10:00)
+    window = 'from=2018-04-05T08:00:00%2B00:00&to=2018-04-05T17:00:00%2B00:00'
+    result = client.get(
+        f'{API_PREFIX}/providers/{single_provider}/availability?{window}&duration=30')
+    assert result.status_code == 200
+
+    resp_body = json.loads(result.get_data(as_text=True))['data']
+    assert resp_body['provider'] == single_provider
+    assert resp_body['slots'] == [
+        {'start': '2018-04-05T10:00:00+00:00', 'end': '2018-04-05T12:00:00+00:00'},
+        {'start': '2018-04-05T13:00:00+00:00', 'end': '2018-04-05T17:00:00+00:00'},
+    ]
+
+    result = client.get(
+        f'{API_PREFIX}/availability?provider_id={single_provider}&{window}&duration=30')
+    assert result.status_code == 200
+    assert json.loads(result.get_data(as_text=True))['data'] == [resp_body]
+
+    result = client.get(
+        f'{API_PREFIX}/providers/{single_provider + 100}/availability?{window}&duration=30')
+    assert result.status_code == 404
+
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
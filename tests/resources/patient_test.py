@@ -0,0 +1,79 @@
+"""
+Testing patients resource
+"""
+
+from datetime import datetime
+import json
+
+from app import db
+from app.models import Appointment, Patient
+from app.routes import API_PREFIX
+
+
+def test_list_patients_by_page(client):
+    """
+    Page through patients in id order by following next links
+    """
+    patient_ids = []
+    for first_name in ['foo', 'baz', 'qux']:
+        body = {
+            'first_name': first_name,
+            'last_name': 'bar'
+        }
+        result = client.post(f'{API_PREFIX}/patients', data=body)
+        assert result.status_code == 201
+        patient_ids.append(int(result.headers['Location'].split('/')[-1]))
+
+    seen_ids = []
+    url = f'{API_PREFIX}/patients?limit=2'
+    while url:
+        result = client.get(url)
+        assert result.status_code == 200
+        page = json.loads(result.get_data(as_text=True))
+        assert len(page) <= 2
+        seen_ids.extend(patient['id'] for patient in page)
+
+        next_link = result.headers.get('Link')
+        url = next_link[next_link.index('/v1'):next_link.index('>')] if next_link else None
+
+    assert seen_ids == sorted(seen_ids)
+    assert set(patient_ids) <= set(seen_ids)
+
+    result = client.get(f'{API_PREFIX}/patients?limit=100000')
+    assert result.status_code == 422
+
+    for patient_id in patient_ids:
+        result = client.delete(f'{API_PREFIX}/patients/{patient_id}')
+        assert result.status_code == 204
+
+
+def test_patients_query_budget(client, query_budget, single_provider):
+    """
+    Listing patients does not load each patient's appointments separately
+    """
+    patients = [Patient(first_name='foo', last_name=str(i)) for i in range(5)]
+    appointments = [
+        Appointment(start=datetime(2018, 4, 5, 10 + i), end=datetime(2018, 4, 5, 11 + i),
+                    department='radiology', patient=patient, provider_id=single_provider)
+        for i, patient in enumerate(patients)]
+    db.session.add_all(appointments)
+    db.session.commit()
+    patient_ids = [patient.id for patient in patients]
+
+    # page of patients + their appointment ids
+    with query_budget(2):
+        result = client.get(f'{API_PREFIX}/patients?limit=1000')
+    assert result.status_code == 200
+    listed = {patient['id']: patient for patient in json.loads(result.get_data(as_text=True))}
+    for patient_id, appointment in zip(patient_ids, appointments):
+        assert listed[patient_id]['appointments'] == [appointment.id]
+
+    with query_budget(2):
+        result = client.get(f'{API_PREFIX}/patients/{patient_ids[0]}')
+    assert result.status_code == 200
+
+    for appointment in appointments:
+        db.session.delete(appointment)
+    for patient in patients:
+        db.session.delete(patient)
+    db.session.commit()
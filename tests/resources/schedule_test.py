@@ -0,0 +1,228 @@
+"""
+Testing schedule resources and office hours
+"""
+
+import json
+
+import pytest
+
+from app.routes import API_PREFIX
+
+
+@pytest.fixture
+def office_hours_schedule(client, single_provider):
+    """
+    Provider works 09:00-17:00 UTC on Thursdays
+    """
+    body = {'weekday': 3, 'start_time': '09:00:00', 'end_time': '17:00:00'}
+    result = client.post(f'{API_PREFIX}/providers/{single_provider}/schedules', data=body)
+    assert result.status_code == 201
+    location = result.headers['Location']
+    schedule_id = int(location.split('/')[-1])
+    yield schedule_id
+
+    result = client.delete(f'{API_PREFIX}/providers/{single_provider}/schedules/{schedule_id}')
+    assert result.status_code == 204
+
+
+def test_create_schedule(client, single_provider, office_hours_schedule):
+    """
+    Schedules can be read back for the provider
+    """
+    result = client.get(f'{API_PREFIX}/providers/{single_provider}/schedules')
+    assert result.status_code == 200
+    resp_body = json.loads(result.get_data(as_text=True))
+    assert len(resp_body) == 1
+    assert resp_body[0]['id'] == office_hours_schedule
+    assert resp_body[0]['weekday'] == 3
+    assert resp_body[0]['start_time'] == '09:00:00'
+    assert resp_body[0]['end_time'] == '17:00:00'
+
+    body = {'weekday': 3, 'start_time': '17:00:00', 'end_time': '09:00:00'}
+    result = client.post(f'{API_PREFIX}/providers/{single_provider}/schedules', data=body)
+    assert result.status_code == 400
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_update_schedule(client, single_patient, single_provider, office_hours_schedule):
+    """
+    Changed office hours apply to new bookings right away
+    """
+    url = f'{API_PREFIX}/providers/{single_provider}/schedules/{office_hours_schedule}'
+    result = client.patch(url, data={'end_time': '08:00:00'})
+    assert result.status_code == 400
+
+    result = client.patch(url, data={'start_time': '12:00:00'})
+    assert result.status_code == 200
+    resp_body = json.loads(result.get_data(as_text=True))['data']
+    assert resp_body['start_time'] == '12:00:00'
+    assert resp_body['end_time'] == '17:00:00'
+
+    body = {
+        "start": "2018-04-05T10:00:00.000000+00:00",  # Thursday
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 409
+
+    result = client.patch(f'{API_PREFIX}/providers/{single_provider + 100}/schedules/'
+                          f'{office_hours_schedule}', data={'weekday': 4})
+    assert result.status_code == 404
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_appointment_outside_office_hours(
+        client, single_patient, single_provider, office_hours_schedule):
+    """
+    Appointments can only be booked while the provider is working
+    """
+    body = {
+        "start": "2018-04-05T16:30:00.000000+00:00",  # Thursday
+        "duration": 60,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 409
+    assert json.loads(result.get_data(as_text=True))['error'] == 'Office closed'
+
+    body['start'] = "2018-04-06T12:00:00.000000+00:00"  # Friday
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 409
+
+    body['start'] = "2018-04-05T16:00:00.000000+00:00"
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+
+    result = client.patch(f'{API_PREFIX}/appointments/{appointment_id}',
+                          data={"start": "2018-04-05T08:00:00.000000+00:00"})
+    assert result.status_code == 409
+
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_schedule_exception(client, single_patient, single_provider, office_hours_schedule):
+    """
+    Time off closes the office and availability only has open hours
+    """
+    body = {
+        'provider_id': single_provider,
+        'date': '2018-04-05',
+        'start_time': '12:00:00',
+        'end_time': '13:00:00',
+    }
+    result = client.post(f'{API_PREFIX}/schedule_exceptions', data=body)
+    assert result.status_code == 201
+    exception_id = int(result.headers['Location'].split('/')[-1])
+
+    body = {
+        "start": "2018-04-05T12:30:00.000000+00:00",
+        "duration": 15,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 409
+
+    window = 'from=2018-04-05T00:00:00%2B00:00&to=2018-04-07T00:00:00%2B00:00'
+    result = client.get(
+        f'{API_PREFIX}/providers/{single_provider}/availability?{window}&duration=30')
+    assert result.status_code == 200
+    assert json.loads(result.get_data(as_text=True))['data']['slots'] == [
+        {'start': '2018-04-05T10:00:00+00:00', 'end': '2018-04-05T12:00:00+00:00'},
+        {'start': '2018-04-05T13:00:00+00:00', 'end': '2018-04-05T17:00:00+00:00'},
+    ]
+
+    result = client.delete(f'{API_PREFIX}/schedule_exceptions/{exception_id}')
+    assert result.status_code == 204
+
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 201
+    appointment_id = int(result.headers['Location'].split('/')[-1])
+
+    result = client.delete(f'{API_PREFIX}/appointments/{appointment_id}')
+    assert result.status_code == 204
+
+
+@pytest.mark.freeze_time('2018-04-04T10:00:00.000000+00:00')
+def test_clinic_holiday_wins_over_extra_hours(
+        client, single_patient, single_provider, office_hours_schedule):
+    """
+    A provider's extra hours do not re-open a clinic-wide holiday
+    """
+    result = client.post(f'{API_PREFIX}/schedule_exceptions', data={'date': '2018-04-05'})
+    assert result.status_code == 201
+    holiday_id = int(result.headers['Location'].split('/')[-1])
+
+    body = {
+        'provider_id': single_provider,
+        'date': '2018-04-05',
+        'start_time': '17:00:00',
+        'end_time': '19:00:00',
+        'is_open': True,
+    }
+    result = client.post(f'{API_PREFIX}/schedule_exceptions', data=body)
+    assert result.status_code == 201
+    extra_hours_id = int(result.headers['Location'].split('/')[-1])
+
+    body = {
+        "start": "2018-04-05T17:30:00.000000+00:00",
+        "duration": 15,
+        "provider_id": single_provider,
+        "patient_id": single_patient,
+        "department": "radiology",
+    }
+    result = client.post(f'{API_PREFIX}/appointments', data=body)
+    assert result.status_code == 409
+
+    window = 'from=2018-04-05T00:00:00%2B00:00&to=2018-04-06T00:00:00%2B00:00'
+    result = client.get(
+        f'{API_PREFIX}/providers/{single_provider}/availability?{window}&duration=30')
+    assert result.status_code == 200
+    assert json.loads(result.get_data(as_text=True))['data']['slots'] == []
+
+    for exception_id in (holiday_id, extra_hours_id):
+        result = client.delete(f'{API_PREFIX}/schedule_exceptions/{exception_id}')
+        assert result.status_code == 204
+
+
+def test_update_schedule_exception(client, single_provider):
+    """
+    Exceptions can be moved and turned into whole day ones
+    """
+    body = {
+        'provider_id': single_provider,
+        'date': '2018-04-05',
+        'start_time': '12:00:00',
+        'end_time': '13:00:00',
+    }
+    result = client.post(f'{API_PREFIX}/schedule_exceptions', data=body)
+    assert result.status_code == 201
+    exception_id = int(result.headers['Location'].split('/')[-1])
+    url = f'{API_PREFIX}/schedule_exceptions/{exception_id}'
+
+    result = client.patch(url, data={'end_time': '11:00:00'})
+    assert result.status_code == 400
+
+    result = client.patch(url, data=json.dumps({'start_time': None}),
+                          content_type='application/json')
+    assert result.status_code == 400
+
+    result = client.patch(url, data=json.dumps({'date': '2018-04-06', 'start_time': None,
+                                                'end_time': None, 'is_open': True}),
+                          content_type='application/json')
+    assert result.status_code == 200
+    assert json.loads(result.get_data(as_text=True))['data'] == {
+        **json.loads(client.get(url).get_data(as_text=True))['data'],
+        'date': '2018-04-06', 'start_time': None, 'end_time': None, 'is_open': True}
+
+    result = client.delete(url)
+    assert result.status_code == 204
@@ -0,0 +1,69 @@
+"""
+Test office hours bit masks
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from app.schedules import (
+    ALL_DAY, SLOTS_PER_DAY, OfficeHours, interval_mask, runs, slot_ceil, slot_floor, time_mask)
+
+
+def test_slot_rounding():
+    """
+    Test offsets round outwards to whole slots
+    """
+    assert slot_floor(timedelta(minutes=9)) == 1
+    assert slot_ceil(timedelta(minutes=9)) == 2
+    assert slot_floor(timedelta(minutes=10)) == slot_ceil(timedelta(minutes=10)) == 2
+
+
+def test_interval_mask_is_clipped_to_the_day():
+    """
+    Test masks only set bits for slots in the day
+    """
+    assert interval_mask(2, 5) == 0b11100
+    assert interval_mask(-3, 2) == 0b11
+    assert interval_mask(SLOTS_PER_DAY - 1, SLOTS_PER_DAY + 10) == 1 << (SLOTS_PER_DAY - 1)
+    assert interval_mask(5, 5) == 0
+
+
+def test_time_mask():
+    """
+    Test office hours are converted to slots, missing times are all day
+    """
+    assert time_mask(time(9), time(17)) == interval_mask(9 * 12, 17 * 12)
+    assert time_mask(None, None) == ALL_DAY
+
+
+def test_runs():
+    """
+    Test masks are split into runs of consecutive slots
+    """
+    assert runs(0) == []
+    assert runs(ALL_DAY) == [(0, SLOTS_PER_DAY)]
+
+    mask = interval_mask(0, 3) | interval_mask(10, 12) | interval_mask(100, 101)
+    assert runs(mask) == [(0, 3), (10, 12), (100, 101)]
+
+
+def test_providers_without_schedule(single_provider):
+    """
+    Test providers without a schedule are open all day or closed, as
+    configured, and empty ranges don't need office hours
+    """
+    closed = OfficeHours(ttl=60, open_without_schedule=False)
+    start = datetime(2018, 4, 5, 10)
+    assert closed.limits(single_provider)
+    assert closed.day_masks(single_provider, date(2018, 4, 5), date(2018, 4, 5)) == {
+        date(2018, 4, 5): 0}
+    assert not closed.is_open(single_provider, start, start + timedelta(hours=1))
+    assert closed.free_slots(single_provider, [], start, start + timedelta(hours=1),
+                             timedelta(minutes=15)) == []
+
+    opened = OfficeHours(ttl=60, open_without_schedule=True)
+    assert not opened.limits(single_provider)
+    assert opened.is_open(single_provider, start, start + timedelta(hours=1))
+
+    midnight = datetime(2018, 4, 5)
+    assert closed.is_open(single_provider, midnight, midnight)
+    assert closed.free_slots(single_provider, [], midnight, midnight, timedelta(minutes=15)) == []
@@ -0,0 +1,43 @@
+"""
+Test compiled serializers match the marshmallow schemas
+"""
+
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Appointment, Patient, Provider
+from app.schemas import AppointmentSchema, PatientSchema, ProviderSchema
+from app.serializers import appointment_serializer, dump_patients, dump_providers
+
+
+def test_serializers_match_schemas():
+    """
+    Test serializers produce the same output as the ModelSchemas
+    """
+    # Arrange
+    patient = Patient(first_name="Aly", last_name="Sivji")
+    provider = Provider(first_name="Doctor", last_name="Acula")
+    start = datetime(2018, 4, 5, 10, 0, 0, 123456)
+    a = Appointment(start=start, end=start + timedelta(hours=1), department='foo',
+                    patient=patient, provider=provider)
+    db.session.add(a)
+    db.session.commit()
+
+    # Act
+    appointment_row = db.session.execute(
+        Appointment.__table__.select().where(Appointment.id == a.id)).first()
+    patient_row = db.session.execute(
+        Patient.__table__.select().where(Patient.id == patient.id)).first()
+    provider_row = db.session.execute(
+        Provider.__table__.select().where(Provider.id == provider.id)).first()
+
+    # Assert
+    assert appointment_serializer.dump(appointment_row) == AppointmentSchema().dump(a).data
+    assert appointment_serializer.dump(a) == AppointmentSchema().dump(a).data
+    assert dump_patients([patient_row]) == [PatientSchema().dump(patient).data]
+    assert dump_providers([provider_row]) == [ProviderSchema().dump(provider).data]
+
+    db.session.delete(a)
+    db.session.delete(patient)
+    db.session.delete(provider)
+    db.session.commit()
@@ -0,0 +1,74 @@
+"""
+Test primary key lookups
+"""
+
+import pytest
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from app.models import Patient, Provider
+from app.utils import getitem_or_404, getitems_or_404
+
+
+def test_getitems_or_404_in_one_query(query_budget, single_patient, single_provider):
+    """
+    Test a patient and a provider are looked up with a single query
+    """
+    db.session.remove()
+
+    with query_budget(1):
+        patient, provider = getitems_or_404(
+            [(Patient, single_patient, 'Patient not found'),
+             (Provider, single_provider, 'Provider not found')])
+    assert isinstance(patient, Patient) and patient.id == single_patient
+    assert isinstance(provider, Provider) and provider.id == single_provider
+
+    # both are in the identity map now
+    with query_budget(0):
+        assert getitem_or_404(Patient, single_patient) is patient
+        assert getitems_or_404([(Provider, single_provider, None)]) == [provider]
+
+    db.session.remove()
+
+
+def test_getitems_or_404_with_columns(query_budget, single_patient, single_provider):
+    """
+    Test only the requested columns are loaded, as rows
+    """
+    with query_budget(1):
+        patient, provider = getitems_or_404(
+            [(Patient, single_patient, None), (Provider, single_provider, None)],
+            columns={Patient: ['id', 'first_name'], Provider: ['id']})
+
+    assert patient.id == single_patient
+    assert patient.first_name == 'foo'
+    assert provider.id == single_provider
+    assert not hasattr(provider, 'first_name')
+
+
+def test_getitems_or_404_missing(single_patient, single_provider):
+    """
+    Test the first missing item is a 404 with its error
+    """
+    with pytest.raises(HTTPException) as e:
+        getitems_or_404([(Patient, single_patient, 'Patient not found'),
+                         (Provider, single_provider + 100, 'Provider not found')],
+                        columns={Patient: ['id'], Provider: ['id']})
+
+    assert e.value.response.status_code == 404
+    assert b'Provider not found' in e.value.response.get_data()
+
+
+def test_getitems_or_404_missing_with_single_column(single_patient):
+    """
+    Test a missing item is a 404 when only its primary key is loaded
+    """
+    with pytest.raises(HTTPException) as e:
+        getitems_or_404([(Patient, single_patient + 100, 'Patient not found')],
+                        columns={Patient: ['id']})
+
+    assert e.value.response.status_code == 404
+    assert b'Patient not found' in e.value.response.get_data()
+
+    patient, = getitems_or_404([(Patient, single_patient, None)], columns={Patient: ['id']})
+    assert patient.id == single_patient